@@ -1,13 +1,37 @@
+import asyncio
+import threading
+from concurrent.futures import ThreadPoolExecutor
 from re import S
+from typing import AsyncIterator, Iterator, Optional
 from Agent.bot import Bot
 from bridge.context import ContextType, Context
 from bridge.reply import Reply, ReplyType
 from utils.logger import get_logger
 from config import config
-from cozepy import Coze, TokenAuth, MessageContentType, MessageType
-from Agent.CozeAgent.user_session import UserSessionManager
+from cozepy import (Coze, TokenAuth, AsyncCoze, AsyncTokenAuth, ChatEvent, ChatEventType, Message,
+                    MessageContentType, MessageRole, MessageType)
+from Agent.CozeAgent.user_session import get_session_manager
 from Agent.CozeAgent.conversation_manager import ConversationManager
+
+
+# 拿到回复后继续读完流式响应剩余事件的线程池（同步调用路径使用）
+_drain_executor: Optional[ThreadPoolExecutor] = None
+_drain_executor_lock = threading.Lock()
+
+
+def _drain_in_background(events: Iterator[ChatEvent]):
+    """在后台读完剩余的流式事件，让对话正常结束并保存历史，连接正常释放"""
+    global _drain_executor
+    with _drain_executor_lock:
+        if _drain_executor is None:
+            _drain_executor = ThreadPoolExecutor(max_workers=4, thread_name_prefix="coze_drain")
+    _drain_executor.submit(lambda: sum(1 for _ in events))
+
+
 class CozeBot(Bot):
+    supports_async = True
+    stateful = True
+
     def __init__(self):
         super().__init__()
         self.logger = get_logger("CozeBot")
@@ -19,11 +43,13 @@ class CozeBot(Bot):
             base_url=config.get("coze_api_base")
         )
         # 初始化会话管理组件
-        self.session_manager = UserSessionManager()
+        self.session_manager = get_session_manager()
         self.conv_manager = ConversationManager(
             coze_client=self.coze_client,
             session_manager=self.session_manager
         )
+        # 异步调用路径在后台读完剩余流式事件的任务
+        self._drain_tasks = set()
 
     def reply(self, context: Context) -> Reply:
         try:
@@ -48,36 +74,135 @@ class CozeBot(Bot):
             self.logger.error(f"处理消息异常: {str(e)}", exc_info=True)
             return Reply(ReplyType.TEXT, "消息处理失败")
 
+    @staticmethod
+    def _build_query_message(query: str) -> Message:
+        """把预处理后的消息内容构造成对话的用户消息（随chat请求一起提交，不单独创建）"""
+        return Message(
+            role=MessageRole.USER,
+            type=MessageType.QUESTION,
+            content=query,
+            content_type=MessageContentType.OBJECT_STRING
+        )
+
+    @staticmethod
+    def _completed_answer(event: ChatEvent) -> Optional[str]:
+        """事件是已完成的文本ANSWER消息时返回其内容"""
+        if (event.event == ChatEventType.CONVERSATION_MESSAGE_COMPLETED and event.message is not None
+                and event.message.type == MessageType.ANSWER
+                and event.message.content_type == MessageContentType.TEXT):
+            return event.message.content
+        return None
+
+    @staticmethod
+    def _chat_error(event: ChatEvent) -> Optional[str]:
+        """事件表示对话失败时返回错误信息"""
+        if event.event == ChatEventType.CONVERSATION_CHAT_FAILED:
+            return str(event.chat.last_error if event.chat else "unknown")
+        return None
+
     def _create_message_and_get_reply(self, conversation_id, query, context):
-        """创建消息并获取回复"""
+        """以流式对话提交消息，第一条ANSWER消息完成后立即返回"""
         try:
-            message = self.coze_client.conversations.messages.create(
-                conversation_id=conversation_id,
-                content=query,
-                role="user",
-                content_type="object_string"
-            )
-            self.logger.debug(f"消息已创建: {message.id}")
-
             # 获取用户ID
             user_id = context.kwargs.get("from_uid")
 
-            chat = self.coze_client.chat.create_and_poll(
+            events = iter(self.coze_client.chat.stream(
                 conversation_id=conversation_id,
                 bot_id=self.bot_id,
                 user_id=user_id,
-                additional_messages=[message],
+                additional_messages=[self._build_query_message(query)],
                 auto_save_history=True
-            )
+            ))
 
-
-            for messages in chat.messages:
-                if messages.type.value == MessageType.ANSWER:
-                    if messages.content_type.value == MessageContentType.TEXT:
-                        text_reply = Reply(ReplyType.TEXT, messages.content)
-
-                        return text_reply                    
+            for event in events:
+                answer = self._completed_answer(event)
+                if answer is not None:
+                    self.session_manager.record_turn(
+                        f"{context.kwargs.get('shop_id')}_{user_id}", conversation_id)
+                    _drain_in_background(events)
+                    return Reply(ReplyType.TEXT, answer)
+                error = self._chat_error(event)
+                if error is not None:
+                    self.logger.error(f"Coze对话失败: {error}")
+                    break
             return Reply(ReplyType.TEXT, "未能获取到回复")
         except Exception as e:
             self.logger.error(f"消息处理失败: {str(e)}")
-            return Reply(ReplyType.TEXT, "请求处理超时")
\ No newline at end of file
+            return Reply(ReplyType.TEXT, "请求处理超时")
+
+    async def areply(self, context: Context) -> Reply:
+        """异步获取回复（使用AsyncCoze，不占用线程）"""
+        try:
+            chunks = [chunk async for chunk in self.astream(context)]
+            if not chunks:
+                return Reply(ReplyType.TEXT, "未能获取到回复")
+            return Reply(ReplyType.TEXT, "".join(chunks))
+        except Exception as e:
+            self.logger.error(f"处理消息异常: {str(e)}", exc_info=True)
+            return Reply(ReplyType.TEXT, "消息处理失败")
+
+    async def astream(self, context: Context) -> AsyncIterator[str]:
+        """流式获取回复，逐段产出第一条ANSWER消息的增量文本，该消息完成后即结束"""
+        from_id = context.kwargs.get("from_uid")
+        shop_id = context.kwargs.get("shop_id")
+        user_id = f"{shop_id}_{from_id}"
+        query = context.content
+
+        # 缓存未命中时在线程中查询数据库，不阻塞事件循环
+        conversation_id = await self.session_manager.aget_session(user_id)
+        if not conversation_id:
+            # 新用户才会创建会话，同步接口放到线程中执行
+            conversation_id = await asyncio.to_thread(self.conv_manager.create_conversation, user_id)
+            if not conversation_id:
+                yield "会话创建失败"
+                return
+
+        client = self._get_loop_client(self._create_async_client)
+        events = client.chat.stream(
+            conversation_id=conversation_id,
+            bot_id=self.bot_id,
+            user_id=from_id,
+            additional_messages=[self._build_query_message(query)],
+            auto_save_history=True
+        )
+
+        streamed = False
+        async for event in events:
+            if event.event == ChatEventType.CONVERSATION_MESSAGE_DELTA:
+                if (event.message.type == MessageType.ANSWER
+                        and event.message.content_type == MessageContentType.TEXT and event.message.content):
+                    streamed = True
+                    yield event.message.content
+                continue
+
+            answer = self._completed_answer(event)
+            if answer is not None:
+                # 第一条ANSWER完成即结束，剩余事件（推荐问题、对话完成等）在后台读完
+                self.session_manager.record_turn(user_id, conversation_id)
+                if not streamed and answer:
+                    yield answer
+                self._drain_async(events)
+                return
+
+            error = self._chat_error(event)
+            if error is not None:
+                raise RuntimeError(f"Coze对话失败: {error}")
+
+    def _drain_async(self, events: AsyncIterator[ChatEvent]):
+        """在后台任务中读完剩余的流式事件"""
+        async def drain():
+            try:
+                async for _ in events:
+                    pass
+            except Exception as e:
+                self.logger.debug(f"读取剩余流式事件失败: {e}")
+
+        task = asyncio.get_running_loop().create_task(drain())
+        self._drain_tasks.add(task)
+        task.add_done_callback(self._drain_tasks.discard)
+
+    def _create_async_client(self) -> AsyncCoze:
+        return AsyncCoze(
+            auth=AsyncTokenAuth(token=self.token),
+            base_url=config.get("coze_api_base")
+        )
@@ -1,73 +1,364 @@
+import asyncio
+import atexit
 import sqlite3
 from sqlite3 import Error
-from typing import Optional
+from typing import Any, Dict, List, Optional, Tuple
 import os
+import threading
+from collections import OrderedDict
 from pathlib import Path
+from config import config
 from utils.logger import get_logger
 import time
 
+
+# 会话管理默认配置，可通过config中的coze_session覆盖（时间单位：秒）
+DEFAULT_SESSION_CONFIG = {
+    # 内存中缓存的会话数量
+    "cache_size": 10000,
+    # 会话创建超过该时间后轮换为新会话（0表示不按时间轮换）
+    "max_age": 86400,
+    # 会话累计对话轮数达到该值后轮换为新会话（0表示不按轮数轮换）
+    "max_turns": 30,
+    # 超过该时间未使用的会话记录被后台清理
+    "idle_ttl": 7 * 86400,
+    # 最多保存的会话记录数，超过时清理最久未使用的
+    "max_sessions": 100000,
+    # 后台清理间隔（0表示不清理）
+    "prune_interval": 3600,
+    # 对话轮数和最近使用时间由后台线程按该间隔批量写入数据库
+    "flush_interval": 5
+}
+
+
+class _SessionEntry:
+    """缓存中的一个用户会话"""
+
+    __slots__ = ('conversation_id', 'created_at', 'turns')
+
+    def __init__(self, conversation_id: str, created_at: int, turns: int = 0):
+        self.conversation_id = conversation_id
+        self.created_at = created_at
+        self.turns = turns
+
+
 class UserSessionManager:
-    def __init__(self, db_path: str = "logs/user_session.db"):
+    """用户会话管理
+
+    user_id -> conversation_id 的映射保存在SQLite中，并在内存中保留一份LRU缓存（写穿透），
+    回复路径上的查询通常只是一次字典查找。每个线程使用一个长连接（WAL模式），不再每次调用都新建连接。
+    record_turn只更新内存，累计的轮数和最近使用时间由后台线程每flush_interval秒批量写入，
+    回复路径（包括事件循环中的astream）不执行数据库写入。
+
+    会话创建超过max_age或对话轮数达到max_turns后，get_session不再返回它，调用方会创建新会话，
+    每次回复携带的历史因此保持有界；后台线程定期清理长期未使用的记录并限制记录总数。
+    """
+
+    def __init__(self, db_path: str = "logs/user_session.db", cache_size: int = 10000,
+                 settings: Optional[Dict[str, Any]] = None):
+        """
+        Args:
+            db_path: SQLite数据库文件路径
+            cache_size: 内存中缓存的会话数量上限
+            settings: 轮换与清理配置（见DEFAULT_SESSION_CONFIG），其中的cache_size优先
+        """
+        settings = {**DEFAULT_SESSION_CONFIG, "cache_size": cache_size, **(settings or {})}
         self.db_path = Path(db_path)
-        self._init_db()
+        self.cache_size = max(1, int(settings["cache_size"]))
+        self.max_age = int(settings["max_age"])
+        self.max_turns = int(settings["max_turns"])
+        self.idle_ttl = int(settings["idle_ttl"])
+        self.max_sessions = int(settings["max_sessions"])
+        self.prune_interval = float(settings["prune_interval"])
+        self.flush_interval = max(0.1, float(settings["flush_interval"]))
         self.logger = get_logger()
+        self._local = threading.local()
+        self._connections = []
+        self._connections_lock = threading.Lock()
+        self._cache: "OrderedDict[str, _SessionEntry]" = OrderedDict()
+        self._cache_lock = threading.Lock()
+        # 尚未写入数据库的对话轮数 {(user_id, conversation_id): [轮数增量, 最近使用时间]}，受_cache_lock保护
+        self._pending_turns: Dict[Tuple[str, str], List[int]] = {}
+        self._stats = {'rotated': 0, 'pruned': 0, 'flushed': 0}
+        self._init_db()
+
+        self._stop_event = threading.Event()
+        self._closed = False
+        self._maintenance_thread = threading.Thread(target=self._maintenance_loop,
+                                                    name="UserSessionMaintenance", daemon=True)
+        self._maintenance_thread.start()
+
     def _init_db(self):
-        """初始化数据库和表结构"""
+        """初始化数据库和表结构（旧表自动补充轮数和最近使用时间字段）"""
         self.db_path.parent.mkdir(parents=True, exist_ok=True)
-        with self._get_connection() as conn:
-            try:
-                conn.execute('''PRAGMA foreign_keys = ON''')
-                conn.execute('''PRAGMA journal_mode = WAL''')
-                conn.execute('''PRAGMA synchronous = NORMAL''')
-                
+        conn = self._get_connection()
+        try:
+            with conn:
                 conn.execute('''CREATE TABLE IF NOT EXISTS user_sessions (
                                 user_id TEXT PRIMARY KEY,
                                 conversation_id TEXT NOT NULL,
-                                created_at INTEGER NOT NULL
+                                created_at INTEGER NOT NULL,
+                                turns INTEGER NOT NULL DEFAULT 0,
+                                last_used_at INTEGER NOT NULL DEFAULT 0
                             )''')
-                conn.commit()
-            except Error as e:
-                self.logger.error(f"初始化数据库失败: {str(e)}")
+                columns = {row[1] for row in conn.execute('''PRAGMA table_info(user_sessions)''')}
+                if 'turns' not in columns:
+                    conn.execute('''ALTER TABLE user_sessions ADD COLUMN turns INTEGER NOT NULL DEFAULT 0''')
+                if 'last_used_at' not in columns:
+                    conn.execute('''ALTER TABLE user_sessions ADD COLUMN last_used_at INTEGER NOT NULL DEFAULT 0''')
+                    conn.execute('''UPDATE user_sessions SET last_used_at = created_at''')
+                conn.execute('''CREATE INDEX IF NOT EXISTS idx_user_sessions_last_used
+                                ON user_sessions (last_used_at)''')
+        except Error as e:
+            self.logger.error(f"初始化数据库失败: {str(e)}")
+
+    def _get_connection(self) -> sqlite3.Connection:
+        """获取当前线程的数据库长连接（首次使用时创建）"""
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.db_path, timeout=30, check_same_thread=False)
+            conn.execute('''PRAGMA foreign_keys = ON''')
+            conn.execute('''PRAGMA journal_mode = WAL''')
+            conn.execute('''PRAGMA synchronous = NORMAL''')
+            self._local.conn = conn
+            with self._connections_lock:
+                self._connections.append(conn)
+        return conn
+
+    def _cache_put(self, user_id: str, entry: _SessionEntry):
+        with self._cache_lock:
+            self._cache[user_id] = entry
+            self._cache.move_to_end(user_id)
+            while len(self._cache) > self.cache_size:
+                self._cache.popitem(last=False)
 
-    def _get_connection(self):
-        """获取数据库连接"""
-        return sqlite3.connect(self.db_path)
+    def _cache_pop(self, user_id: str):
+        with self._cache_lock:
+            self._cache.pop(user_id, None)
+
+    def _is_expired(self, entry: _SessionEntry, now: int) -> bool:
+        """会话是否需要轮换"""
+        if self.max_age > 0 and now - entry.created_at >= self.max_age:
+            return True
+        return self.max_turns > 0 and entry.turns >= self.max_turns
 
     def create_session(self, user_id: str, conversation_id: str) -> bool:
-        """创建或更新用户会话"""
-        with self._get_connection() as conn:
-            try:
-                conn.execute('''INSERT OR REPLACE INTO user_sessions 
-                             (user_id, conversation_id, created_at)
-                             VALUES (?, ?, ?)''',
-                          (user_id, conversation_id, int(time.time())))
-                conn.commit()
-                return True
-            except Error as e:
-                self.logger.error(f"创建会话失败: {str(e)}")
-                return False
+        """创建或更新用户会话（写入数据库后更新缓存，轮数从0开始）"""
+        now = int(time.time())
+        conn = self._get_connection()
+        try:
+            with conn:
+                conn.execute('''INSERT OR REPLACE INTO user_sessions
+                             (user_id, conversation_id, created_at, turns, last_used_at)
+                             VALUES (?, ?, ?, 0, ?)''',
+                          (user_id, conversation_id, now, now))
+            self._cache_put(user_id, _SessionEntry(conversation_id, now))
+            return True
+        except Error as e:
+            self.logger.error(f"创建会话失败: {str(e)}")
+            return False
 
     def get_session(self, user_id: str) -> Optional[str]:
-        """获取用户会话ID"""
-        with self._get_connection() as conn:
+        """
+        获取用户会话ID（优先从缓存读取）
+
+        Returns:
+            会话ID；没有会话或会话需要轮换时返回None，调用方应创建新会话
+        """
+        with self._cache_lock:
+            entry = self._cache.get(user_id)
+            if entry is not None:
+                self._cache.move_to_end(user_id)
+
+        if entry is None:
             try:
-                cursor = conn.execute('''SELECT conversation_id 
-                                      FROM user_sessions 
+                cursor = self._get_connection().execute('''SELECT conversation_id, created_at, turns
+                                      FROM user_sessions
                                       WHERE user_id = ?''', (user_id,))
                 result = cursor.fetchone()
-                return result[0] if result else None
             except Error as e:
                 self.logger.error(f"获取会话失败: {str(e)}")
                 return None
+            if not result:
+                return None
+            entry = _SessionEntry(*result)
+            with self._cache_lock:
+                # 加上还未写入数据库的轮数
+                pending = self._pending_turns.get((user_id, entry.conversation_id))
+                if pending is not None:
+                    entry.turns += pending[0]
+            self._cache_put(user_id, entry)
+
+        if self._is_expired(entry, int(time.time())):
+            self._stats['rotated'] += 1
+            self.logger.debug(f"用户 {user_id} 的会话 {entry.conversation_id} 已达到轮换条件"
+                              f"（{entry.turns} 轮），将创建新会话")
+            return None
+        return entry.conversation_id
+
+    async def aget_session(self, user_id: str) -> Optional[str]:
+        """
+        在事件循环中获取用户会话ID：缓存命中时直接返回，未命中时在线程中查询数据库
+
+        Returns:
+            同get_session
+        """
+        with self._cache_lock:
+            cached = user_id in self._cache
+        if cached:
+            return self.get_session(user_id)
+        return await asyncio.to_thread(self.get_session, user_id)
+
+    def record_turn(self, user_id: str, conversation_id: str):
+        """
+        记录一轮对话（累计轮数并更新最近使用时间），只更新内存，由后台线程批量写入数据库
+
+        Args:
+            user_id: 用户ID
+            conversation_id: 本轮使用的会话ID，与当前会话不一致时忽略
+        """
+        now = int(time.time())
+        with self._cache_lock:
+            entry = self._cache.get(user_id)
+            if entry is not None and entry.conversation_id == conversation_id:
+                entry.turns += 1
+            pending = self._pending_turns.get((user_id, conversation_id))
+            if pending is None:
+                self._pending_turns[(user_id, conversation_id)] = [1, now]
+            else:
+                pending[0] += 1
+                pending[1] = now
+
+    def flush(self) -> int:
+        """
+        把累计的对话轮数和最近使用时间写入数据库
+
+        Returns:
+            写入的会话数
+        """
+        with self._cache_lock:
+            pending, self._pending_turns = self._pending_turns, {}
+        if not pending:
+            return 0
+
+        conn = self._get_connection()
+        try:
+            with conn:
+                conn.executemany('''UPDATE user_sessions SET turns = turns + ?, last_used_at = MAX(last_used_at, ?)
+                                 WHERE user_id = ? AND conversation_id = ?''',
+                                 ((turns, last_used, user_id, conversation_id)
+                                  for (user_id, conversation_id), (turns, last_used) in pending.items()))
+        except Error as e:
+            self.logger.error(f"写入会话轮数失败: {str(e)}")
+            # 写入失败时放回，下次再写
+            with self._cache_lock:
+                for key, (turns, last_used) in pending.items():
+                    current = self._pending_turns.setdefault(key, [0, 0])
+                    current[0] += turns
+                    current[1] = max(current[1], last_used)
+            return 0
+        self._stats['flushed'] += len(pending)
+        return len(pending)
 
     def delete_session(self, user_id: str) -> bool:
         """删除用户会话"""
-        with self._get_connection() as conn:
-            try:
-                conn.execute('''DELETE FROM user_sessions 
+        conn = self._get_connection()
+        try:
+            with conn:
+                conn.execute('''DELETE FROM user_sessions
                              WHERE user_id = ?''', (user_id,))
-                conn.commit()
-                return True
-            except Error as e:
-                self.logger.error(f"删除会话失败: {str(e)}")
-                return False
+            self._cache_pop(user_id)
+            return True
+        except Error as e:
+            self.logger.error(f"删除会话失败: {str(e)}")
+            return False
+
+    def prune(self) -> int:
+        """
+        清理长期未使用的会话记录，并把记录数限制在max_sessions以内
+
+        Returns:
+            清理的记录数
+        """
+        conn = self._get_connection()
+        try:
+            stale = []
+            if self.idle_ttl > 0:
+                cutoff = int(time.time()) - self.idle_ttl
+                stale = [row[0] for row in conn.execute(
+                    '''SELECT user_id FROM user_sessions WHERE last_used_at < ?''', (cutoff,))]
+
+            if self.max_sessions > 0:
+                total = conn.execute('''SELECT COUNT(*) FROM user_sessions''').fetchone()[0]
+                excess = total - len(stale) - self.max_sessions
+                if excess > 0:
+                    stale.extend(row[0] for row in conn.execute(
+                        '''SELECT user_id FROM user_sessions ORDER BY last_used_at LIMIT ? OFFSET ?''',
+                        (excess, len(stale))))
+
+            if not stale:
+                return 0
+            with conn:
+                conn.executemany('''DELETE FROM user_sessions WHERE user_id = ?''',
+                                 ((user_id,) for user_id in stale))
+        except Error as e:
+            self.logger.error(f"清理会话失败: {str(e)}")
+            return 0
+
+        with self._cache_lock:
+            for user_id in stale:
+                self._cache.pop(user_id, None)
+        self._stats['pruned'] += len(stale)
+        self.logger.debug(f"清理了 {len(stale)} 条会话记录")
+        return len(stale)
+
+    def _maintenance_loop(self):
+        """后台线程：定期批量写入对话轮数，并按prune_interval清理会话记录"""
+        next_prune = time.monotonic() + self.prune_interval
+        while not self._stop_event.wait(self.flush_interval):
+            self.flush()
+            if self.prune_interval > 0 and time.monotonic() >= next_prune:
+                self.prune()
+                next_prune = time.monotonic() + self.prune_interval
+
+    def get_cache_size(self) -> int:
+        """获取缓存中的会话数量"""
+        with self._cache_lock:
+            return len(self._cache)
+
+    def get_stats(self) -> Dict[str, Any]:
+        """获取会话统计信息"""
+        with self._cache_lock:
+            pending = len(self._pending_turns)
+        return {**self._stats, 'cached': self.get_cache_size(), 'pending_turns': pending}
+
+    def close(self):
+        """停止后台线程，写入剩余的对话轮数并关闭所有线程的数据库连接（get_session_manager注册为程序退出时调用）"""
+        if self._closed:
+            return
+        self._closed = True
+        self._stop_event.set()
+        self._maintenance_thread.join(timeout=5)
+        self.flush()
+        with self._connections_lock:
+            connections, self._connections = self._connections, []
+        for conn in connections:
+            try:
+                conn.close()
+            except Error:
+                pass
+        self._local = threading.local()
+
+
+_session_manager: Optional[UserSessionManager] = None
+_session_manager_lock = threading.Lock()
+
+
+def get_session_manager() -> UserSessionManager:
+    """获取进程内共享的会话管理器（所有CozeBot共用一份缓存和一个后台线程，程序退出时写入剩余数据）"""
+    global _session_manager
+    with _session_manager_lock:
+        if _session_manager is None:
+            _session_manager = UserSessionManager(settings=config.get("coze_session"))
+            atexit.register(_session_manager.close)
+        return _session_manager
@@ -7,20 +7,25 @@ from bridge.context import Context
 from bridge.reply import Reply, ReplyType
 from utils.logger import get_logger
 from config import config
+from typing import AsyncIterator
 import json
 
 # Import OpenAI libraries at module level
 try:
-    from openai import OpenAI, AzureOpenAI
+    from openai import OpenAI, AzureOpenAI, AsyncOpenAI, AsyncAzureOpenAI
     OPENAI_AVAILABLE = True
 except ImportError:
     OPENAI_AVAILABLE = False
     OpenAI = None
     AzureOpenAI = None
+    AsyncOpenAI = None
+    AsyncAzureOpenAI = None
 
 
 class BaseOpenAIBot(Bot):
     """Base class for OpenAI-compatible bots"""
+
+    supports_async = True
     
     def __init__(self):
         super().__init__()
@@ -57,6 +62,47 @@ class BaseOpenAIBot(Bot):
             self.logger.error(f"API call failed: {e}", exc_info=True)
             return Reply(ReplyType.TEXT, "抱歉，服务暂时不可用，请稍后再试。")
     
+    async def areply(self, context: Context) -> Reply:
+        """
+        异步生成AI回复（使用异步客户端，不占用线程）
+        
+        Args:
+            context: 消息上下文
+            
+        Returns:
+            Reply对象
+        """
+        try:
+            chunks = [chunk async for chunk in self.astream(context)]
+            return Reply(ReplyType.TEXT, "".join(chunks))
+        except Exception as e:
+            self.logger.error(f"API call failed: {e}", exc_info=True)
+            return Reply(ReplyType.TEXT, "抱歉，服务暂时不可用，请稍后再试。")
+
+    async def astream(self, context: Context) -> AsyncIterator[str]:
+        """
+        流式生成AI回复，逐段产出增量文本
+        
+        Args:
+            context: 消息上下文
+            
+        Returns:
+            回复文本片段的异步迭代器
+        """
+        query = self._parse_content(context.content)
+        if not query:
+            yield "抱歉，我没有理解您的问题。"
+            return
+
+        produced = False
+        async for chunk in self._stream_api(query):
+            if chunk:
+                produced = True
+                yield chunk
+
+        if not produced:
+            yield "抱歉，我暂时无法回答您的问题。"
+
     def _call_api(self, query: str) -> str:
         """
         调用API生成回复（由子类实现）
@@ -68,6 +114,36 @@ class BaseOpenAIBot(Bot):
             回复文本
         """
         raise NotImplementedError("Subclasses must implement _call_api method")
+
+    async def _stream_api(self, query: str) -> AsyncIterator[str]:
+        """
+        以流式方式调用API（由子类实现）
+        
+        Args:
+            query: 用户查询文本
+            
+        Returns:
+            回复文本片段的异步迭代器
+        """
+        raise NotImplementedError("Subclasses must implement _stream_api method")
+        yield
+
+    async def _stream_completion(self, client, model: str, query: str) -> AsyncIterator[str]:
+        """调用chat.completions流式接口，产出增量文本"""
+        stream = await client.chat.completions.create(
+            model=model,
+            messages=[
+                {"role": "system", "content": self.system_prompt},
+                {"role": "user", "content": query}
+            ],
+            max_tokens=self.max_tokens,
+            temperature=self.temperature,
+            stream=True
+        )
+        async for chunk in stream:
+            # Azure的首个分片可能只有内容过滤结果，没有choices
+            if chunk.choices and chunk.choices[0].delta.content:
+                yield chunk.choices[0].delta.content
     
     def _parse_content(self, content: str) -> str:
         """
@@ -159,6 +235,20 @@ class OpenAIBot(BaseOpenAIBot):
         else:
             return "抱歉，我暂时无法回答您的问题。"
 
+    async def _stream_api(self, query: str) -> AsyncIterator[str]:
+        """
+        以流式方式调用OpenAI API
+        
+        Args:
+            query: 用户查询文本
+            
+        Returns:
+            回复文本片段的异步迭代器
+        """
+        client = self._get_loop_client(lambda: AsyncOpenAI(api_key=self.api_key, base_url=self.api_base))
+        async for chunk in self._stream_completion(client, self.model, query):
+            yield chunk
+
 
 class AzureOpenAIBot(BaseOpenAIBot):
     """Azure OpenAI Bot for auto-reply"""
@@ -225,3 +315,21 @@ class AzureOpenAIBot(BaseOpenAIBot):
             return content if content else "抱歉，我暂时无法回答您的问题。"
         else:
             return "抱歉，我暂时无法回答您的问题。"
+
+    async def _stream_api(self, query: str) -> AsyncIterator[str]:
+        """
+        以流式方式调用Azure OpenAI API
+        
+        Args:
+            query: 用户查询文本
+            
+        Returns:
+            回复文本片段的异步迭代器
+        """
+        client = self._get_loop_client(lambda: AsyncAzureOpenAI(
+            api_key=self.api_key,
+            api_version=self.api_version,
+            azure_endpoint=self.api_base
+        ))
+        async for chunk in self._stream_completion(client, self.deployment_name, query):
+            yield chunk
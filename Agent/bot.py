@@ -2,16 +2,56 @@
 自动回复聊天机器人抽象类
 """
 
+import asyncio
+import weakref
+from typing import AsyncIterator, Callable
 
 from bridge.context import Context
 from bridge.reply import Reply
 
 
 class Bot(object):
+    # 是否原生实现了areply/astream（调用期间不占用线程）
+    supports_async = False
+    # 是否按用户保存多轮对话历史（回复依赖上文，回复缓存只用于FAQ白名单）
+    stateful = False
+
     def reply(self, context: Context) -> Reply:
         """
         bot auto-reply content
         :param context: Context object containing message information
         :return: reply content
         """
-        raise NotImplementedError
\ No newline at end of file
+        raise NotImplementedError
+
+    async def areply(self, context: Context) -> Reply:
+        """
+        异步生成回复，默认在线程中执行同步的reply
+        :param context: Context object containing message information
+        :return: reply content
+        """
+        return await asyncio.to_thread(self.reply, context)
+
+    async def astream(self, context: Context) -> AsyncIterator[str]:
+        """
+        流式生成回复文本，按生成顺序逐段产出，默认等areply完成后一次性产出
+        :param context: Context object containing message information
+        :return: async iterator of text chunks
+        """
+        reply = await self.areply(context)
+        if reply is not None and reply.content:
+            yield str(reply.content)
+
+    def _get_loop_client(self, factory: Callable[[], object]):
+        """
+        获取当前事件循环专用的异步客户端
+
+        异步HTTP客户端的连接池绑定创建它的事件循环，多个引擎循环共用一个Bot时各自创建一个
+        """
+        clients = self.__dict__.setdefault('_loop_clients', weakref.WeakKeyDictionary())
+        loop = asyncio.get_running_loop()
+        client = clients.get(loop)
+        if client is None:
+            client = factory()
+            clients[loop] = client
+        return client
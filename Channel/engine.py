@@ -0,0 +1,323 @@
+"""
+渠道引擎服务
+
+所有账号的渠道连接运行在少量固定的后台事件循环中（按店铺分片），
+UI线程通过线程安全的命令队列启动/停止账号，线程数不随账号数增长。
+"""
+
+import asyncio
+import concurrent.futures
+import threading
+import zlib
+from typing import Any, Callable, Dict, List, Optional
+
+from config import config
+from utils.logger import get_logger
+
+
+class _AccountRuntime:
+    """引擎中一个正在运行的账号"""
+
+    def __init__(self, account_key: str, account_data: dict, channel: Any, task: asyncio.Task):
+        self.account_key = account_key
+        self.account_data = account_data
+        self.channel = channel
+        self.task = task
+
+
+class _EngineLoop:
+    """一个后台事件循环分片
+
+    命令通过 call_soon_threadsafe 放入循环内的asyncio.Queue，由分发协程按顺序执行，
+    本循环上的所有账号共用一个渠道实例（渠道内部按账号维护连接），各账号连接作为该循环上的任务运行。
+    """
+
+    def __init__(self, index: int, channel_factory: Callable[[], Any]):
+        self.index = index
+        self.channel_factory = channel_factory
+        self.logger = get_logger(f"ChannelEngine-{index}")
+
+        self.accounts: Dict[str, _AccountRuntime] = {}
+        self._channel: Any = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._commands: Optional[asyncio.Queue] = None
+        self._ready = threading.Event()
+        self._thread = threading.Thread(target=self._run, name=f"ChannelEngine-{index}", daemon=True)
+
+    def start(self):
+        """启动循环线程并等待就绪"""
+        self._thread.start()
+        self._ready.wait()
+
+    def is_alive(self) -> bool:
+        return self._thread.is_alive()
+
+    def submit(self, command: str, *args) -> concurrent.futures.Future:
+        """
+        从任意线程提交命令
+
+        Args:
+            command: 命令名称（start/stop/stop_all）
+            *args: 命令参数
+
+        Returns:
+            命令执行结果的Future
+        """
+        future: concurrent.futures.Future = concurrent.futures.Future()
+        self._loop.call_soon_threadsafe(self._commands.put_nowait, (command, args, future))
+        return future
+
+    def _run(self):
+        """循环线程入口"""
+        self._loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(self._loop)
+        self._commands = asyncio.Queue()
+        self._ready.set()
+        try:
+            self._loop.run_until_complete(self._dispatch())
+        except Exception as e:
+            self.logger.error(f"引擎事件循环异常退出: {e}")
+        finally:
+            self._loop.close()
+
+    async def _dispatch(self):
+        """按顺序执行命令队列中的命令"""
+        while True:
+            command, args, future = await self._commands.get()
+            try:
+                handler = getattr(self, f"_cmd_{command}")
+                result = await handler(*args)
+                if not future.done():
+                    future.set_result(result)
+            except Exception as e:
+                self.logger.error(f"执行引擎命令 {command} 失败: {e}")
+                if not future.done():
+                    future.set_exception(e)
+
+    async def _cmd_start(self, account_key: str, account_data: dict,
+                         on_success: Callable[[], None], on_failure: Callable[[str], None],
+                         on_finished: Callable[[], None]) -> bool:
+        """在本循环上启动账号连接"""
+        if account_key in self.accounts:
+            return False
+
+        if self._channel is None:
+            self._channel = self.channel_factory()
+        channel = self._channel
+        task = asyncio.create_task(
+            channel.start_account(
+                shop_id=account_data['shop_id'],
+                user_id=account_data['user_id'],
+                on_success=on_success,
+                on_failure=on_failure
+            ),
+            name=f"account:{account_key}"
+        )
+        self.accounts[account_key] = _AccountRuntime(account_key, account_data, channel, task)
+
+        def _on_done(done_task: asyncio.Task):
+            runtime = self.accounts.get(account_key)
+            if runtime is not None and runtime.task is done_task:
+                del self.accounts[account_key]
+            if not done_task.cancelled() and done_task.exception() is not None:
+                self.logger.error(f"账号 {account_key} 连接任务异常结束: {done_task.exception()}")
+                on_failure(str(done_task.exception()))
+            on_finished()
+
+        task.add_done_callback(_on_done)
+        return True
+
+    async def _cmd_stop(self, account_key: str, timeout: float = 5.0) -> bool:
+        """停止账号连接并等待其结束"""
+        runtime = self.accounts.get(account_key)
+        if runtime is None:
+            return False
+
+        runtime.channel.request_stop(runtime.account_data['shop_id'], runtime.account_data['user_id'])
+        done, _ = await asyncio.wait({runtime.task}, timeout=timeout)
+        if not done:
+            self.logger.warning(f"账号 {account_key} 未在 {timeout} 秒内停止，强制取消")
+            runtime.task.cancel()
+            await asyncio.gather(runtime.task, return_exceptions=True)
+        return True
+
+    async def _cmd_stop_all(self, timeout: float = 5.0) -> int:
+        """停止本循环上的所有账号"""
+        keys = list(self.accounts)
+        await asyncio.gather(*(self._cmd_stop(key, timeout) for key in keys), return_exceptions=True)
+        return len(keys)
+
+
+class ChannelEngine:
+    """渠道引擎服务
+
+    功能特性：
+    - 固定数量的事件循环线程（engine_loops配置，默认1个），与账号数无关
+    - 按shop_id的crc32分片，同一店铺的账号、消息队列和消费者总在同一个循环上
+    - start_account/stop_account可从UI线程调用，回调在引擎线程中执行
+      （Qt侧通过信号转回UI线程）
+    """
+
+    def __init__(self, num_loops: Optional[int] = None, channel_factory: Optional[Callable[[], Any]] = None):
+        """
+        初始化引擎
+
+        Args:
+            num_loops: 事件循环分片数量
+            channel_factory: 创建渠道实例的工厂函数，默认创建PDDChannel（每个循环一个实例）
+        """
+        self.num_loops = max(1, int(num_loops or config.get("engine_loops", 1)))
+        self.channel_factory = channel_factory or self._default_channel_factory
+        self.logger = get_logger("ChannelEngine")
+
+        self._loops: List[Optional[_EngineLoop]] = [None] * self.num_loops
+        self._account_loops: Dict[str, int] = {}
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _default_channel_factory():
+        from Channel.pinduoduo.pdd_chnnel import PDDChannel
+        return PDDChannel()
+
+    def _shard_for(self, shop_id: str) -> int:
+        """计算店铺所在的循环分片"""
+        return zlib.crc32(str(shop_id).encode("utf-8")) % self.num_loops
+
+    def _get_loop(self, index: int) -> _EngineLoop:
+        """获取分片循环，首次使用时启动"""
+        with self._lock:
+            engine_loop = self._loops[index]
+            if engine_loop is None or not engine_loop.is_alive():
+                engine_loop = _EngineLoop(index, self.channel_factory)
+                engine_loop.start()
+                self._loops[index] = engine_loop
+                self.logger.info(f"引擎事件循环 {index} 已启动")
+            return engine_loop
+
+    def start_account(self, account_key: str, account_data: dict,
+                      on_success: Callable[[], None], on_failure: Callable[[str], None],
+                      on_finished: Callable[[], None]) -> bool:
+        """
+        启动账号连接
+
+        Args:
+            account_key: 账号键
+            account_data: 账号数据，需包含shop_id和user_id
+            on_success: 连接成功回调
+            on_failure: 连接失败回调
+            on_finished: 连接结束回调
+
+        Returns:
+            是否已提交启动（账号已在运行时返回False）
+        """
+        index = self._shard_for(account_data['shop_id'])
+
+        def _finished():
+            with self._lock:
+                self._account_loops.pop(account_key, None)
+            on_finished()
+
+        with self._lock:
+            if account_key in self._account_loops:
+                return False
+            self._account_loops[account_key] = index
+
+        future = self._get_loop(index).submit(
+            "start", account_key, account_data, on_success, on_failure, _finished
+        )
+        try:
+            return future.result(timeout=5)
+        except Exception as e:
+            self.logger.error(f"启动账号 {account_key} 失败: {e}")
+            with self._lock:
+                self._account_loops.pop(account_key, None)
+            return False
+
+    def stop_account(self, account_key: str, timeout: float = 5.0) -> bool:
+        """
+        停止账号连接并等待结束
+
+        Args:
+            account_key: 账号键
+            timeout: 等待停止的最长时间（秒）
+
+        Returns:
+            是否找到并停止了账号
+        """
+        with self._lock:
+            index = self._account_loops.get(account_key)
+        if index is None:
+            return False
+
+        future = self._get_loop(index).submit("stop", account_key, timeout)
+        try:
+            return future.result(timeout=timeout + 2)
+        except Exception as e:
+            self.logger.error(f"停止账号 {account_key} 失败: {e}")
+            return False
+
+    def stop_all(self, timeout: float = 5.0):
+        """停止所有账号（各分片并行停止）"""
+        with self._lock:
+            loops = [engine_loop for engine_loop in self._loops if engine_loop is not None]
+        futures = [engine_loop.submit("stop_all", timeout) for engine_loop in loops]
+        concurrent.futures.wait(futures, timeout=timeout + 2)
+
+    def is_running(self, account_key: str) -> bool:
+        """检查账号是否在引擎中运行"""
+        with self._lock:
+            return account_key in self._account_loops
+
+    def get_running_count(self) -> int:
+        """获取运行中的账号数量"""
+        with self._lock:
+            return len(self._account_loops)
+
+    def get_stats(self) -> Dict[str, Any]:
+        """获取引擎统计信息"""
+        with self._lock:
+            per_loop = [0] * self.num_loops
+            for index in self._account_loops.values():
+                per_loop[index] += 1
+            return {
+                'num_loops': self.num_loops,
+                'running_accounts': len(self._account_loops),
+                'accounts_per_loop': per_loop
+            }
+
+
+# 全局渠道引擎
+channel_engine = ChannelEngine()
+
+_process_supervisor = None
+_process_supervisor_lock = threading.Lock()
+
+
+def get_channel_engine():
+    """
+    根据配置获取账号连接的运行后端
+
+    engine_mode为"process"时返回多进程监督器（Channel.supervisor），
+    否则返回当前进程内的channel_engine。两者接口一致。
+    """
+    global _process_supervisor
+    if config.get("engine_mode", "thread") != "process":
+        return channel_engine
+
+    with _process_supervisor_lock:
+        if _process_supervisor is None:
+            from Channel.supervisor import ProcessSupervisor
+            _process_supervisor = ProcessSupervisor(
+                num_workers=config.get("engine_workers", 2),
+                loops_per_worker=config.get("engine_loops", 1)
+            )
+        return _process_supervisor
+
+
+def shutdown_channel_engine(timeout: float = 5.0):
+    """程序退出时停止所有账号，多进程模式下同时停止工作进程"""
+    channel_engine.stop_all(timeout=timeout)
+    with _process_supervisor_lock:
+        supervisor = _process_supervisor
+    if supervisor is not None:
+        supervisor.shutdown(timeout=timeout)
@@ -0,0 +1,251 @@
+"""
+Playwright浏览器池
+
+全局只启动一个Playwright驱动，并按账号的用户数据目录缓存持久化浏览器上下文（LRU淘汰），
+登录和cookies刷新复用已打开的上下文，避免每次都冷启动Chromium。
+"""
+
+import asyncio
+import atexit
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict, Optional, TypeVar
+
+from playwright.async_api import async_playwright, BrowserContext, Playwright
+
+from utils.logger import get_logger
+
+
+T = TypeVar("T")
+
+# 持久化上下文的启动参数
+BROWSER_ARGS = [
+    '--disable-gpu',
+    '--no-sandbox',
+    '--disable-dev-shm-usage',
+    '--disable-blink-features=AutomationControlled',
+    '--disable-notifications',  # 禁用通知
+    '--disable-web-security',
+    '--disable-features=VizDisplayCompositor'
+]
+
+
+class _PooledContext:
+    """浏览器池中的单个持久化上下文"""
+
+    def __init__(self, context: BrowserContext, headless: bool):
+        self.context = context
+        self.headless = headless
+        self.last_used = time.time()
+        self.in_use = 0
+        self.closed = False
+
+
+class BrowserPool:
+    """Playwright持久化上下文池
+
+    功能特性：
+    - Playwright驱动和所有上下文运行在池自己的后台线程/事件循环中，
+      任意线程、任意事件循环里的调用都通过 run() 提交，共享同一个驱动
+    - 每个用户数据目录最多一个上下文（Chromium不允许同一目录被同时打开），
+      对同一目录的操作串行执行
+    - 上下文数量有上限，超出时按LRU关闭空闲上下文；空闲超时的上下文定期关闭
+    - 需要切换有头/无头模式时关闭旧上下文后重新启动
+    """
+
+    def __init__(self, max_contexts: int = 4, idle_timeout: float = 600.0, reap_interval: float = 60.0):
+        """
+        初始化浏览器池
+
+        Args:
+            max_contexts: 最多同时打开的上下文数
+            idle_timeout: 上下文空闲超时时间（秒）
+            reap_interval: 空闲上下文检查间隔（秒）
+        """
+        self.max_contexts = max_contexts
+        self.idle_timeout = idle_timeout
+        self.reap_interval = reap_interval
+        self.logger = get_logger("BrowserPool")
+
+        self._contexts: "OrderedDict[str, _PooledContext]" = OrderedDict()
+        self._dir_locks: Dict[str, asyncio.Lock] = {}
+        self._playwright: Optional[Playwright] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._thread: Optional[threading.Thread] = None
+        self._thread_lock = threading.Lock()
+        self._loop_ready = threading.Event()
+        self._stats = {'launch_count': 0, 'reuse_count': 0, 'evicted_count': 0}
+
+    # ---- 后台线程 ----
+
+    def _ensure_loop(self) -> asyncio.AbstractEventLoop:
+        """启动池的后台事件循环线程（只启动一次）"""
+        with self._thread_lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._loop_ready.clear()
+                self._thread = threading.Thread(target=self._run_loop, name="BrowserPool", daemon=True)
+                self._thread.start()
+        self._loop_ready.wait()
+        return self._loop
+
+    def _run_loop(self):
+        """后台线程入口"""
+        loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(loop)
+        self._loop = loop
+        reaper = loop.create_task(self._reap_idle())
+        self._loop_ready.set()
+        try:
+            loop.run_forever()
+        finally:
+            reaper.cancel()
+            loop.run_until_complete(self._close_all())
+            loop.close()
+            self._loop = None
+
+    async def _reap_idle(self):
+        """定期关闭空闲超时的上下文"""
+        while True:
+            await asyncio.sleep(self.reap_interval)
+            now = time.time()
+            for user_data_dir, entry in list(self._contexts.items()):
+                if entry.in_use == 0 and now - entry.last_used >= self.idle_timeout:
+                    self.logger.debug(f"关闭空闲浏览器上下文: {user_data_dir}")
+                    await self._close_context(user_data_dir)
+
+    # ---- 池内部操作（仅在池的事件循环中调用） ----
+
+    async def _ensure_playwright(self) -> Playwright:
+        """启动（或复用）Playwright驱动"""
+        if self._playwright is None:
+            self._playwright = await async_playwright().start()
+            self.logger.info("Playwright驱动已启动")
+        return self._playwright
+
+    async def _acquire(self, user_data_dir: str, headless: bool) -> _PooledContext:
+        """获取目录对应的上下文，不存在或模式不符时启动新的上下文"""
+        entry = self._contexts.get(user_data_dir)
+        if entry is not None and (entry.closed or entry.headless != headless):
+            await self._close_context(user_data_dir)
+            entry = None
+
+        if entry is None:
+            await self._evict_for_new_context()
+            playwright = await self._ensure_playwright()
+            context = await playwright.chromium.launch_persistent_context(
+                user_data_dir,
+                headless=headless,
+                args=BROWSER_ARGS
+            )
+            entry = _PooledContext(context, headless)
+            # 浏览器被手动关闭或崩溃时标记失效，下次使用时重新启动
+            context.on("close", lambda _: setattr(entry, 'closed', True))
+            self._contexts[user_data_dir] = entry
+            self._stats['launch_count'] += 1
+            self.logger.debug(f"启动浏览器上下文: {user_data_dir}, headless={headless}")
+        else:
+            self._contexts.move_to_end(user_data_dir)
+            self._stats['reuse_count'] += 1
+
+        entry.in_use += 1
+        entry.last_used = time.time()
+        return entry
+
+    async def _evict_for_new_context(self):
+        """上下文数量达到上限时关闭最久未使用的空闲上下文"""
+        while len(self._contexts) >= self.max_contexts:
+            victim = next((d for d, e in self._contexts.items() if e.in_use == 0), None)
+            if victim is None:
+                # 全部在使用中，暂时超出上限
+                return
+            self._stats['evicted_count'] += 1
+            self.logger.debug(f"浏览器上下文数量达到上限，关闭: {victim}")
+            await self._close_context(victim)
+
+    async def _close_context(self, user_data_dir: str):
+        """关闭并移除目录对应的上下文"""
+        entry = self._contexts.pop(user_data_dir, None)
+        if entry is None or entry.closed:
+            return
+        try:
+            await entry.context.close()
+        except Exception as e:
+            self.logger.error(f"关闭浏览器上下文失败: {e}")
+
+    async def _close_all(self):
+        """关闭所有上下文和Playwright驱动"""
+        for user_data_dir in list(self._contexts):
+            await self._close_context(user_data_dir)
+        if self._playwright is not None:
+            try:
+                await self._playwright.stop()
+            except Exception as e:
+                self.logger.error(f"停止Playwright驱动失败: {e}")
+            self._playwright = None
+
+    async def _run_in_pool(self, user_data_dir: str, headless: bool,
+                           func: Callable[[BrowserContext], Awaitable[T]], keep_open: bool) -> T:
+        """在池的事件循环中对目录的上下文执行操作"""
+        lock = self._dir_locks.setdefault(user_data_dir, asyncio.Lock())
+        async with lock:
+            entry = await self._acquire(user_data_dir, headless)
+            failed = False
+            try:
+                return await func(entry.context)
+            except Exception:
+                failed = True
+                raise
+            finally:
+                entry.in_use -= 1
+                entry.last_used = time.time()
+                # 出错的上下文状态不可信，关闭后下次重新启动
+                if failed or not keep_open:
+                    await self._close_context(user_data_dir)
+
+    # ---- 对外接口 ----
+
+    async def run(self, user_data_dir: str, func: Callable[[BrowserContext], Awaitable[T]],
+                  headless: bool = True, keep_open: bool = True) -> T:
+        """
+        使用目录对应的持久化上下文执行操作，可在任意事件循环中调用
+
+        Args:
+            user_data_dir: 用户数据目录
+            func: 接收BrowserContext的协程函数
+            headless: 是否无头模式
+            keep_open: 执行完成后是否保留上下文供下次复用
+
+        Returns:
+            func的返回值
+        """
+        loop = self._ensure_loop()
+        future = asyncio.run_coroutine_threadsafe(
+            self._run_in_pool(user_data_dir, headless, func, keep_open), loop
+        )
+        return await asyncio.wrap_future(future)
+
+    def shutdown(self, timeout: float = 10.0):
+        """关闭所有上下文并停止后台线程"""
+        with self._thread_lock:
+            thread, loop = self._thread, self._loop
+            self._thread = None
+        if thread is None or loop is None:
+            return
+        loop.call_soon_threadsafe(loop.stop)
+        thread.join(timeout=timeout)
+        self.logger.info("浏览器池已关闭")
+
+    def get_stats(self) -> Dict[str, Any]:
+        """获取浏览器池统计信息"""
+        return {
+            **self._stats,
+            'context_count': len(self._contexts),
+            'max_contexts': self.max_contexts,
+            'driver_running': self._playwright is not None
+        }
+
+
+# 全局浏览器池
+browser_pool = BrowserPool()
+atexit.register(browser_pool.shutdown)
@@ -0,0 +1,345 @@
+"""
+拼多多账号凭据主动刷新调度器
+
+按账号跟踪cookies和WebSocket token的使用时长，在过期前利用账号空闲时段主动刷新，
+刷新结果写入数据库并预热发送器缓存，避免在回复客户的路径上触发重新登录。
+"""
+
+import asyncio
+import atexit
+import random
+import threading
+import time
+from typing import Dict, Any, Optional, Tuple
+
+from config import config
+from database import db_manager
+from utils.logger import get_logger
+from Channel.pinduoduo.utils.API.get_token import AsyncGetToken
+from Channel.pinduoduo.utils.API.send_message import AsyncSendMessage
+from Channel.pinduoduo.utils.API.sender_cache import sender_cache
+from Channel.pinduoduo.utils.API.relogin_coordinator import relogin_coordinator
+
+
+# 默认刷新配置，可在config.json的credential_refresh中覆盖
+DEFAULT_REFRESH_CONFIG = {
+    "enabled": True,
+    "cookie_refresh_interval": 6 * 3600,  # cookies使用多久后主动刷新（秒）
+    "token_refresh_interval": 1800,       # token使用多久后主动刷新（秒）
+    "jitter_ratio": 0.2,                  # 刷新时间随机提前的比例，错开各账号
+    "quiet_period": 120,                  # 最近多少秒内没有消息才视为空闲
+    "max_defer": 1800,                    # 账号一直忙碌时最多推迟多久（秒）
+    "check_interval": 30,                 # 调度检查间隔（秒）
+    "max_concurrent_refreshes": 1         # 同时进行的cookies刷新数（每个都会启动浏览器）
+}
+
+
+class _AccountCredentials:
+    """单个账号的凭据状态"""
+
+    def __init__(self, channel_name: str, shop_id: str, user_id: str):
+        self.channel_name = channel_name
+        self.shop_id = shop_id
+        self.user_id = user_id
+        now = time.time()
+        self.cookies_refreshed_at = now
+        self.cookie_due_at = now
+        self.token: Optional[str] = None
+        self.token_fetched_at = 0.0
+        self.token_due_at = 0.0
+        self.last_activity = 0.0
+        self.refreshing = False
+
+    @property
+    def key(self) -> Tuple[str, str, str]:
+        return (self.channel_name, self.shop_id, self.user_id)
+
+
+class CredentialRefreshScheduler:
+    """账号凭据主动刷新调度器
+
+    功能特性：
+    - 跟踪每个在线账号的cookies和token使用时长
+    - 到期前在账号空闲时段（一段时间内没有消息）刷新，忙碌时推迟但不超过上限
+    - 每个账号的刷新时间带随机抖动，避免多个账号同时启动浏览器
+    - cookies刷新经由 relogin_coordinator，与请求触发的被动重新登录互斥
+    - 刷新后的cookies写入数据库，token缓存供WebSocket连接/重连直接使用
+
+    调度器运行在独立的后台线程和事件循环中，各账号线程只做登记和读取。
+    """
+
+    def __init__(self, refresh_config: Optional[Dict[str, Any]] = None):
+        """
+        初始化调度器
+
+        Args:
+            refresh_config: 刷新配置，未提供的项使用 DEFAULT_REFRESH_CONFIG
+        """
+        self.refresh_config = {**DEFAULT_REFRESH_CONFIG, **(refresh_config or {})}
+        self.logger = get_logger("CredentialRefreshScheduler")
+
+        self._accounts: Dict[Tuple[str, str, str], _AccountCredentials] = {}
+        self._lock = threading.Lock()
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._thread: Optional[threading.Thread] = None
+        self._stop_event: Optional[asyncio.Event] = None
+        self._stats = {
+            'cookie_refresh_count': 0,
+            'cookie_refresh_failed': 0,
+            'token_refresh_count': 0,
+            'token_refresh_failed': 0,
+            'deferred_count': 0
+        }
+
+        db_manager.add_account_listener(self._on_account_changed)
+
+    def _jittered(self, interval: float) -> float:
+        """按抖动比例随机提前刷新间隔"""
+        return interval * (1 - random.uniform(0, self.refresh_config["jitter_ratio"]))
+
+    # ---- 账号线程调用的接口 ----
+
+    def register_account(self, shop_id: str, user_id: str, channel_name: str = "pinduoduo"):
+        """
+        登记在线账号，开始跟踪其凭据
+
+        Args:
+            shop_id: 店铺ID
+            user_id: 用户ID
+            channel_name: 渠道名称
+        """
+        key = (channel_name, shop_id, user_id)
+        with self._lock:
+            state = self._accounts.get(key)
+            if state is None:
+                state = _AccountCredentials(channel_name, shop_id, user_id)
+                state.cookie_due_at = state.cookies_refreshed_at + self._jittered(
+                    self.refresh_config["cookie_refresh_interval"])
+                self._accounts[key] = state
+
+        if self.refresh_config["enabled"]:
+            self.start()
+
+    def unregister_account(self, shop_id: str, user_id: str, channel_name: str = "pinduoduo"):
+        """停止跟踪账号凭据"""
+        with self._lock:
+            self._accounts.pop((channel_name, shop_id, user_id), None)
+
+    def record_activity(self, shop_id: str, user_id: str, channel_name: str = "pinduoduo"):
+        """记录账号收到消息的时间，用于判断空闲时段"""
+        state = self._accounts.get((channel_name, shop_id, user_id))
+        if state is not None:
+            state.last_activity = time.time()
+
+    async def get_token(self, shop_id: str, user_id: str, channel_name: str = "pinduoduo",
+                        force_refresh: bool = False) -> Optional[str]:
+        """
+        获取WebSocket访问token，有未过期的缓存token时直接返回
+
+        Args:
+            shop_id: 店铺ID
+            user_id: 用户ID
+            channel_name: 渠道名称
+            force_refresh: 是否忽略缓存重新获取
+
+        Returns:
+            token字符串，获取失败返回None
+        """
+        state = self._accounts.get((channel_name, shop_id, user_id))
+        if (not force_refresh and state is not None and state.token
+                and time.time() < state.token_due_at):
+            return state.token
+
+        return await self._fetch_token(shop_id, user_id, channel_name)
+
+    async def _fetch_token(self, shop_id: str, user_id: str, channel_name: str) -> Optional[str]:
+        """获取新的token并写入缓存"""
+        token_request = sender_cache.get(AsyncGetToken, shop_id, user_id, channel_name=channel_name)
+        token = await token_request.get_token()
+
+        state = self._accounts.get((channel_name, shop_id, user_id))
+        with self._lock:
+            if token:
+                self._stats['token_refresh_count'] += 1
+            else:
+                self._stats['token_refresh_failed'] += 1
+        if token and state is not None:
+            now = time.time()
+            state.token = token
+            state.token_fetched_at = now
+            state.token_due_at = now + self._jittered(self.refresh_config["token_refresh_interval"])
+        return token
+
+    def _on_account_changed(self, channel_name: str, shop_id: str, user_id: str):
+        """账号在数据库中更新（如被动重新登录写入了新cookies）后重新计算刷新时间"""
+        state = self._accounts.get((channel_name, shop_id, user_id))
+        if state is None or state.refreshing:
+            return
+        now = time.time()
+        state.cookies_refreshed_at = now
+        state.cookie_due_at = now + self._jittered(self.refresh_config["cookie_refresh_interval"])
+        # token依赖cookies，下次使用时重新获取
+        state.token_due_at = 0.0
+
+    # ---- 后台调度 ----
+
+    def start(self):
+        """启动后台调度线程（重复调用无副作用）"""
+        with self._lock:
+            if self._thread is not None and self._thread.is_alive():
+                return
+            self._thread = threading.Thread(
+                target=self._run_loop, name="CredentialRefreshScheduler", daemon=True
+            )
+            self._thread.start()
+        self.logger.info("凭据刷新调度器已启动")
+
+    def stop(self, timeout: float = 5.0):
+        """停止后台调度线程，取消进行中的刷新（重复调用无副作用）"""
+        with self._lock:
+            thread, self._thread = self._thread, None
+        if thread is None:
+            return
+        loop = self._loop
+        if loop is not None and self._stop_event is not None:
+            loop.call_soon_threadsafe(self._stop_event.set)
+        thread.join(timeout=timeout)
+        self.logger.info("凭据刷新调度器已停止")
+
+    def _run_loop(self):
+        """调度线程入口"""
+        self._loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(self._loop)
+        try:
+            self._loop.run_until_complete(self._schedule())
+        except Exception as e:
+            self.logger.error(f"凭据刷新调度器异常退出: {e}")
+        finally:
+            self._loop.close()
+            self._loop = None
+
+    async def _schedule(self):
+        """周期性检查到期账号并刷新"""
+        self._stop_event = asyncio.Event()
+        semaphore = asyncio.Semaphore(self.refresh_config["max_concurrent_refreshes"])
+        tasks = set()
+
+        while not self._stop_event.is_set():
+            now = time.time()
+            with self._lock:
+                accounts = list(self._accounts.values())
+
+            for state in accounts:
+                if state.refreshing:
+                    continue
+                if now >= state.cookie_due_at and self._is_quiet_or_overdue(state, now):
+                    state.refreshing = True
+                    task = asyncio.create_task(self._refresh_cookies(state, semaphore))
+                elif state.token and now >= state.token_due_at:
+                    state.refreshing = True
+                    task = asyncio.create_task(self._refresh_token(state))
+                else:
+                    continue
+                tasks.add(task)
+                task.add_done_callback(tasks.discard)
+
+            try:
+                await asyncio.wait_for(self._stop_event.wait(), timeout=self.refresh_config["check_interval"])
+            except asyncio.TimeoutError:
+                pass
+
+        # 取消进行中的刷新并等待其结束，避免事件循环关闭时刷新还在半途
+        for task in list(tasks):
+            task.cancel()
+        if tasks:
+            await asyncio.gather(*tasks, return_exceptions=True)
+
+    def _is_quiet_or_overdue(self, state: _AccountCredentials, now: float) -> bool:
+        """账号空闲，或已推迟超过上限时返回True"""
+        if now - state.last_activity >= self.refresh_config["quiet_period"]:
+            return True
+        if now - state.cookie_due_at >= self.refresh_config["max_defer"]:
+            return True
+        with self._lock:
+            self._stats['deferred_count'] += 1
+        return False
+
+    async def _refresh_token(self, state: _AccountCredentials):
+        """刷新缓存的token"""
+        try:
+            await self._fetch_token(state.shop_id, state.user_id, state.channel_name)
+        except Exception as e:
+            self.logger.error(f"刷新账号 {state.user_id} token失败: {e}")
+        finally:
+            state.refreshing = False
+
+    async def _refresh_cookies(self, state: _AccountCredentials, semaphore: asyncio.Semaphore):
+        """刷新账号cookies，成功后刷新token并预热发送器缓存"""
+        try:
+            async with semaphore:
+                new_cookies = await relogin_coordinator.arun(
+                    state.key, lambda: self._fetch_cookies(state)
+                )
+
+            now = time.time()
+            if not new_cookies:
+                with self._lock:
+                    self._stats['cookie_refresh_failed'] += 1
+                # 刷新失败时稍后再试，请求路径上仍有被动重新登录兜底
+                state.cookie_due_at = now + self._jittered(self.refresh_config["max_defer"])
+                return
+
+            with self._lock:
+                self._stats['cookie_refresh_count'] += 1
+            state.cookies_refreshed_at = now
+            state.cookie_due_at = now + self._jittered(self.refresh_config["cookie_refresh_interval"])
+
+            # 预热发送器缓存，使下一条回复无需查询数据库
+            sender_cache.get(AsyncSendMessage, state.shop_id, state.user_id, channel_name=state.channel_name)
+            if state.token:
+                await self._fetch_token(state.shop_id, state.user_id, state.channel_name)
+
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            self.logger.error(f"刷新账号 {state.user_id} cookies失败: {e}")
+        finally:
+            state.refreshing = False
+
+    async def _fetch_cookies(self, state: _AccountCredentials):
+        """使用已保存的浏览器数据刷新cookies（不做完整登录），并写入数据库"""
+        account_info = db_manager.get_account(state.channel_name, state.shop_id, state.user_id)
+        if not account_info or not account_info.get('username'):
+            return None
+
+        # 延迟导入，避免加载Playwright拖慢启动
+        from Channel.pinduoduo.pdd_login import refresh_pdd_cookies
+
+        self.logger.info(f"主动刷新账号 {account_info['username']} 的cookies")
+        result = await refresh_pdd_cookies(account_info['username'], account_info.get('password'))
+        new_cookies = result.get('cookies') if isinstance(result, dict) else None
+        if new_cookies:
+            db_manager.update_account_cookies(state.channel_name, state.shop_id, state.user_id, new_cookies)
+        return new_cookies
+
+    def get_stats(self) -> Dict[str, Any]:
+        """获取调度器统计信息"""
+        now = time.time()
+        with self._lock:
+            return {
+                **self._stats,
+                'account_count': len(self._accounts),
+                'accounts': {
+                    f"{state.shop_id}-{state.user_id}": {
+                        'cookie_age': now - state.cookies_refreshed_at,
+                        'token_age': now - state.token_fetched_at if state.token else None,
+                        'next_cookie_refresh_in': state.cookie_due_at - now
+                    }
+                    for state in self._accounts.values()
+                }
+            }
+
+
+# 全局凭据刷新调度器
+credential_scheduler = CredentialRefreshScheduler(config.get("credential_refresh"))
+atexit.register(credential_scheduler.stop)
@@ -5,38 +5,103 @@
 支持多店铺管理、消息队列处理和自动重连机制。
 """
 from utils.logger import get_logger
-from bridge.context import Context, ContextType, ChannelType
+from bridge.context import Context, ContextType, ChannelType, RawFrame
 from Channel.pinduoduo.pdd_message import PDDChatMessage
 from Channel.channel import Channel
-from Channel.pinduoduo.utils.API.get_token import GetToken
+from Channel.pinduoduo.credential_scheduler import credential_scheduler
 from database import db_manager
 from utils.resource_manager import WebSocketResourceManager
 import websockets
 import json
 import asyncio
-from typing import Optional, Set
+import random
+import time
+from typing import Dict, Optional, Set, Tuple
 # 导入消息处理系统
-from Message import put_message
+from Message import put_message, message_queue_manager
 from config import config
+from utils.performance_monitor import record_metric
+
+# WebSocket断线重连默认配置（时间单位：秒）
+DEFAULT_RECONNECT_CONFIG = {
+    "initial_delay": 1.0,
+    "max_delay": 60.0,
+    "multiplier": 2.0,
+    "jitter_ratio": 0.3,
+    "initial_max_attempts": 3,
+    "open_timeout": 15.0
+}
+
+class _AccountConnection:
+    """PDDChannel中单个账号的连接状态
+
+    每个账号独立持有WebSocket、停止事件、处理任务集合和并发预算，
+    同一个PDDChannel实例可以同时承载多个账号。
+    """
+
+    def __init__(self, shop_id: str, user_id: str, username: str, max_concurrent_messages: int):
+        self.shop_id = shop_id
+        self.user_id = user_id
+        self.username = username
+        self.queue_name = f"pdd_{shop_id}"
+        self.ws = None
+        self.stop_event = asyncio.Event()
+        self.task: Optional[asyncio.Task] = None
+
+        # 账号级并发控制和任务管理
+        self.message_semaphore = asyncio.Semaphore(max_concurrent_messages)
+        self.processing_tasks: Set[asyncio.Task] = set()
+
+        # 断线重连状态
+        self.auth_failed = False
+        self.pending_downtime_since: Optional[float] = None
+        self.stats = {
+            'connect_count': 0,
+            'reconnect_count': 0,
+            'total_downtime': 0.0,
+            'last_downtime': 0.0
+        }
+
+    @property
+    def label(self) -> str:
+        return f"{self.shop_id}-{self.username}"
+
 
 class PDDChannel(Channel):
+    """拼多多渠道连接管理器
+
+    按 (shop_id, user_id) 维护账号连接注册表，start_account/stop_account 操作注册表中的连接，
+    一个实例（一个事件循环）即可承载多个账号。同一店铺的账号共享 pdd_{shop_id} 消息队列和消费者，
+    店铺的最后一个账号停止时才停止消费者。
+    """
+
     def __init__(self, max_concurrent_messages: int = 50):
+        """
+        Args:
+            max_concurrent_messages: 每个账号同时处理的WebSocket消息数上限
+        """
         super().__init__()
         self.channel_name = "pinduoduo"
         self.logger = get_logger("PDDChannel")
         self.base_url = "wss://m-ws.pinduoduo.com/"
-        self.ws = None
-        self._stop_event = None  # 停止事件
         self.businessHours = config.get("businessHours")
-
-        # 性能优化：并发控制和任务管理
         self.max_concurrent_messages = max_concurrent_messages
-        self.message_semaphore = asyncio.Semaphore(max_concurrent_messages)
-        self.processing_tasks: Set[asyncio.Task] = set()
+
+        # 账号连接注册表
+        self._connections: Dict[Tuple[str, str], _AccountConnection] = {}
 
         # 资源管理
         self.resource_manager = WebSocketResourceManager()
 
+        # 断线重连
+        self.reconnect_config = {**DEFAULT_RECONNECT_CONFIG, **(config.get("ws_reconnect") or {})}
+
+        # 消息队列背压时暂停接收的最长时间（秒）
+        queue_config = config.get("message_queue") or {}
+        self.backpressure_max_wait = queue_config.get("backpressure_max_wait", 5.0)
+        # Context中raw_data的保存方式：keep（解析后的字典）/ lazy（原始文本，访问时解析）/ drop（不保存）
+        self.raw_data_mode = queue_config.get("raw_data", "lazy")
+
     async def start_account(self, shop_id: str, user_id: str, on_success: callable, on_failure: callable) -> None:
         """
         启动指定店铺下账号
@@ -45,6 +110,10 @@ class PDDChannel(Channel):
         :param on_success: 连接成功回调
         :param on_failure: 连接失败回调
         """
+        if (shop_id, user_id) in self._connections:
+            self.logger.warning(f"店铺 {shop_id} 账号 {user_id} 已在运行")
+            return
+
         account_info = db_manager.get_account(self.channel_name, shop_id, user_id)
         if not account_info:
             error_msg = f"账号 {user_id} 在数据库中不存在"
@@ -56,94 +125,181 @@ class PDDChannel(Channel):
         # 启动账号
         await self.init(shop_id, user_id, username, on_success, on_failure)
 
-    async def stop_account(self, shop_id: str, user_id: str) -> None:
+    async def stop_account(self, shop_id: str, user_id: str, timeout: float = 5.0) -> None:
         """
         停止指定店铺下账号
         :param shop_id: 店铺ID
         :param user_id: 用户ID
+        :param timeout: 等待连接任务结束的最长时间（秒）
         """
+        conn = self._connections.get((shop_id, user_id))
+        if conn is None:
+            self.logger.warning(f"店铺 {shop_id} 账号 {user_id} 未在运行，无法停止")
+            return
+
         try:
-            # 检查账号是否存在
-            account_info = db_manager.get_account(self.channel_name, shop_id, user_id)
-            if not account_info:
-                self.logger.warning(f"账号 {user_id} 不存在，无法停止")
-                return
-            
-            username = account_info.get("username", user_id)
-            self.logger.info(f"正在停止店铺 {shop_id} 账号 {username}")
-            
+            self.logger.info(f"正在停止店铺 {shop_id} 账号 {conn.username}")
+
+            # 先设置停止事件，避免关闭连接后被重连循环重新连上
+            conn.stop_event.set()
+
             # 关闭WebSocket连接
-            if self.ws and not self.ws.closed:
-                await self.ws.close()
-                self.logger.info(f"已关闭店铺 {shop_id} 账号 {username} 的WebSocket连接")
-            else:
-                self.logger.warning(f"店铺 {shop_id} 账号 {username} 的WebSocket连接已经关闭或不存在")
-            
-            # 停止消息消费者
-            queue_name = f"pdd_{shop_id}"
-            await self._cleanup_resources(queue_name)
-            
-            self.logger.info(f"成功停止店铺 {shop_id} 账号 {username}")
-            
+            if conn.ws is not None:
+                await conn.ws.close()
+                self.logger.info(f"已关闭店铺 {shop_id} 账号 {conn.username} 的WebSocket连接")
+
+            # 等待连接任务完成资源清理
+            if conn.task is not None and conn.task is not asyncio.current_task():
+                done, _ = await asyncio.wait({conn.task}, timeout=timeout)
+                if not done:
+                    self.logger.warning(f"店铺 {shop_id} 账号 {conn.username} 未在 {timeout} 秒内停止，强制取消")
+                    conn.task.cancel()
+                    await asyncio.gather(conn.task, return_exceptions=True)
+
+            self.logger.info(f"成功停止店铺 {shop_id} 账号 {conn.username}")
+
         except Exception as e:
             self.logger.error(f"停止店铺 {shop_id} 账号 {user_id} 时发生错误: {str(e)}")
 
-
     async def init(self, shop_id: str, user_id: str, username: str, on_success: callable, on_failure: callable):
         """
         初始化WebSocket连接和消息处理系统
+
+        连接断开后按指数退避（带抖动）自动重连，消息消费者和各用户的处理器在重连期间保持运行；
+        只有握手被拒绝或认证失败时才强制刷新token，否则复用调度器缓存的token。
+        首次连接在 initial_max_attempts 次尝试内都失败时调用 on_failure 并退出。
         """
+        conn = _AccountConnection(shop_id, user_id, username, self.max_concurrent_messages)
+        conn.task = asyncio.current_task()
+        self._connections[(shop_id, user_id)] = conn
+
+        attempt = 0
+        connected_once = False
+        force_refresh = False
         try:
-            # 创建停止事件
-            self._stop_event = asyncio.Event()
-            
-            # 获取访问令牌
-            token = GetToken(shop_id, user_id)
-            access_token = token.get_token()
-            
-            # 设置队列名称
-            queue_name = f"pdd_{shop_id}"
-            
-            # 初始化消息消费者和处理器（只创建一次）
-            await self._setup_message_consumer(queue_name)
-            
-            # 构建WebSocket连接URL
-            params = {
-                "access_token": access_token,
-                "role": "mall_cs",
-                "client": "web",
-                "version": "202506091557"
-            }
-            query = "&".join([f"{k}={v}" for k, v in params.items()])
-            full_url = f"{self.base_url}?{query}"
-            
-            self.logger.debug(f"正在连接到拼多多WebSocket: {shop_id}-{username}")
-            
-            # 建立WebSocket连接
-            async with websockets.connect(
-                full_url,
-                ping_interval=20,
-                ping_timeout=20
-            ) as websocket:
-                self.ws = websocket
-                # 注册WebSocket连接到资源管理器
-                self.resource_manager.register_websocket(
-                    websocket,
-                    f"PDD WebSocket ({shop_id}-{username})"
-                )
+            # 登记账号凭据的主动刷新
+            credential_scheduler.register_account(shop_id, user_id, self.channel_name)
+
+            # 初始化消息消费者和处理器（同店铺只创建一次，跨重连保持）
+            await self._setup_message_consumer(conn.queue_name)
+
+            while not conn.stop_event.is_set():
+                error = None
+                connected = False
+                try:
+                    # 优先使用调度器缓存的token，认证失败后才强制刷新
+                    access_token = await credential_scheduler.get_token(
+                        shop_id, user_id, self.channel_name, force_refresh=force_refresh
+                    )
+                    if not access_token:
+                        raise RuntimeError("获取访问令牌失败")
+                    force_refresh = False
+
+                    connected = await self._run_connection(
+                        conn, access_token, on_connected=None if connected_once else on_success
+                    )
+                    if connected:
+                        connected_once = True
+                except websockets.exceptions.InvalidHandshake as e:
+                    # 握手被拒绝通常是token失效，下次重连前强制刷新
+                    error = f"WebSocket握手失败: {e}"
+                    force_refresh = True
+                except websockets.exceptions.ConnectionClosed as e:
+                    error = f"WebSocket连接已关闭: {e}"
+                except (OSError, asyncio.TimeoutError, RuntimeError) as e:
+                    error = f"WebSocket连接错误: {e}"
+
+                if conn.auth_failed:
+                    conn.auth_failed = False
+                    force_refresh = True
+
+                if conn.stop_event.is_set():
+                    break
 
-                self.logger.debug(f"WebSocket连接已建立: {shop_id}-{username}")
+                if connected:
+                    # 连接建立过，重新开始退避计数并记录断线时间
+                    attempt = 0
+                    conn.pending_downtime_since = time.time()
+                    self.logger.warning(f"WebSocket连接断开，准备重连: {conn.label}"
+                                        + (f", 错误: {error}" if error else ""))
+                else:
+                    attempt += 1
+                    self.logger.warning(f"WebSocket连接失败（第{attempt}次）: {conn.label}, 错误: {error}")
+                    if not connected_once and attempt >= self.reconnect_config["initial_max_attempts"]:
+                        on_failure(error or "WebSocket连接失败")
+                        return
+
+                conn.stats['reconnect_count'] += 1
+                record_metric("pdd_ws_reconnect", 1, "count", {"shop_id": shop_id, "user_id": user_id})
+
+                delay = self._reconnect_delay(attempt)
+                self.logger.info(f"{delay:.1f}秒后重连: {conn.label}")
+                try:
+                    await asyncio.wait_for(conn.stop_event.wait(), timeout=delay)
+                except asyncio.TimeoutError:
+                    pass
+
+        except Exception as e:
+            self.logger.error(f"WebSocket连接错误: {conn.label}, 错误: {str(e)}")
+            on_failure(f"WebSocket连接错误: {e}")
+        finally:
+            # 清理资源
+            credential_scheduler.unregister_account(shop_id, user_id, self.channel_name)
+            await self._cleanup_connection(conn)
+
+    def _reconnect_delay(self, attempt: int) -> float:
+        """计算第attempt次重连前的等待时间（指数退避 + 抖动）"""
+        cfg = self.reconnect_config
+        delay = min(cfg["max_delay"], cfg["initial_delay"] * (cfg["multiplier"] ** max(0, attempt - 1)))
+        jitter = delay * cfg["jitter_ratio"]
+        return max(0.1, delay + random.uniform(-jitter, jitter))
+
+    async def _run_connection(self, conn: _AccountConnection, access_token: str,
+                              on_connected: Optional[callable] = None) -> bool:
+        """
+        建立一次WebSocket连接并接收消息，直到连接断开或收到停止信号
+
+        Returns:
+            连接是否成功建立过
+        """
+        # 构建WebSocket连接URL
+        params = {
+            "access_token": access_token,
+            "role": "mall_cs",
+            "client": "web",
+            "version": "202506091557"
+        }
+        query = "&".join([f"{k}={v}" for k, v in params.items()])
+        full_url = f"{self.base_url}?{query}"
+
+        self.logger.debug(f"正在连接到拼多多WebSocket: {conn.label}")
+
+        # 建立WebSocket连接
+        async with websockets.connect(
+            full_url,
+            ping_interval=20,
+            ping_timeout=20,
+            open_timeout=self.reconnect_config["open_timeout"]
+        ) as websocket:
+            conn.ws = websocket
+            # 注册WebSocket连接到资源管理器
+            self.resource_manager.register_websocket(
+                websocket,
+                f"PDD WebSocket ({conn.label})"
+            )
+            try:
+                self.logger.debug(f"WebSocket连接已建立: {conn.label}")
+                self._record_connected(conn)
 
-                # 连接成功，调用成功回调
-                on_success()
+                # 首次连接成功，调用成功回调
+                if on_connected:
+                    on_connected()
 
                 # 创建消息接收任务
-                message_task = asyncio.create_task(
-                    self._message_loop(websocket, shop_id, user_id, username, queue_name)
-                )
+                message_task = asyncio.create_task(self._message_loop(conn, websocket))
 
                 # 等待停止事件或消息任务完成
-                stop_task = asyncio.create_task(self._stop_event.wait())
+                stop_task = asyncio.create_task(conn.stop_event.wait())
 
                 try:
                     done, pending = await asyncio.wait(
@@ -160,69 +316,92 @@ class PDDChannel(Channel):
                             pass
 
                     if stop_task in done:
-                        self.logger.debug(f"收到停止信号: {shop_id}-{username}")
+                        self.logger.debug(f"收到停止信号: {conn.label}")
                     else:
-                        self.logger.debug(f"消息循环自然结束: {shop_id}-{username}")
+                        self.logger.debug(f"消息循环结束: {conn.label}")
 
                 except asyncio.CancelledError:
-                    self.logger.debug(f"WebSocket任务被取消: {shop_id}-{username}")
+                    self.logger.debug(f"WebSocket任务被取消: {conn.label}")
                     message_task.cancel()
-                    try:
-                        await message_task
-                    except asyncio.CancelledError:
-                        pass
-                    
-        except websockets.exceptions.ConnectionClosed as e:
-            self.logger.warning(f"WebSocket连接已关闭: {shop_id}-{username}, 错误: {str(e)}")
-            on_failure(f"WebSocket连接已关闭: {e}")
-        except Exception as e:
-            self.logger.error(f"WebSocket连接错误: {shop_id}-{username}, 错误: {str(e)}")
-            on_failure(f"WebSocket连接错误: {e}")
-        finally:
-            # 清理资源
-            await self._cleanup_resources(f"pdd_{shop_id}")
-    
-    async def _message_loop(self, websocket, shop_id: str, user_id: str, username: str, queue_name: str):
+                    stop_task.cancel()
+                    await asyncio.gather(message_task, stop_task, return_exceptions=True)
+                    raise
+            finally:
+                self.resource_manager.remove_resource(websocket)
+                conn.ws = None
+        return True
+
+    def _record_connected(self, conn: _AccountConnection):
+        """记录连接建立，重连成功时上报断线时长"""
+        conn.stats['connect_count'] += 1
+        since = conn.pending_downtime_since
+        if since is not None:
+            downtime = time.time() - since
+            conn.pending_downtime_since = None
+            conn.stats['total_downtime'] += downtime
+            conn.stats['last_downtime'] = downtime
+            record_metric("pdd_ws_downtime", downtime, "s", {"shop_id": conn.shop_id, "user_id": conn.user_id})
+            self.logger.info(f"WebSocket已重连: {conn.label}, 断线 {downtime:.1f} 秒")
+
+    def get_connection_stats(self) -> dict:
+        """获取各账号的连接与重连统计信息"""
+        return {
+            'account_count': len(self._connections),
+            'accounts': {
+                f"{shop_id}-{user_id}": {
+                    **conn.stats,
+                    'connected': conn.ws is not None,
+                    'processing_tasks': len(conn.processing_tasks)
+                }
+                for (shop_id, user_id), conn in self._connections.items()
+            }
+        }
+
+    async def _message_loop(self, conn: _AccountConnection, websocket):
         """消息接收循环 - 优化版本支持并发处理"""
         try:
             async for message in websocket:
-                if self._stop_event and self._stop_event.is_set():
-                    self.logger.info(f"停止事件已设置，退出消息循环: {shop_id}-{username}")
+                if conn.stop_event.is_set():
+                    self.logger.info(f"停止事件已设置，退出消息循环: {conn.label}")
                     break
 
+                # 记录账号活跃时间，凭据刷新会避开忙碌时段
+                credential_scheduler.record_activity(conn.shop_id, conn.user_id, self.channel_name)
+
                 # 创建并发处理任务
-                task = asyncio.create_task(
-                    self._process_websocket_message_concurrent(
-                        message, shop_id, user_id, username, queue_name
-                    )
-                )
+                task = asyncio.create_task(self._process_websocket_message_concurrent(conn, message))
 
                 # 添加到任务跟踪集合
-                self.processing_tasks.add(task)
-                task.add_done_callback(self.processing_tasks.discard)
+                conn.processing_tasks.add(task)
+                task.add_done_callback(conn.processing_tasks.discard)
+
+                # 队列积压超过高水位时暂停读取，等待回落到低水位（最长backpressure_max_wait秒）
+                queue = message_queue_manager.get_queue(conn.queue_name)
+                if queue is not None and queue.backpressure:
+                    await queue.wait_for_capacity(self.backpressure_max_wait)
 
         except websockets.exceptions.ConnectionClosed:
-            self.logger.warning(f"WebSocket连接在消息循环中关闭: {shop_id}-{username}")
+            self.logger.warning(f"WebSocket连接在消息循环中关闭: {conn.label}")
         except Exception as e:
-            self.logger.error(f"消息循环错误: {shop_id}-{username}, 错误: {str(e)}")
+            self.logger.error(f"消息循环错误: {conn.label}, 错误: {str(e)}")
 
-    async def _process_websocket_message_concurrent(
-        self, message: str, shop_id: str, user_id: str, username: str, queue_name: str
-    ):
-        """并发处理WebSocket消息"""
-        async with self.message_semaphore:
+    async def _process_websocket_message_concurrent(self, conn: _AccountConnection, message: str):
+        """并发处理WebSocket消息（受账号级并发预算限制）"""
+        async with conn.message_semaphore:
             try:
-                await self._process_websocket_message(message, shop_id, user_id, username, queue_name)
+                await self._process_websocket_message(
+                    message, conn.shop_id, conn.user_id, conn.username, conn.queue_name
+                )
             except Exception as e:
                 self.logger.error(f"并发处理消息失败: {e}")
 
-    async def cleanup_processing_tasks(self):
-        """清理所有处理任务"""
-        if not self.processing_tasks:
+    async def _cleanup_processing_tasks(self, conn: _AccountConnection):
+        """清理账号的所有处理任务"""
+        if not conn.processing_tasks:
             return
 
-        self.logger.info(f"清理 {len(self.processing_tasks)} 个处理任务")
-        for task in self.processing_tasks:
+        self.logger.info(f"清理 {len(conn.processing_tasks)} 个处理任务: {conn.label}")
+        for task in list(conn.processing_tasks):
             if not task.done():
                 task.cancel()
                 try:
@@ -232,12 +411,22 @@ class PDDChannel(Channel):
                 except Exception as e:
                     self.logger.error(f"清理任务失败: {e}")
 
-        self.processing_tasks.clear()
-    
-    def request_stop(self):
-        """请求停止WebSocket连接"""
-        if self._stop_event:
-            self._stop_event.set()
+        conn.processing_tasks.clear()
+
+    def request_stop(self, shop_id: Optional[str] = None, user_id: Optional[str] = None):
+        """
+        请求停止账号的WebSocket连接（可在同一事件循环中同步调用）
+
+        Args:
+            shop_id: 店铺ID，为None时停止所有账号
+            user_id: 用户ID，为None时停止该店铺下所有账号
+        """
+        for (conn_shop_id, conn_user_id), conn in list(self._connections.items()):
+            if shop_id is not None and conn_shop_id != shop_id:
+                continue
+            if user_id is not None and conn_user_id != user_id:
+                continue
+            conn.stop_event.set()
     
     async def _setup_message_consumer(self, queue_name: str):
         """
@@ -250,7 +439,12 @@ class PDDChannel(Channel):
             # 检查消费者是否已存在
             existing_consumer = message_consumer_manager.get_consumer(queue_name)
             if existing_consumer:
-                self.logger.info(f"消费者 {queue_name} 已存在，跳过创建")
+                # 账号停止后再次启动时消费者已停止，需要重新启动以处理积压（含重放）的消息
+                if queue_name not in message_consumer_manager.get_running_consumers():
+                    await message_consumer_manager.start_consumer(queue_name)
+                    self.logger.debug(f"消息消费者已重新启动: {queue_name}")
+                else:
+                    self.logger.info(f"消费者 {queue_name} 已存在，跳过创建")
                 return
             
             # 创建新的消费者
@@ -299,7 +493,7 @@ class PDDChannel(Channel):
             self.logger.debug(f"消息详情: {json.dumps(message_data, indent=2, ensure_ascii=False)}")
             
             # 转换为Context格式
-            context = self._convert_to_context(pdd_message, shop_id, user_id, username)
+            context = self._convert_to_context(pdd_message, shop_id, user_id, username, raw_message=message)
             if context:
                 # 根据消息类型决定处理方式
                 if self._should_process_immediately(context):
@@ -377,8 +571,9 @@ class PDDChannel(Channel):
         username = context.kwargs.get("username")
         recipient_uid = context.kwargs.get('from_uid')
         try:
-            from Channel.pinduoduo.utils.API.send_message import SendMessage
-            send_message = SendMessage(shop_id, user_id)
+            from Channel.pinduoduo.utils.API.send_message import AsyncSendMessage
+            from Channel.pinduoduo.utils.API.sender_cache import sender_cache
+            send_message = sender_cache.get(AsyncSendMessage, shop_id, user_id)
             if context.type == ContextType.AUTH:
                 # 认证消息处理
                 auth_info = context.content
@@ -387,12 +582,18 @@ class PDDChannel(Channel):
                     if result == 'ok':
                         self.logger.info(f"{username}认证成功")
                     else:
-                        self.logger.warning(f"{username}认证失败")
+                        self.logger.warning(f"{username}认证失败，刷新token后重连")
+                        # 断开当前连接，由重连循环强制刷新token后重新连接
+                        conn = self._connections.get((shop_id, user_id))
+                        if conn is not None:
+                            conn.auth_failed = True
+                            if conn.ws is not None:
+                                await conn.ws.close()
                         
             elif context.type == ContextType.WITHDRAW:
                 # 撤回消息处理
                 self.logger.info(f"收到撤回消息: {context.content}")
-                send_message.send_text(recipient_uid,"[玫瑰]")
+                await send_message.send_text(recipient_uid,"[玫瑰]")
 
             elif context.type == ContextType.SYSTEM_STATUS:
                 # 系统状态消息
@@ -417,34 +618,38 @@ class PDDChannel(Channel):
             elif context.type == ContextType.TRANSFER:
                 # 转接消息
                 self.logger.info(f"转接消息: {context.content}")
-                send_message.send_text(recipient_uid,"[玫瑰]")
+                await send_message.send_text(recipient_uid,"[玫瑰]")
                 
         except Exception as e:
             self.logger.error(f"立即处理消息失败: {e}")
     
-    async def _cleanup_resources(self, queue_name: str):
+    async def _cleanup_connection(self, conn: _AccountConnection):
         """
-        清理资源 - 优化版本支持完整资源管理
+        清理账号连接资源，店铺的最后一个账号停止时才停止共享的消息消费者
         """
         try:
             # 清理处理任务
-            await self.cleanup_processing_tasks()
+            await self._cleanup_processing_tasks(conn)
 
-            # 清理WebSocket资源
-            await self.resource_manager.cleanup_all()
+            # 从注册表移除
+            if self._connections.get((conn.shop_id, conn.user_id)) is conn:
+                del self._connections[(conn.shop_id, conn.user_id)]
+
+            # 同店铺还有其他账号在运行时保留消费者
+            if any(other.queue_name == conn.queue_name for other in self._connections.values()):
+                self.logger.debug(f"店铺仍有其他账号在运行，保留消息消费者: {conn.queue_name}")
+                return
 
             # 停止消息消费者
             from Message.message_consumer import message_consumer_manager
-            await message_consumer_manager.stop_consumer(queue_name)
-            self.logger.debug(f"已停止消息消费者: {queue_name}")
-
-            # 清理WebSocket连接引用
-            self.ws = None
+            await message_consumer_manager.stop_consumer(conn.queue_name)
+            self.logger.debug(f"已停止消息消费者: {conn.queue_name}")
 
         except Exception as e:
             self.logger.error(f"清理资源失败: {e}")  
     
-    def _convert_to_context(self, pdd_message: PDDChatMessage, shop_id: str, user_id: str, username: str) -> Optional[Context]:
+    def _convert_to_context(self, pdd_message: PDDChatMessage, shop_id: str, user_id: str, username: str,
+                            raw_message: Optional[str] = None) -> Optional[Context]:
         """
         将拼多多消息转换为Context格式
         
@@ -453,6 +658,7 @@ class PDDChannel(Channel):
             shop_id: 店铺ID
             user_id: 用户ID
             username: 用户名
+            raw_message: 收到的原始消息文本，raw_data_mode为lazy时保存它代替解析后的字典
             
         Returns:
             Context对象或None
@@ -473,9 +679,12 @@ class PDDChannel(Channel):
                 'user_msg_type': pdd_message.user_msg_type,
                 'shop_id': shop_id,
                 'user_id': user_id,
-                'username': username,
-                'raw_data': pdd_message.raw_data
+                'username': username
             }
+            if self.raw_data_mode == "keep" or (self.raw_data_mode == "lazy" and raw_message is None):
+                kwargs['raw_data'] = pdd_message.raw_data
+            elif self.raw_data_mode == "lazy":
+                kwargs['raw_data'] = RawFrame(raw_message)
             
             # 创建Context对象
             context = Context(
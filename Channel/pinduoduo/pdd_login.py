@@ -10,10 +10,23 @@ import asyncio
 from typing import Optional, Dict, Any, Tuple
 from utils.logger import get_logger
 from database import db_manager
-from playwright.async_api import async_playwright
+from playwright.async_api import TimeoutError as PlaywrightTimeoutError
+from Channel.pinduoduo.browser_pool import browser_pool
 from Channel.pinduoduo.utils.API.get_shop_info import GetShopInfo
 from Channel.pinduoduo.utils.API.get_user_info import GetUserInfo
 
+def _user_data_dir(name: str) -> str:
+    """账号的浏览器用户数据目录，登录和刷新cookies共用"""
+    return f"./user_data/{name}"
+
+
+async def _cookies_json(context) -> str:
+    """将playwright格式的cookies列表转换为字典格式的JSON字符串"""
+    cookies_list = await context.cookies()
+    cookies_dict = {cookie['name']: cookie['value'] for cookie in cookies_list}
+    return json.dumps(cookies_dict)
+
+
 class PDDLogin():
     def __init__(self,name,password):
         self.logger = get_logger("Pdd_login")
@@ -30,61 +43,40 @@ class PDDLogin():
 
         """
         try:
-            # 启动Playwright
-            playwright = await async_playwright().start()
-            
             # 创建独立的用户数据目录，避免多实例冲突
-            user_data_dir = f"./user_data/{(self.name)}"
+            user_data_dir = _user_data_dir(self.name)
             self.logger.debug(f"使用用户数据目录: {user_data_dir}")
             
-            # 使用持久化上下文，自动处理用户数据目录
-            context = await playwright.chromium.launch_persistent_context(
-                user_data_dir,
-                headless=False,
-                args=[
-                    '--disable-gpu',
-                    '--no-sandbox',
-                    '--disable-dev-shm-usage',
-                    '--disable-blink-features=AutomationControlled',
-                    '--disable-notifications',  # 禁用通知
-                    '--disable-web-security',
-                    '--disable-features=VizDisplayCompositor'
-                ]
-            )
-            
-            page = await context.new_page()
-            
-            # 访问登录页面
-            await page.goto(self.base_url)
-            
-            # 点击账号密码登录
-            await page.click("div.Common_item__3diIn:has-text('账号登录')")
-            
-            # 等待页面加载
-            await page.wait_for_selector("input[type='text']")
-            
-            # 输入店铺名
-            await page.fill("input[type='text']", self.name)
-            
-            # 输入密码
-            await page.fill("input[type='password']", self.password)
-            
-            # 点击登录按钮
-            await page.click("button:has-text('登录')")
-            
-            # 等待页面 title等于 拼多多 商家后台，首页或者订单查询
-            await page.wait_for_function("() => document.title === '拼多多 商家后台' || document.title === '首页' || document.title === '订单查询'", timeout=30000)
-            
-            # 获取cookies并转换为字典格式
-            cookies_list = await context.cookies()
-            # 将playwright格式的cookies列表转换为字典格式
-            cookies_dict = {cookie['name']: cookie['value'] for cookie in cookies_list}
-            cookies_json = json.dumps(cookies_dict)
-            # 关闭浏览器上下文
-            await context.close()
-            await playwright.stop()
-                
-            return cookies_json
+            async def _login(context):
+                page = await context.new_page()
+                try:
+                    # 访问登录页面
+                    await page.goto(self.base_url)
+                    
+                    # 点击账号密码登录
+                    await page.click("div.Common_item__3diIn:has-text('账号登录')")
+                    
+                    # 等待页面加载
+                    await page.wait_for_selector("input[type='text']")
+                    
+                    # 输入店铺名
+                    await page.fill("input[type='text']", self.name)
+                    
+                    # 输入密码
+                    await page.fill("input[type='password']", self.password)
+                    
+                    # 点击登录按钮
+                    await page.click("button:has-text('登录')")
+                    
+                    # 等待页面 title等于 拼多多 商家后台，首页或者订单查询
+                    await page.wait_for_function("() => document.title === '拼多多 商家后台' || document.title === '首页' || document.title === '订单查询'", timeout=30000)
+                    
+                    return await _cookies_json(context)
+                finally:
+                    await page.close()
+            
+            # 有头登录窗口用完即关，后续刷新使用无头上下文
+            return await browser_pool.run(user_data_dir, _login, headless=False, keep_open=False)
             
         except Exception as e:
             self.logger.error(f"登录失败: {str(e)}")
@@ -93,71 +85,49 @@ class PDDLogin():
     async def refresh_cookies(self):
         """重新获取cookies，使用已保存的用户数据，无需再次登录
         
+        复用浏览器池中已打开的无头上下文，只新开一个页面验证登录状态。
+        
         Returns:
             str: cookies的JSON字符串，如果失败返回False
         """
         try:
-            # 启动Playwright
-            playwright = await async_playwright().start()
-            
-            # 使用相同的用户数据目录
-            user_data_dir = f"./user_data/{hash(self.name)}"
+            # 使用与登录相同的用户数据目录
+            user_data_dir = _user_data_dir(self.name)
             self.logger.debug(f"使用用户数据目录刷新cookies: {user_data_dir}")
             
             # 检查用户数据目录是否存在
             if not os.path.exists(user_data_dir):
                 self.logger.error(f"用户数据目录不存在: {user_data_dir}，请先登录")
-                await playwright.stop()
-                return False
-            
-            # 使用持久化上下文，自动加载用户数据
-            context = await playwright.chromium.launch_persistent_context(
-                user_data_dir,
-                headless=True,  # 刷新cookies时可以使用无头模式
-                args=[
-                    '--disable-gpu',
-                    '--no-sandbox',
-                    '--disable-dev-shm-usage',
-                    '--disable-blink-features=AutomationControlled',
-                    '--disable-notifications',
-                    '--disable-web-security',
-                    '--disable-features=VizDisplayCompositor'
-                ]
-            )
-            
-            page = await context.new_page()
-            
-            # 访问拼多多商家后台首页，验证登录状态
-            await page.goto("https://mms.pinduoduo.com/home/")
-            
-            # 等待页面加载，检查是否需要重新登录
-            try:
-                # 如果页面跳转到登录页面，说明登录状态已失效
-                await page.wait_for_url("**/login**", timeout=5000)
-                self.logger.warning("登录状态已失效，需要重新登录")
-                await context.close()
-                await playwright.stop()
                 return False
-            except:
-                # 没有跳转到登录页面，说明登录状态有效
-                pass
-            
-            # 获取最新的cookies
-            cookies_list = await context.cookies()
-            cookies_dict = {cookie['name']: cookie['value'] for cookie in cookies_list}
-            cookies_json = json.dumps(cookies_dict)
-            
-            # 关闭浏览器上下文
-            await context.close()
-            await playwright.stop()
             
-            self.logger.info(f"成功刷新账号 '{self.name}' 的cookies")
+            async def _refresh(context):
+                page = await context.new_page()
+                try:
+                    # 访问拼多多商家后台首页，验证登录状态
+                    await page.goto("https://mms.pinduoduo.com/home/")
+                    
+                    # 等待页面加载，检查是否需要重新登录
+                    try:
+                        # 如果页面跳转到登录页面，说明登录状态已失效
+                        await page.wait_for_url("**/login**", timeout=5000)
+                        self.logger.warning("登录状态已失效，需要重新登录")
+                        return False
+                    except PlaywrightTimeoutError:
+                        # 没有跳转到登录页面，说明登录状态有效
+                        pass
+                    
+                    # 获取最新的cookies
+                    return await _cookies_json(context)
+                finally:
+                    await page.close()
+            
+            cookies_json = await browser_pool.run(user_data_dir, _refresh, headless=True)
+            if cookies_json:
+                self.logger.info(f"成功刷新账号 '{self.name}' 的cookies")
             return cookies_json
             
         except Exception as e:
             self.logger.error(f"刷新cookies失败: {str(e)}")
-            if 'playwright' in locals():
-                await playwright.stop()
             return False
 
     def Set_user_info(self,cookies_json):
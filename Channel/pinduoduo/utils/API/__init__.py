@@ -3,17 +3,30 @@
 统一管理所有API请求类
 """
 
+from .session_pool import SessionPool, session_pool
+from .relogin_coordinator import ReloginCoordinator, relogin_coordinator
 from .base_request import BaseRequest
-from .get_token import GetToken
-from .send_message import SendMessage
+from .async_base_request import AsyncBaseRequest
+from .get_token import GetToken, AsyncGetToken
+from .send_message import SendMessage, AsyncSendMessage
+from .sender_cache import SenderCache, sender_cache
 from .get_user_info import GetUserInfo
 from .get_shop_info import GetShopInfo
 from .Set_up_online import AccountMonitor
 
 __all__ = [
+    'SessionPool',
+    'session_pool',
+    'ReloginCoordinator',
+    'relogin_coordinator',
     'BaseRequest',
+    'AsyncBaseRequest',
     'GetToken',
+    'AsyncGetToken',
     'SendMessage', 
+    'AsyncSendMessage',
+    'SenderCache',
+    'sender_cache',
     'GetUserInfo',
     'GetShopInfo',
     'AccountMonitor'
@@ -0,0 +1,325 @@
+import asyncio
+import json
+import importlib
+from typing import Dict, Any, Optional, Union, Callable, Awaitable
+
+import httpx
+
+from .base_request import BaseRequest
+from .session_pool import get_async_session_pool
+from .relogin_coordinator import relogin_coordinator
+
+
+class AsyncBaseRequest(BaseRequest):
+    """
+    异步API请求基类，基于httpx.AsyncClient
+
+    与 BaseRequest 共享账户信息加载、会话过期检测、退避计算和响应处理逻辑，
+    区别在于请求、重试等待和重新登录都在事件循环内以协程方式执行，
+    不会阻塞同一事件循环上的其他会话。
+    """
+
+    def _get_client(self) -> httpx.AsyncClient:
+        """从当前事件循环的异步会话池获取账号客户端"""
+        return get_async_session_pool().get_client(self._session_key(), self.cookies)
+
+    def _request_cookie_header(self, headers: Dict[str, str]) -> Dict[str, str]:
+        """
+        匿名请求没有独立的cookie jar，通过Cookie请求头携带cookies
+
+        Args:
+            headers: 已合并的请求头
+
+        Returns:
+            请求头
+        """
+        if self._session_key() is None and self.cookies:
+            headers = dict(headers)
+            headers['Cookie'] = '; '.join(f"{k}={v}" for k, v in self.cookies.items())
+        return headers
+
+    def _should_retry(self, response: httpx.Response = None, exception: Exception = None) -> bool:
+        """
+        判断是否应该重试
+
+        Args:
+            response: HTTP响应对象
+            exception: 异常对象
+
+        Returns:
+            是否应该重试
+        """
+        if exception:
+            # 网络相关异常应该重试
+            if isinstance(exception, (httpx.TransportError, httpx.HTTPStatusError,
+                                      httpx.TooManyRedirects)):
+                return True
+
+        if response is not None:
+            # 服务器错误状态码应该重试
+            if response.status_code >= 500:
+                return True
+            # 特定的客户端错误也可以重试
+            if response.status_code in [429, 408]:
+                return True
+
+        return False
+
+    async def _arelogin_and_update_cookies(self) -> bool:
+        """
+        异步重新获取cookies并更新
+        同一账号的并发调用（包括其他线程中的同步请求）合并为一次重新登录
+
+        Returns:
+            是否重新获取cookies成功
+        """
+        new_cookies = await relogin_coordinator.arun(
+            self._session_key(),
+            self._afetch_relogin_cookies,
+            stale_cookies=self.cookies
+        )
+        if not new_cookies:
+            return False
+
+        self.update_cookies(new_cookies)
+        return True
+
+    async def _afetch_relogin_cookies(self) -> Optional[Union[Dict, str]]:
+        """
+        异步重新获取cookies并写入数据库
+        优先使用refresh_cookies（无需重新输入密码），失败时回退到完整重新登录。
+        直接在当前事件循环中等待登录协程，不再额外创建线程和事件循环。
+
+        Returns:
+            新的cookies，失败返回None
+        """
+        try:
+            credentials = self._get_relogin_credentials()
+            if not credentials:
+                return None
+
+            username = credentials['username']
+            password = credentials['password']
+
+            # 动态导入登录模块，避免循环导入
+            pdd_login_module = importlib.import_module('Channel.pinduoduo.pdd_login')
+
+            # 第一步：尝试使用refresh_cookies刷新（推荐方式）
+            self.logger.info(f"尝试为账号 {self.account_name} 刷新cookies（无需重新登录）...")
+
+            try:
+                refresh_result = await asyncio.wait_for(
+                    pdd_login_module.refresh_pdd_cookies(username, password),
+                    timeout=60
+                )
+                new_cookies = self._extract_relogin_cookies(refresh_result)
+                if new_cookies:
+                    self._store_relogin_cookies(new_cookies)
+                    self.logger.info(f"账号 {self.account_name} cookies刷新成功")
+                    return new_cookies
+                self.logger.warning(f"账号 {self.account_name} cookies刷新失败，可能登录状态已失效")
+
+            except Exception as refresh_error:
+                self.logger.warning(f"账号 {self.account_name} cookies刷新异常: {str(refresh_error)}")
+
+            # 第二步：如果刷新失败，回退到完整重新登录
+            if not password:
+                self.logger.error(f"账号 {self.account_name} 缺少密码，无法进行完整重新登录")
+                return None
+
+            self.logger.info(f"回退到完整重新登录模式（账号 {self.account_name}）...")
+
+            try:
+                login_result = await asyncio.wait_for(
+                    pdd_login_module.login_pdd(username, password),
+                    timeout=60
+                )
+                new_cookies = self._extract_relogin_cookies(login_result)
+                if new_cookies:
+                    self._store_relogin_cookies(new_cookies)
+                    self.logger.info(f"账号 {self.account_name} 完整重新登录成功，cookies已更新")
+                    return new_cookies
+                self.logger.error(f"账号 {self.account_name} 完整重新登录失败：未获取到有效cookies")
+                return None
+
+            except Exception as login_error:
+                self.logger.error(f"账号 {self.account_name} 完整重新登录异常: {str(login_error)}")
+                return None
+
+        except Exception as e:
+            self.logger.error(f"账号 {self.account_name} 重新获取cookies过程中发生错误: {str(e)}")
+            return None
+
+    async def _aexecute_with_retry(self, request_func: Callable[[], Awaitable[httpx.Response]],
+                                   expect_json: bool = True) -> Optional[Dict[str, Any]]:
+        """
+        带重试机制异步执行请求
+
+        Args:
+            request_func: 返回协程的请求函数
+            expect_json: 是否期望JSON响应
+
+        Returns:
+            响应数据
+        """
+        last_exception = None
+        last_response = None
+        relogin_attempted = False  # 标记是否已尝试重新登录
+
+        for attempt in range(self.max_retries + 1):
+            try:
+                response = await request_func()
+
+                # 检查响应是否成功
+                if response.status_code == 200:
+                    response_data = self._handle_response(response, expect_json)
+
+                    # 检测会话是否过期
+                    if (response_data and self._is_session_expired(response_data)
+                        and not relogin_attempted and self.shop_id and self.user_id):
+
+                        self.logger.info(f"检测到会话过期，尝试重新登录...")
+                        relogin_attempted = True
+
+                        if await self._arelogin_and_update_cookies():
+                            self.logger.info(f"重新登录成功，重试请求...")
+                            continue
+                        else:
+                            self.logger.error(f"重新登录失败，请求终止")
+                            return response_data
+
+                    return response_data
+
+                last_response = response
+
+                # 判断是否应该重试
+                if attempt < self.max_retries and self._should_retry(response=response):
+                    delay = self._calculate_retry_delay(attempt)
+                    self.logger.warning(f"请求失败，状态码: {response.status_code}，"
+                                      f"第 {attempt + 1} 次重试，延迟 {delay:.2f} 秒")
+                    await asyncio.sleep(delay)
+                    continue
+                else:
+                    return self._handle_response(response, expect_json)
+
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                last_exception = e
+
+                if attempt < self.max_retries and self._should_retry(exception=e):
+                    delay = self._calculate_retry_delay(attempt)
+                    self.logger.warning(f"请求异常: {str(e)}，"
+                                      f"第 {attempt + 1} 次重试，延迟 {delay:.2f} 秒")
+                    await asyncio.sleep(delay)
+                    continue
+                else:
+                    self.logger.error(f"请求最终失败: {str(e)}")
+                    return None
+
+        # 如果所有重试都失败了
+        if last_exception:
+            self.logger.error(f"重试 {self.max_retries} 次后仍然失败，最后异常: {str(last_exception)}")
+        elif last_response is not None:
+            self.logger.error(f"重试 {self.max_retries} 次后仍然失败，最后状态码: {last_response.status_code}")
+
+        return None
+
+    async def get(self, url: str, params: Optional[Dict] = None, headers: Optional[Dict[str, str]] = None,
+                  timeout: int = 30, expect_json: bool = True, **kwargs) -> Optional[Dict[str, Any]]:
+        """
+        发起异步GET请求
+
+        Args:
+            url: 请求URL
+            params: URL参数
+            headers: 自定义请求头
+            timeout: 超时时间
+            expect_json: 是否期望JSON响应
+            **kwargs: 其他httpx参数
+
+        Returns:
+            响应数据
+        """
+        merged_headers = self._request_cookie_header(self._merge_headers(headers))
+        self._log_request("GET", url, params=params)
+
+        def _make_request():
+            return self._get_client().get(
+                url,
+                params=params,
+                headers=merged_headers,
+                timeout=timeout,
+                **kwargs
+            )
+
+        return await self._aexecute_with_retry(_make_request, expect_json=expect_json)
+
+    async def post(self, url: str, data: Optional[Union[Dict, str]] = None, json_data: Optional[Dict] = None,
+                   headers: Optional[Dict[str, str]] = None, timeout: int = 30,
+                   expect_json: bool = True, **kwargs) -> Optional[Dict[str, Any]]:
+        """
+        发起异步POST请求
+
+        Args:
+            url: 请求URL
+            data: 表单数据
+            json_data: JSON数据
+            headers: 自定义请求头
+            timeout: 超时时间
+            expect_json: 是否期望JSON响应
+            **kwargs: 其他httpx参数
+
+        Returns:
+            响应数据
+        """
+        merged_headers = self._request_cookie_header(self._merge_headers(headers))
+        self._log_request("POST", url, data=data, json=json_data)
+
+        # httpx中原始字符串请求体使用content参数，表单字典使用data参数
+        body_kwargs = {}
+        if json_data is not None:
+            body_kwargs['content'] = json.dumps(json_data)
+        elif isinstance(data, (str, bytes)):
+            body_kwargs['content'] = data
+        elif data is not None:
+            body_kwargs['data'] = data
+
+        def _make_request():
+            return self._get_client().post(
+                url,
+                headers=merged_headers,
+                timeout=timeout,
+                **body_kwargs,
+                **kwargs
+            )
+
+        return await self._aexecute_with_retry(_make_request, expect_json=expect_json)
+
+    def update_cookies(self, new_cookies: Union[Dict, str]):
+        """
+        更新cookies，并同步替换当前事件循环中该账号异步客户端的cookie jar
+
+        Args:
+            new_cookies: 新的cookies数据
+        """
+        super().update_cookies(new_cookies)
+        try:
+            get_async_session_pool().set_cookies(self._session_key(), self.cookies)
+        except RuntimeError:
+            # 不在事件循环中时，客户端会在下次创建时使用最新cookies
+            pass
+
+    async def force_relogin(self) -> bool:
+        """
+        强制重新获取cookies
+
+        Returns:
+            是否重新获取cookies成功
+        """
+        if not self.shop_id or not self.user_id:
+            self.logger.error("无法强制重新获取cookies：缺少shop_id或user_id")
+            return False
+
+        self.logger.info(f"手动触发账号 {self.account_name} 重新获取cookies...")
+        return await self._arelogin_and_update_cookies()
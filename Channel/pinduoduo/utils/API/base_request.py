@@ -5,6 +5,8 @@ import random
 from typing import Dict, Any, Optional, Union, Callable
 from utils.logger import get_logger
 from database import db_manager
+from .session_pool import session_pool
+from .relogin_coordinator import relogin_coordinator
 
 # 延迟导入，避免循环导入
 import importlib
@@ -19,10 +21,12 @@ class BaseRequest:
     - 自动会话过期检测和重新登录
     - 统一的错误处理和日志记录
     - 灵活的请求头和cookies管理
+    - 按账号复用的HTTP长连接会话（见 session_pool）
     
     自动重新登录说明：
     当API响应包含 error_code=43001 且 error_msg 包含"会话已过期"时，
     会自动调用 pdd_login.py 重新登录并更新cookies，然后重试原请求。
+    同一账号并发检测到过期时只会执行一次重新登录（见 relogin_coordinator）。
     """
     
     def __init__(self, shop_id: str = None, user_id: str = None, channel_name: str = "pinduoduo",
@@ -59,15 +63,27 @@ class BaseRequest:
         # 初始化账户信息和cookies
         self.cookies = {}
         self.account_name = "未知账号"
+        self.account_loaded = False  # 是否已从数据库加载到账号信息
         
         if shop_id and user_id:
             self._init_account_info()
     
+    def _session_key(self) -> Optional[tuple]:
+        """获取当前账号在会话池中的键，未绑定账号时返回None（使用匿名会话）"""
+        if self.shop_id and self.user_id:
+            return (self.channel_name, self.shop_id, self.user_id)
+        return None
+    
+    def _get_session(self) -> requests.Session:
+        """从会话池获取当前账号的HTTP会话"""
+        return session_pool.get_session(self._session_key())
+    
     def _init_account_info(self):
         """初始化账户信息"""
         try:
             account_info = db_manager.get_account(self.channel_name, self.shop_id, self.user_id)
             if account_info:
+                self.account_loaded = True
                 self.account_name = account_info.get('username', '未知账号')
                 cookies_data = account_info.get('cookies')
                 
@@ -109,27 +125,75 @@ class BaseRequest:
             
         return False
     
+    def _get_relogin_credentials(self) -> Optional[Dict[str, str]]:
+        """
+        获取重新登录所需的账号凭据
+        
+        Returns:
+            包含username和password的字典，获取失败返回None
+        """
+        account_info = db_manager.get_account(self.channel_name, self.shop_id, self.user_id)
+        if not account_info:
+            self.logger.error(f"无法获取账号信息进行重新登录: shop_id={self.shop_id}, user_id={self.user_id}")
+            return None
+            
+        username = account_info.get('username')
+        if not username:
+            self.logger.error(f"账号 {self.account_name} 缺少用户名，无法重新登录")
+            return None
+        
+        return {'username': username, 'password': account_info.get('password')}
+    
+    def _extract_relogin_cookies(self, result: Any) -> Optional[Union[Dict, str]]:
+        """从refresh_pdd_cookies/login_pdd的返回结果中提取cookies"""
+        if result and isinstance(result, dict):
+            return result.get('cookies')
+        return None
+    
+    def _store_relogin_cookies(self, new_cookies: Union[Dict, str]):
+        """将重新获取的cookies写入数据库（会同时使缓存的请求实例失效）"""
+        db_manager.update_account_cookies(
+            self.channel_name, 
+            self.shop_id, 
+            self.user_id, 
+            new_cookies
+        )
+    
     def _relogin_and_update_cookies(self) -> bool:
         """
         重新获取cookies并更新
-        优先使用refresh_cookies（无需重新输入密码），失败时回退到完整重新登录
+        同一账号的并发调用通过 relogin_coordinator 合并为一次重新登录，
+        其余调用方等待并复用同一份新cookies
         
         Returns:
             是否重新获取cookies成功
         """
+        new_cookies = relogin_coordinator.run(
+            self._session_key(),
+            self._fetch_relogin_cookies,
+            stale_cookies=self.cookies
+        )
+        if not new_cookies:
+            return False
+        
+        self.update_cookies(new_cookies)
+        return True
+    
+    def _fetch_relogin_cookies(self) -> Optional[Union[Dict, str]]:
+        """
+        重新获取cookies并写入数据库
+        优先使用refresh_cookies（无需重新输入密码），失败时回退到完整重新登录
+        
+        Returns:
+            新的cookies，失败返回None
+        """
         try:
-            # 获取账号信息
-            account_info = db_manager.get_account(self.channel_name, self.shop_id, self.user_id)
-            if not account_info:
-                self.logger.error(f"无法获取账号信息进行重新登录: shop_id={self.shop_id}, user_id={self.user_id}")
-                return False
+            credentials = self._get_relogin_credentials()
+            if not credentials:
+                return None
                 
-            username = account_info.get('username')
-            password = account_info.get('password')
-            
-            if not username:
-                self.logger.error(f"账号 {self.account_name} 缺少用户名，无法重新登录")
-                return False
+            username = credentials['username']
+            password = credentials['password']
             
             # 动态导入登录模块，避免循环导入
             pdd_login_module = importlib.import_module('Channel.pinduoduo.pdd_login')
@@ -170,24 +234,14 @@ class BaseRequest:
             self.logger.info(f"尝试为账号 {self.account_name} 刷新cookies（无需重新登录）...")
             
             try:
-                refresh_pdd_cookies = pdd_login_module.refresh_pdd_cookies
-                refresh_result = execute_async_safely(refresh_pdd_cookies, username, password)
+                refresh_result = execute_async_safely(pdd_login_module.refresh_pdd_cookies, username, password)
                 
                 if refresh_result and isinstance(refresh_result, dict):
-                    new_cookies = refresh_result.get('cookies')
+                    new_cookies = self._extract_relogin_cookies(refresh_result)
                     if new_cookies:
-                        self.update_cookies(new_cookies)
-                        
-                        # 更新数据库中的cookies
-                        db_manager.update_account_cookies(
-                            self.channel_name, 
-                            self.shop_id, 
-                            self.user_id, 
-                            new_cookies
-                        )
-                        
+                        self._store_relogin_cookies(new_cookies)
                         self.logger.info(f"账号 {self.account_name} cookies刷新成功")
-                        return True
+                        return new_cookies
                     else:
                         self.logger.warning(f"账号 {self.account_name} cookies刷新返回无效数据")
                 else:
@@ -199,43 +253,33 @@ class BaseRequest:
             # 第二步：如果刷新失败，回退到完整重新登录
             if not password:
                 self.logger.error(f"账号 {self.account_name} 缺少密码，无法进行完整重新登录")
-                return False
+                return None
                 
             self.logger.info(f"回退到完整重新登录模式（账号 {self.account_name}）...")
             
             try:
-                login_pdd = pdd_login_module.login_pdd
-                login_result = execute_async_safely(login_pdd, username, password)
+                login_result = execute_async_safely(pdd_login_module.login_pdd, username, password)
                 
                 if login_result and isinstance(login_result, dict):
-                    new_cookies = login_result.get('cookies')
+                    new_cookies = self._extract_relogin_cookies(login_result)
                     if new_cookies:
-                        self.update_cookies(new_cookies)
-                        
-                        # 更新数据库中的cookies
-                        db_manager.update_account_cookies(
-                            self.channel_name, 
-                            self.shop_id, 
-                            self.user_id, 
-                            new_cookies
-                        )
-                        
+                        self._store_relogin_cookies(new_cookies)
                         self.logger.info(f"账号 {self.account_name} 完整重新登录成功，cookies已更新")
-                        return True
+                        return new_cookies
                     else:
                         self.logger.error(f"账号 {self.account_name} 完整重新登录失败：未获取到有效cookies")
-                        return False
+                        return None
                 else:
                     self.logger.error(f"账号 {self.account_name} 完整重新登录失败")
-                    return False
+                    return None
                     
             except Exception as login_error:
                 self.logger.error(f"账号 {self.account_name} 完整重新登录异常: {str(login_error)}")
-                return False
+                return None
                 
         except Exception as e:
             self.logger.error(f"账号 {self.account_name} 重新获取cookies过程中发生错误: {str(e)}")
-            return False
+            return None
     
     def _should_retry(self, response: requests.Response = None, exception: Exception = None) -> bool:
         """
@@ -429,7 +473,7 @@ class BaseRequest:
         self._log_request("GET", url, params=params)
         
         def _make_request():
-            return requests.get(
+            return self._get_session().get(
                 url, 
                 params=params,
                 headers=merged_headers,
@@ -462,7 +506,7 @@ class BaseRequest:
         self._log_request("POST", url, data=data, json=json_data)
         
         def _make_request():
-            return requests.post(
+            return self._get_session().post(
                 url,
                 data=data,
                 json=json_data,
@@ -490,10 +534,15 @@ class BaseRequest:
                 self.cookies = json.loads(new_cookies)
             except json.JSONDecodeError:
                 self.logger.error("更新cookies失败: JSON解析错误")
+                return
         elif isinstance(new_cookies, dict):
             self.cookies = new_cookies
         else:
             self.logger.error("更新cookies失败: 不支持的数据类型")
+            return
+        
+        # 同步替换会话池中该账号的cookie jar，丢弃旧会话遗留的cookies
+        session_pool.set_cookies(self._session_key(), self.cookies)
     
     def set_default_header(self, key: str, value: str):
         """
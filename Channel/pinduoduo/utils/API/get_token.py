@@ -1,22 +1,15 @@
 from .base_request import BaseRequest
+from .async_base_request import AsyncBaseRequest
 
 
-class GetToken(BaseRequest):
-    def __init__(self, shop_id, user_id, channel_name="pinduoduo"):
-        super().__init__(shop_id, user_id, channel_name)
+class _GetTokenMixin:
+    """GetToken与AsyncGetToken共用的请求参数和响应解析"""
 
-    def get_token(self):
-        """
-        根据提供的店铺名获取对应的token
-        Returns:
-            str: 成功返回token字符串
-            None: 获取失败返回None
-        """
-        url = "https://mms.pinduoduo.com/chats/getToken"
-        payload = {'version': '3'}
+    GET_TOKEN_URL = "https://mms.pinduoduo.com/chats/getToken"
+    GET_TOKEN_PAYLOAD = {'version': '3'}
 
-        result = self.post(url, data=payload)
-        
+    def _extract_token(self, result):
+        """从响应中提取token"""
         if result:
             # 处理响应
             if 'token' in result:
@@ -29,4 +22,33 @@ class GetToken(BaseRequest):
         return None
 
 
+class GetToken(_GetTokenMixin, BaseRequest):
+    def __init__(self, shop_id, user_id, channel_name="pinduoduo"):
+        super().__init__(shop_id, user_id, channel_name)
 
+    def get_token(self):
+        """
+        根据提供的店铺名获取对应的token
+        Returns:
+            str: 成功返回token字符串
+            None: 获取失败返回None
+        """
+        result = self.post(self.GET_TOKEN_URL, data=self.GET_TOKEN_PAYLOAD)
+        return self._extract_token(result)
+
+
+class AsyncGetToken(_GetTokenMixin, AsyncBaseRequest):
+    """GetToken的异步版本"""
+
+    def __init__(self, shop_id, user_id, channel_name="pinduoduo"):
+        super().__init__(shop_id, user_id, channel_name)
+
+    async def get_token(self):
+        """
+        根据提供的店铺名获取对应的token
+        Returns:
+            str: 成功返回token字符串
+            None: 获取失败返回None
+        """
+        result = await self.post(self.GET_TOKEN_URL, data=self.GET_TOKEN_PAYLOAD)
+        return self._extract_token(result)
@@ -0,0 +1,205 @@
+"""
+账号重新登录协调器
+同一账号会话过期时，并发请求只触发一次重新登录（single-flight），
+其余请求等待同一结果后使用新cookies重试
+"""
+
+import asyncio
+import concurrent.futures
+import json
+import threading
+import time
+from typing import Dict, Any, Optional, Tuple, Union, Callable, Awaitable
+
+from utils.logger import get_logger
+
+
+# 重新登录的结果：新的cookies（JSON字符串或字典），失败为None
+ReloginResult = Optional[Union[Dict, str]]
+
+
+class _ReloginFlight:
+    """一次进行中的重新登录"""
+
+    def __init__(self):
+        self.future: concurrent.futures.Future = concurrent.futures.Future()
+        self.started_at = time.time()
+        self.waiters = 0
+
+
+class ReloginCoordinator:
+    """按账号合并并发重新登录请求
+
+    功能特性：
+    - 每个账号同一时刻只有一个重新登录在执行，首个调用方执行，其余调用方等待同一结果
+    - 同步调用（线程中）和异步调用（任意事件循环中）共享同一次重新登录
+    - 重新登录成功后的一段时间内，仍携带旧cookies检测到过期的请求直接复用新cookies，
+      不再触发新的重新登录
+    """
+
+    def __init__(self, result_ttl: float = 30.0, wait_timeout: float = 150.0):
+        """
+        初始化协调器
+
+        Args:
+            result_ttl: 成功结果的复用时间（秒）
+            wait_timeout: 等待他人执行的重新登录的最长时间（秒）
+        """
+        self.result_ttl = result_ttl
+        self.wait_timeout = wait_timeout
+
+        self._flights: Dict[Tuple, _ReloginFlight] = {}
+        self._recent: Dict[Tuple, Tuple[float, Union[Dict, str]]] = {}
+        self._lock = threading.Lock()
+        self._stats = {
+            'relogin_count': 0,
+            'coalesced_count': 0,
+            'reused_count': 0,
+            'failed_count': 0
+        }
+        self.logger = get_logger("ReloginCoordinator")
+
+    def _join(self, key: Tuple, stale_cookies: Optional[Dict]) -> Tuple[Optional[_ReloginFlight], bool, ReloginResult]:
+        """
+        加入或发起一次重新登录
+
+        Args:
+            key: 账号键
+            stale_cookies: 调用方检测到过期时使用的cookies
+
+        Returns:
+            (flight, 是否为执行方, 可直接复用的最近结果)
+        """
+        with self._lock:
+            recent = self._recent.get(key)
+            if recent:
+                finished_at, cookies = recent
+                if time.time() - finished_at < self.result_ttl and not self._same_cookies(cookies, stale_cookies):
+                    self._stats['reused_count'] += 1
+                    return None, False, cookies
+                if time.time() - finished_at >= self.result_ttl:
+                    del self._recent[key]
+
+            flight = self._flights.get(key)
+            if flight is not None:
+                flight.waiters += 1
+                self._stats['coalesced_count'] += 1
+                return flight, False, None
+
+            flight = _ReloginFlight()
+            self._flights[key] = flight
+            self._stats['relogin_count'] += 1
+            return flight, True, None
+
+    @staticmethod
+    def _same_cookies(new_cookies: Union[Dict, str], stale_cookies: Optional[Dict]) -> bool:
+        """判断最近一次重新登录得到的cookies是否就是调用方已在使用的cookies"""
+        if stale_cookies is None:
+            return False
+        if isinstance(new_cookies, str):
+            # 与BaseRequest.update_cookies的解析保持一致
+            try:
+                new_cookies = json.loads(new_cookies)
+            except json.JSONDecodeError:
+                return False
+        return new_cookies == stale_cookies
+
+    def _finish(self, key: Tuple, flight: _ReloginFlight, result: ReloginResult):
+        """记录结果并唤醒所有等待方"""
+        with self._lock:
+            self._flights.pop(key, None)
+            if result:
+                self._recent[key] = (time.time(), result)
+            else:
+                self._stats['failed_count'] += 1
+
+        if flight.waiters:
+            self.logger.info(f"账号 {key} 重新登录完成，共享给 {flight.waiters} 个等待中的请求")
+
+        if not flight.future.done():
+            flight.future.set_result(result)
+
+    def run(self, key: Tuple, relogin_func: Callable[[], ReloginResult],
+            stale_cookies: Optional[Dict] = None) -> ReloginResult:
+        """
+        同步执行（或等待）账号的重新登录
+
+        Args:
+            key: 账号键
+            relogin_func: 执行重新登录并返回新cookies的函数
+            stale_cookies: 调用方检测到过期时使用的cookies
+
+        Returns:
+            新的cookies，失败返回None
+        """
+        flight, is_leader, recent = self._join(key, stale_cookies)
+        if flight is None:
+            return recent
+
+        if not is_leader:
+            try:
+                return flight.future.result(timeout=self.wait_timeout)
+            except Exception as e:
+                self.logger.error(f"等待账号 {key} 重新登录结果失败: {e}")
+                return None
+
+        result = None
+        try:
+            result = relogin_func()
+        except Exception as e:
+            self.logger.error(f"账号 {key} 重新登录异常: {e}")
+        finally:
+            self._finish(key, flight, result)
+        return result
+
+    async def arun(self, key: Tuple, relogin_coro_func: Callable[[], Awaitable[ReloginResult]],
+                   stale_cookies: Optional[Dict] = None) -> ReloginResult:
+        """
+        在事件循环中执行（或等待）账号的重新登录
+
+        Args:
+            key: 账号键
+            relogin_coro_func: 返回重新登录协程的函数，协程结果为新cookies
+            stale_cookies: 调用方检测到过期时使用的cookies
+
+        Returns:
+            新的cookies，失败返回None
+        """
+        flight, is_leader, recent = self._join(key, stale_cookies)
+        if flight is None:
+            return recent
+
+        if not is_leader:
+            try:
+                # shield避免等待方超时或被取消时连带取消共享的结果
+                return await asyncio.wait_for(asyncio.shield(asyncio.wrap_future(flight.future)),
+                                              timeout=self.wait_timeout)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                self.logger.error(f"等待账号 {key} 重新登录结果失败: {e}")
+                return None
+
+        result = None
+        try:
+            result = await relogin_coro_func()
+        except asyncio.CancelledError:
+            # 执行方被取消时唤醒等待方，由它们各自的下一次过期检测重新发起
+            self._finish(key, flight, None)
+            raise
+        except Exception as e:
+            self.logger.error(f"账号 {key} 重新登录异常: {e}")
+        self._finish(key, flight, result)
+        return result
+
+    def get_stats(self) -> Dict[str, Any]:
+        """获取协调器统计信息"""
+        with self._lock:
+            return {
+                **self._stats,
+                'in_flight': len(self._flights)
+            }
+
+
+# 全局重新登录协调器
+relogin_coordinator = ReloginCoordinator()
@@ -1,22 +1,19 @@
 from .base_request import BaseRequest
+from .async_base_request import AsyncBaseRequest
 from typing import Dict, Any
 
 
-class SendMessage(BaseRequest):
-    def __init__(self, shop_id: str, user_id: str, channel_name: str = "pinduoduo"):
-        super().__init__(shop_id, user_id, channel_name)
-        
-        # 检查账户信息是否正确加载
-        if not hasattr(self, 'account_name'):
-            self.logger.error(f"无法在数据库中找到账户: shop_id={shop_id}, user_id={user_id}")
-            raise ValueError("找不到指定的账户信息")
+class _SendMessagePayloadMixin:
+    """SendMessage与AsyncSendMessage共用的请求体构造和响应解析"""
 
-    def send_text(self, recipient_uid, message_content):
-        """
-        发送文本消息
-        """
-        url = "https://mms.pinduoduo.com/plateau/chat/send_message"
-        data = {
+    SEND_MESSAGE_URL = "https://mms.pinduoduo.com/plateau/chat/send_message"
+    MALL_GOODS_CARD_URL = "https://mms.pinduoduo.com/plateau/message/send/mallGoodsCard"
+    ASSIGN_CS_LIST_URL = "https://mms.pinduoduo.com/latitude/assign/getAssignCsList"
+    MOVE_CONVERSATION_URL = "https://mms.pinduoduo.com/plateau/chat/move_conversation"
+
+    def _build_text_data(self, recipient_uid, message_content) -> Dict[str, Any]:
+        """构造文本消息请求体"""
+        return {
             "data": {
                 "cmd": "send_message",
                 "request_id": self.generate_request_id(),
@@ -38,7 +35,8 @@ class SendMessage(BaseRequest):
             "client": "WEB"
         }
 
-        result = self.post(url, json_data=data)
+    def _parse_text_result(self, result):
+        """解析文本消息发送结果"""
         if result and result.get("success") == True:
             if result.get("result", {}).get("error_code") == 10002:
                 error_msg = result.get('result', {}).get('error')
@@ -50,14 +48,9 @@ class SendMessage(BaseRequest):
             self.logger.error(f"发送文本消息失败: {result}")
             return None
 
- 
-        
-    def send_image(self, recipient_uid, image_url):
-        """
-        发送图片消息
-        """
-        url = "https://mms.pinduoduo.com/plateau/chat/send_message"
-        data = {
+    def _build_image_data(self, recipient_uid, image_url) -> Dict[str, Any]:
+        """构造图片消息请求体"""
+        return {
             "data": {
                 "cmd": "send_message",
                 "request_id": self.generate_request_id(),
@@ -80,37 +73,16 @@ class SendMessage(BaseRequest):
             "client": "WEB"
         }
 
-        result = self.post(url, json_data=data)
-        if result:
-            self.logger.debug(f"发送图片消息成功: {result}")
-            return result
-
-
-    def send_mallGoodsCard(self, recipient_uid, goods_id):
-        """
-        发送商城商品卡片消息
-        """
-        url = "https://mms.pinduoduo.com/plateau/message/send/mallGoodsCard"
-        data = {
+    def _build_mall_goods_card_data(self, recipient_uid, goods_id) -> Dict[str, Any]:
+        """构造商城商品卡片请求体"""
+        return {
             "uid": recipient_uid,
             "goods_id": goods_id,
             "biz_type": 3
         }
 
-        result = self.post(url, json_data=data)
-        if result:
-            self.logger.debug(f"发送商城商品卡片消息成功: {result}")
-            return result
-
-
-    def getAssignCsList(self):
-        """
-        获取分配的客服列表
-        """
-        url = "https://mms.pinduoduo.com/latitude/assign/getAssignCsList"
-        data = {"wechatCheck": True}
-        
-        result = self.post(url, json_data=data)
+    def _parse_cs_list_result(self, result):
+        """解析客服列表结果"""
         if result and result.get('success'):
             return result['result']['csList']
         else:
@@ -118,13 +90,9 @@ class SendMessage(BaseRequest):
             self.logger.error(f"获取分配的客服列表失败: {error_msg}")
             return None
 
-
-    def move_conversation(self, recipient_uid, cs_uid):
-        """
-        转移会话
-        """
-        url = "https://mms.pinduoduo.com/plateau/chat/move_conversation"
-        data = {
+    def _build_move_conversation_data(self, recipient_uid, cs_uid) -> Dict[str, Any]:
+        """构造转移会话请求体"""
+        return {
             "data": {
                 "cmd": "move_conversation",
                 "request_id": self.generate_request_id(),
@@ -137,8 +105,102 @@ class SendMessage(BaseRequest):
             },
             "client": "WEB"
         }
+
+
+class SendMessage(_SendMessagePayloadMixin, BaseRequest):
+    def __init__(self, shop_id: str, user_id: str, channel_name: str = "pinduoduo"):
+        super().__init__(shop_id, user_id, channel_name)
         
-        result = self.post(url, json_data=data)
+        # 检查账户信息是否正确加载
+        if not hasattr(self, 'account_name'):
+            self.logger.error(f"无法在数据库中找到账户: shop_id={shop_id}, user_id={user_id}")
+            raise ValueError("找不到指定的账户信息")
+
+    def send_text(self, recipient_uid, message_content):
+        """
+        发送文本消息
+        """
+        result = self.post(self.SEND_MESSAGE_URL, json_data=self._build_text_data(recipient_uid, message_content))
+        return self._parse_text_result(result)
+
+    def send_image(self, recipient_uid, image_url):
+        """
+        发送图片消息
+        """
+        result = self.post(self.SEND_MESSAGE_URL, json_data=self._build_image_data(recipient_uid, image_url))
+        if result:
+            self.logger.debug(f"发送图片消息成功: {result}")
+            return result
+
+    def send_mallGoodsCard(self, recipient_uid, goods_id):
+        """
+        发送商城商品卡片消息
+        """
+        result = self.post(self.MALL_GOODS_CARD_URL, json_data=self._build_mall_goods_card_data(recipient_uid, goods_id))
+        if result:
+            self.logger.debug(f"发送商城商品卡片消息成功: {result}")
+            return result
+
+    def getAssignCsList(self):
+        """
+        获取分配的客服列表
+        """
+        result = self.post(self.ASSIGN_CS_LIST_URL, json_data={"wechatCheck": True})
+        return self._parse_cs_list_result(result)
+
+    def move_conversation(self, recipient_uid, cs_uid):
+        """
+        转移会话
+        """
+        result = self.post(self.MOVE_CONVERSATION_URL, json_data=self._build_move_conversation_data(recipient_uid, cs_uid))
+        if result:
+            self.logger.debug(f"转移会话成功: {result}")
+            return result
+
+
+class AsyncSendMessage(_SendMessagePayloadMixin, AsyncBaseRequest):
+    """SendMessage的异步版本，在事件循环中发送消息而不阻塞其他会话"""
+
+    def __init__(self, shop_id: str, user_id: str, channel_name: str = "pinduoduo"):
+        super().__init__(shop_id, user_id, channel_name)
+
+    async def send_text(self, recipient_uid, message_content):
+        """
+        发送文本消息
+        """
+        result = await self.post(self.SEND_MESSAGE_URL, json_data=self._build_text_data(recipient_uid, message_content))
+        return self._parse_text_result(result)
+
+    async def send_image(self, recipient_uid, image_url):
+        """
+        发送图片消息
+        """
+        result = await self.post(self.SEND_MESSAGE_URL, json_data=self._build_image_data(recipient_uid, image_url))
+        if result:
+            self.logger.debug(f"发送图片消息成功: {result}")
+            return result
+
+    async def send_mallGoodsCard(self, recipient_uid, goods_id):
+        """
+        发送商城商品卡片消息
+        """
+        result = await self.post(self.MALL_GOODS_CARD_URL, json_data=self._build_mall_goods_card_data(recipient_uid, goods_id))
+        if result:
+            self.logger.debug(f"发送商城商品卡片消息成功: {result}")
+            return result
+
+    async def getAssignCsList(self):
+        """
+        获取分配的客服列表
+        """
+        result = await self.post(self.ASSIGN_CS_LIST_URL, json_data={"wechatCheck": True})
+        return self._parse_cs_list_result(result)
+
+    async def move_conversation(self, recipient_uid, cs_uid):
+        """
+        转移会话
+        """
+        result = await self.post(self.MOVE_CONVERSATION_URL, json_data=self._build_move_conversation_data(recipient_uid, cs_uid))
         if result:
             self.logger.debug(f"转移会话成功: {result}")
             return result
@@ -0,0 +1,122 @@
+"""
+按账号缓存的API请求实例
+SendMessage等请求类构造时会查询数据库加载账号和cookies，
+这里按账号复用实例，账号cookies/信息在数据库中变更时自动失效
+"""
+
+import threading
+from collections import OrderedDict
+from typing import Dict, Any, Tuple, Type, TypeVar
+
+from database import db_manager
+from utils.logger import get_logger
+from .base_request import BaseRequest
+
+
+RequestT = TypeVar("RequestT", bound=BaseRequest)
+
+
+class SenderCache:
+    """按账号缓存的请求实例缓存
+
+    功能特性：
+    - 键为 (请求类, channel_name, shop_id, user_id)，同一账号的同类请求复用一个实例
+    - 通过 db_manager 的账号变更监听器失效，更新cookies/账号信息后下次获取会重新加载
+    - 实例数有上限，超出时按LRU淘汰
+    - 未能从数据库加载到账号的实例不缓存，避免缓存错误状态
+    """
+
+    def __init__(self, max_size: int = 500):
+        """
+        初始化缓存
+
+        Args:
+            max_size: 最大缓存实例数
+        """
+        self.max_size = max_size
+        self._senders: "OrderedDict[Tuple, BaseRequest]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._hits = 0
+        self._misses = 0
+        self._invalidations = 0
+        self.logger = get_logger("SenderCache")
+
+    def get(self, sender_cls: Type[RequestT], shop_id: str, user_id: str,
+            channel_name: str = "pinduoduo") -> RequestT:
+        """
+        获取账号的请求实例，不存在时创建
+
+        Args:
+            sender_cls: 请求类，如 AsyncSendMessage
+            shop_id: 店铺ID
+            user_id: 用户ID
+            channel_name: 渠道名称
+
+        Returns:
+            请求实例
+        """
+        key = (sender_cls, channel_name, shop_id, user_id)
+
+        with self._lock:
+            sender = self._senders.get(key)
+            if sender is not None:
+                self._senders.move_to_end(key)
+                self._hits += 1
+                return sender
+            self._misses += 1
+
+        # 在锁外构造，避免数据库查询阻塞其他账号
+        sender = sender_cls(shop_id, user_id, channel_name=channel_name)
+        if not sender.account_loaded:
+            return sender
+
+        with self._lock:
+            # 并发创建时保留先放入的实例
+            existing = self._senders.get(key)
+            if existing is not None:
+                return existing
+            self._senders[key] = sender
+            while len(self._senders) > self.max_size:
+                self._senders.popitem(last=False)
+
+        return sender
+
+    def invalidate(self, channel_name: str, shop_id: str, user_id: str):
+        """
+        使账号的所有缓存实例失效
+
+        Args:
+            channel_name: 渠道名称
+            shop_id: 店铺ID
+            user_id: 用户ID
+        """
+        with self._lock:
+            keys = [key for key in self._senders
+                    if key[1:] == (channel_name, shop_id, user_id)]
+            for key in keys:
+                del self._senders[key]
+            self._invalidations += len(keys)
+
+        if keys:
+            self.logger.debug(f"账号 {channel_name}/{shop_id}/{user_id} 已变更，失效 {len(keys)} 个缓存实例")
+
+    def clear(self):
+        """清空缓存"""
+        with self._lock:
+            self._senders.clear()
+
+    def get_stats(self) -> Dict[str, Any]:
+        """获取缓存统计信息"""
+        with self._lock:
+            return {
+                'size': len(self._senders),
+                'max_size': self.max_size,
+                'hits': self._hits,
+                'misses': self._misses,
+                'invalidations': self._invalidations
+            }
+
+
+# 全局请求实例缓存，账号在数据库中变更时失效
+sender_cache = SenderCache()
+db_manager.add_account_listener(sender_cache.invalidate)
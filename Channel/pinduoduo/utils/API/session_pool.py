@@ -0,0 +1,384 @@
+"""
+HTTP会话池
+为每个账号维护一个复用TCP/TLS连接的requests.Session（同步）或httpx.AsyncClient（异步），
+避免每次请求重新握手
+"""
+
+import asyncio
+import threading
+import time
+import weakref
+from collections import OrderedDict
+from http.cookiejar import DefaultCookiePolicy
+from typing import Dict, Any, Optional, Set, Tuple
+
+import httpx
+import requests
+from requests.adapters import HTTPAdapter
+
+from utils.logger import get_logger
+
+
+# 未绑定账号的请求（如登录后查询店铺/用户信息）共用的会话键
+ANONYMOUS_SESSION_KEY = ("__anonymous__",)
+
+
+class _PooledSession:
+    """会话池中的单个会话条目"""
+
+    def __init__(self, session: requests.Session):
+        self.session = session
+        self.created_at = time.time()
+        self.last_used = self.created_at
+        self.request_count = 0
+
+
+class SessionPool:
+    """按账号划分的requests会话池
+
+    功能特性：
+    - 每个账号（channel_name, shop_id, user_id）一个长连接会话，带独立cookie jar
+    - 单个会话内的连接池大小有上限
+    - 会话总数有上限，超出时按LRU淘汰
+    - 空闲超时的会话在访问时惰性回收
+    """
+
+    def __init__(self, max_sessions: int = 200, pool_connections: int = 4, pool_maxsize: int = 8,
+                 idle_timeout: float = 600.0, eviction_interval: float = 60.0):
+        """
+        初始化会话池
+
+        Args:
+            max_sessions: 最大会话数（账号数）
+            pool_connections: 每个会话缓存的主机连接池数量
+            pool_maxsize: 每个主机连接池的最大连接数
+            idle_timeout: 会话空闲超时时间（秒）
+            eviction_interval: 空闲会话检查间隔（秒）
+        """
+        self.max_sessions = max_sessions
+        self.pool_connections = pool_connections
+        self.pool_maxsize = pool_maxsize
+        self.idle_timeout = idle_timeout
+        self.eviction_interval = eviction_interval
+
+        self._sessions: "OrderedDict[Tuple, _PooledSession]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._last_eviction = time.time()
+        self._evicted_count = 0
+        self.logger = get_logger("SessionPool")
+
+    def _create_session(self, key: Tuple) -> requests.Session:
+        """创建新的会话并挂载有上限的连接池"""
+        session = requests.Session()
+        adapter = HTTPAdapter(
+            pool_connections=self.pool_connections,
+            pool_maxsize=self.pool_maxsize,
+            pool_block=False
+        )
+        session.mount("https://", adapter)
+        session.mount("http://", adapter)
+
+        if key == ANONYMOUS_SESSION_KEY:
+            # 匿名会话被多个账号共用，禁止服务端写入cookie，避免账号间串号
+            session.cookies.set_policy(DefaultCookiePolicy(allowed_domains=[]))
+
+        return session
+
+    def get_session(self, key: Optional[Tuple] = None) -> requests.Session:
+        """
+        获取指定账号的会话，不存在时创建
+
+        Args:
+            key: 会话键，None表示匿名会话
+
+        Returns:
+            requests.Session实例
+        """
+        key = key or ANONYMOUS_SESSION_KEY
+        now = time.time()
+        closed = []
+
+        with self._lock:
+            if now - self._last_eviction >= self.eviction_interval:
+                closed.extend(self._evict_idle_locked(now))
+                self._last_eviction = now
+
+            entry = self._sessions.get(key)
+            if entry is None:
+                entry = _PooledSession(self._create_session(key))
+                self._sessions[key] = entry
+                self.logger.debug(f"创建HTTP会话: {key}, 当前会话数: {len(self._sessions)}")
+
+                # 超出上限时淘汰最久未使用的会话
+                while len(self._sessions) > self.max_sessions:
+                    old_key, old_entry = self._sessions.popitem(last=False)
+                    closed.append(old_entry.session)
+                    self._evicted_count += 1
+                    self.logger.debug(f"会话数超出上限，淘汰HTTP会话: {old_key}")
+            else:
+                self._sessions.move_to_end(key)
+
+            entry.last_used = now
+            entry.request_count += 1
+            session = entry.session
+
+        for old_session in closed:
+            self._close_session(old_session)
+
+        return session
+
+    def _evict_idle_locked(self, now: float) -> list:
+        """淘汰空闲超时的会话（调用方需持有锁）"""
+        expired_keys = [
+            key for key, entry in self._sessions.items()
+            if now - entry.last_used >= self.idle_timeout
+        ]
+        closed = []
+        for key in expired_keys:
+            closed.append(self._sessions.pop(key).session)
+            self._evicted_count += 1
+
+        if expired_keys:
+            self.logger.debug(f"回收 {len(expired_keys)} 个空闲HTTP会话")
+        return closed
+
+    def _close_session(self, session: requests.Session):
+        """关闭会话及其底层连接"""
+        try:
+            session.close()
+        except Exception as e:
+            self.logger.error(f"关闭HTTP会话失败: {e}")
+
+    def set_cookies(self, key: Tuple, cookies: Dict[str, str]):
+        """
+        用新的cookies替换账号会话的cookie jar（如重新登录后）
+
+        Args:
+            key: 会话键
+            cookies: cookies字典
+        """
+        if not key or key == ANONYMOUS_SESSION_KEY:
+            return
+
+        with self._lock:
+            entry = self._sessions.get(key)
+            if entry is None:
+                return
+            entry.session.cookies.clear()
+            if cookies:
+                entry.session.cookies.update(cookies)
+
+    def close_session(self, key: Tuple) -> bool:
+        """
+        关闭并移除指定账号的会话
+
+        Args:
+            key: 会话键
+
+        Returns:
+            是否找到并关闭了会话
+        """
+        with self._lock:
+            entry = self._sessions.pop(key, None)
+
+        if entry is None:
+            return False
+        self._close_session(entry.session)
+        return True
+
+    def close_all(self):
+        """关闭所有会话"""
+        with self._lock:
+            entries = list(self._sessions.values())
+            self._sessions.clear()
+
+        for entry in entries:
+            self._close_session(entry.session)
+        self.logger.info(f"已关闭 {len(entries)} 个HTTP会话")
+
+    def get_stats(self) -> Dict[str, Any]:
+        """获取会话池统计信息"""
+        with self._lock:
+            return {
+                'session_count': len(self._sessions),
+                'max_sessions': self.max_sessions,
+                'pool_maxsize': self.pool_maxsize,
+                'idle_timeout': self.idle_timeout,
+                'evicted_count': self._evicted_count,
+                'total_requests': sum(entry.request_count for entry in self._sessions.values())
+            }
+
+
+class _PooledAsyncClient:
+    """异步会话池中的单个客户端条目"""
+
+    def __init__(self, client: httpx.AsyncClient):
+        self.client = client
+        self.cookies: Optional[Dict[str, str]] = None  # 当前写入cookie jar的cookies快照
+        self.created_at = time.time()
+        self.last_used = self.created_at
+        self.request_count = 0
+
+
+class AsyncSessionPool:
+    """按账号划分的httpx.AsyncClient池
+
+    httpx的连接绑定在创建它的事件循环上，因此每个事件循环各有一个池实例，
+    通过 get_async_session_pool() 获取。池内只在所属事件循环中访问，无需加锁。
+    """
+
+    def __init__(self, max_sessions: int = 200, max_connections: int = 8,
+                 idle_timeout: float = 600.0, eviction_interval: float = 60.0):
+        """
+        初始化异步会话池
+
+        Args:
+            max_sessions: 最大客户端数（账号数）
+            max_connections: 每个客户端的最大连接数
+            idle_timeout: 客户端空闲超时时间（秒），同时作为keep-alive连接过期时间
+            eviction_interval: 空闲客户端检查间隔（秒）
+        """
+        self.max_sessions = max_sessions
+        self.max_connections = max_connections
+        self.idle_timeout = idle_timeout
+        self.eviction_interval = eviction_interval
+
+        self._clients: "OrderedDict[Tuple, _PooledAsyncClient]" = OrderedDict()
+        self._closing_tasks: Set[asyncio.Task] = set()
+        self._last_eviction = time.time()
+        self._evicted_count = 0
+        self.logger = get_logger("AsyncSessionPool")
+
+    def _create_client(self) -> httpx.AsyncClient:
+        """创建新的异步客户端并限制其连接池大小"""
+        return httpx.AsyncClient(
+            limits=httpx.Limits(
+                max_connections=self.max_connections,
+                max_keepalive_connections=self.max_connections,
+                keepalive_expiry=self.idle_timeout
+            ),
+            follow_redirects=True
+        )
+
+    def get_client(self, key: Optional[Tuple] = None, cookies: Optional[Dict[str, str]] = None) -> httpx.AsyncClient:
+        """
+        获取指定账号的异步客户端，不存在时创建
+
+        Args:
+            key: 会话键，None表示匿名客户端
+            cookies: 账号当前的cookies，与cookie jar中的不一致时（如其他线程重新登录后）替换jar
+
+        Returns:
+            httpx.AsyncClient实例
+        """
+        key = key or ANONYMOUS_SESSION_KEY
+        now = time.time()
+
+        if now - self._last_eviction >= self.eviction_interval:
+            self._evict_idle(now)
+            self._last_eviction = now
+
+        entry = self._clients.get(key)
+        if entry is None:
+            entry = _PooledAsyncClient(self._create_client())
+            self._clients[key] = entry
+            self.logger.debug(f"创建异步HTTP客户端: {key}, 当前客户端数: {len(self._clients)}")
+
+            while len(self._clients) > self.max_sessions:
+                old_key, old_entry = self._clients.popitem(last=False)
+                self._close_client(old_entry.client)
+                self._evicted_count += 1
+                self.logger.debug(f"客户端数超出上限，淘汰异步HTTP客户端: {old_key}")
+        else:
+            self._clients.move_to_end(key)
+
+        if key != ANONYMOUS_SESSION_KEY and cookies is not None and cookies != entry.cookies:
+            self._replace_cookies(entry, cookies)
+
+        entry.last_used = now
+        entry.request_count += 1
+        return entry.client
+
+    def _evict_idle(self, now: float):
+        """淘汰空闲超时的客户端"""
+        expired_keys = [
+            key for key, entry in self._clients.items()
+            if now - entry.last_used >= self.idle_timeout
+        ]
+        for key in expired_keys:
+            self._close_client(self._clients.pop(key).client)
+            self._evicted_count += 1
+
+        if expired_keys:
+            self.logger.debug(f"回收 {len(expired_keys)} 个空闲异步HTTP客户端")
+
+    def _close_client(self, client: httpx.AsyncClient):
+        """在后台关闭客户端，保留任务引用避免被垃圾回收"""
+        task = asyncio.create_task(client.aclose())
+        self._closing_tasks.add(task)
+        task.add_done_callback(self._closing_tasks.discard)
+
+    def set_cookies(self, key: Tuple, cookies: Dict[str, str]):
+        """
+        用新的cookies替换账号客户端的cookie jar
+
+        Args:
+            key: 会话键
+            cookies: cookies字典
+        """
+        if not key or key == ANONYMOUS_SESSION_KEY:
+            return
+
+        entry = self._clients.get(key)
+        if entry is None:
+            return
+        self._replace_cookies(entry, cookies)
+
+    def _replace_cookies(self, entry: _PooledAsyncClient, cookies: Optional[Dict[str, str]]):
+        """替换客户端cookie jar并记录快照"""
+        entry.client.cookies.clear()
+        if cookies:
+            entry.client.cookies.update(cookies)
+        entry.cookies = dict(cookies) if cookies else {}
+
+    async def close_all(self):
+        """关闭所有客户端"""
+        entries = list(self._clients.values())
+        self._clients.clear()
+
+        for entry in entries:
+            try:
+                await entry.client.aclose()
+            except Exception as e:
+                self.logger.error(f"关闭异步HTTP客户端失败: {e}")
+        self.logger.info(f"已关闭 {len(entries)} 个异步HTTP客户端")
+
+    def get_stats(self) -> Dict[str, Any]:
+        """获取异步会话池统计信息"""
+        return {
+            'session_count': len(self._clients),
+            'max_sessions': self.max_sessions,
+            'max_connections': self.max_connections,
+            'idle_timeout': self.idle_timeout,
+            'evicted_count': self._evicted_count,
+            'total_requests': sum(entry.request_count for entry in self._clients.values())
+        }
+
+
+# 全局HTTP会话池实例
+session_pool = SessionPool()
+
+# 每个事件循环对应一个异步会话池
+_async_session_pools: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, AsyncSessionPool]" = weakref.WeakKeyDictionary()
+_async_pools_lock = threading.Lock()
+
+
+def get_async_session_pool() -> AsyncSessionPool:
+    """获取当前事件循环的异步会话池（必须在事件循环中调用）"""
+    loop = asyncio.get_running_loop()
+    with _async_pools_lock:
+        pool = _async_session_pools.get(loop)
+        if pool is None:
+            pool = AsyncSessionPool()
+            _async_session_pools[loop] = pool
+        return pool
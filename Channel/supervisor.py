@@ -0,0 +1,462 @@
+"""
+多进程渠道监督器
+
+把账号按shop_id一致性哈希分配到N个工作进程，每个工作进程内运行一个ChannelEngine，
+避免所有店铺的JSON解析、日志和处理器逻辑都挤在一个受GIL限制的进程里。
+
+进程间通信：
+- 命令队列（每个工作进程一个）：start/stop/stop_all/shutdown
+- 事件队列（共享）：连接成功/失败/结束、命令应答、指标
+- 日志队列（共享）：工作进程的日志记录转发回主进程的'app' logger（包括UI日志面板）
+"""
+
+import bisect
+import concurrent.futures
+import hashlib
+import itertools
+import logging
+import logging.handlers
+import multiprocessing
+import queue
+import threading
+import time
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from utils.logger import get_logger
+
+
+class ConsistentHashRing:
+    """一致性哈希环（带虚拟节点）
+
+    增减工作进程时只有少量店铺会迁移到其他进程。
+    """
+
+    def __init__(self, nodes: List[int], virtual_nodes: int = 100):
+        """
+        初始化哈希环
+
+        Args:
+            nodes: 节点列表（工作进程编号）
+            virtual_nodes: 每个节点的虚拟节点数
+        """
+        self.virtual_nodes = virtual_nodes
+        self._ring: List[Tuple[int, int]] = []
+        for node in nodes:
+            for i in range(virtual_nodes):
+                self._ring.append((self._hash(f"{node}#{i}"), node))
+        self._ring.sort()
+        self._hashes = [h for h, _ in self._ring]
+
+    @staticmethod
+    def _hash(key: str) -> int:
+        return int.from_bytes(hashlib.md5(key.encode("utf-8")).digest()[:8], "big")
+
+    def get_node(self, key: str) -> int:
+        """获取键所属的节点"""
+        if not self._ring:
+            raise ValueError("哈希环为空")
+        index = bisect.bisect(self._hashes, self._hash(str(key))) % len(self._ring)
+        return self._ring[index][1]
+
+
+def _setup_worker_logging(log_queue):
+    """工作进程中把'app' logger的输出全部转发到主进程"""
+    app_logger = logging.getLogger("app")
+    for handler in list(app_logger.handlers):
+        app_logger.removeHandler(handler)
+    app_logger.addHandler(logging.handlers.QueueHandler(log_queue))
+
+
+def _collect_worker_metrics(engine) -> Dict[str, Any]:
+    """采集工作进程指标"""
+    from Message.message_consumer import message_consumer_manager
+    from Message.message_queue import message_queue_manager
+    from Channel.pinduoduo.utils.API.sender_cache import sender_cache
+    from Channel.pinduoduo.utils.API.relogin_coordinator import relogin_coordinator
+
+    return {
+        'timestamp': time.time(),
+        'engine': engine.get_stats(),
+        'queue_count': len(message_queue_manager.list_queues()),
+        'running_consumers': len(message_consumer_manager.get_running_consumers()),
+        'sender_cache': sender_cache.get_stats(),
+        'relogin': relogin_coordinator.get_stats(),
+        'thread_count': threading.active_count()
+    }
+
+
+def _worker_main(worker_id: int, command_queue, event_queue, log_queue,
+                 num_loops: int, metrics_interval: float):
+    """
+    工作进程入口
+
+    Args:
+        worker_id: 工作进程编号
+        command_queue: 本进程的命令队列
+        event_queue: 共享事件队列
+        log_queue: 共享日志队列
+        num_loops: 进程内引擎的事件循环数
+        metrics_interval: 指标上报间隔（秒）
+    """
+    _setup_worker_logging(log_queue)
+    logger = get_logger(f"ChannelWorker-{worker_id}")
+
+    from Channel.engine import ChannelEngine
+    engine = ChannelEngine(num_loops=num_loops)
+    logger.info(f"工作进程 {worker_id} 已启动")
+
+    def _callbacks(account_key: str):
+        return {
+            'on_success': lambda: event_queue.put(('connected', worker_id, account_key)),
+            'on_failure': lambda error: event_queue.put(('failed', worker_id, account_key, str(error))),
+            'on_finished': lambda: event_queue.put(('finished', worker_id, account_key))
+        }
+
+    last_metrics = 0.0
+    while True:
+        try:
+            command = command_queue.get(timeout=1.0)
+        except queue.Empty:
+            command = None
+
+        if command is not None:
+            name, request_id, args = command
+            result = None
+            try:
+                if name == 'start':
+                    account_key, account_data = args
+                    result = engine.start_account(account_key, account_data, **_callbacks(account_key))
+                elif name == 'stop':
+                    account_key, timeout = args
+                    result = engine.stop_account(account_key, timeout=timeout)
+                elif name in ('stop_all', 'shutdown'):
+                    engine.stop_all(timeout=args[0])
+                    result = True
+            except Exception as e:
+                logger.error(f"工作进程 {worker_id} 执行命令 {name} 失败: {e}")
+            event_queue.put(('reply', worker_id, request_id, result))
+
+            if name == 'shutdown':
+                logger.info(f"工作进程 {worker_id} 退出")
+                return
+
+        now = time.time()
+        if now - last_metrics >= metrics_interval:
+            last_metrics = now
+            try:
+                event_queue.put(('metrics', worker_id, _collect_worker_metrics(engine)))
+            except Exception as e:
+                logger.error(f"工作进程 {worker_id} 上报指标失败: {e}")
+
+
+class _WorkerHandle:
+    """主进程中对一个工作进程的引用"""
+
+    def __init__(self, worker_id: int, process, command_queue):
+        self.worker_id = worker_id
+        self.process = process
+        self.command_queue = command_queue
+        self.started_at = time.time()
+        self.restart_count = 0
+
+
+class _SupervisedAccount:
+    """主进程记录的账号分配和回调"""
+
+    def __init__(self, worker_id: int, account_data: dict, on_success: Callable[[], None],
+                 on_failure: Callable[[str], None], on_finished: Callable[[], None]):
+        self.worker_id = worker_id
+        self.account_data = account_data
+        self.on_success = on_success
+        self.on_failure = on_failure
+        self.on_finished = on_finished
+
+
+class ProcessSupervisor:
+    """多进程渠道监督器
+
+    对外接口与 ChannelEngine 一致（start_account/stop_account/stop_all/is_running/
+    get_running_count/get_stats），可以直接替换。
+
+    功能特性：
+    - 按shop_id一致性哈希分配工作进程，同一店铺的账号和消息队列总在同一进程
+    - 连接事件在主进程的事件线程中回调（Qt侧通过信号转回UI线程）
+    - 工作进程日志转发到主进程的'app' logger，指标定期上报
+    - 工作进程异常退出时自动重启，并重新启动其上的账号
+    """
+
+    def __init__(self, num_workers: int = 2, loops_per_worker: int = 1,
+                 metrics_interval: float = 10.0, health_interval: float = 2.0):
+        """
+        初始化监督器
+
+        Args:
+            num_workers: 工作进程数
+            loops_per_worker: 每个工作进程内的事件循环数
+            metrics_interval: 工作进程指标上报间隔（秒）
+            health_interval: 工作进程存活检查间隔（秒）
+        """
+        self.num_workers = max(1, num_workers)
+        self.loops_per_worker = max(1, loops_per_worker)
+        self.metrics_interval = metrics_interval
+        self.health_interval = health_interval
+        self.logger = get_logger("ProcessSupervisor")
+
+        # spawn方式启动，避免在Qt进程中fork
+        self._mp = multiprocessing.get_context("spawn")
+        self._ring = ConsistentHashRing(list(range(self.num_workers)))
+        self._workers: Dict[int, _WorkerHandle] = {}
+        self._accounts: Dict[str, _SupervisedAccount] = {}
+        self._metrics: Dict[int, Dict[str, Any]] = {}
+        self._pending: Dict[int, concurrent.futures.Future] = {}
+        self._request_ids = itertools.count(1)
+        self._lock = threading.RLock()
+        self._event_queue = None
+        self._log_queue = None
+        self._threads: List[threading.Thread] = []
+        self._started = False
+        self._stopping = False
+
+    # ---- 生命周期 ----
+
+    def start(self):
+        """启动所有工作进程和主进程侧的事件/日志线程（重复调用无副作用）"""
+        with self._lock:
+            if self._started:
+                return
+            self._started = True
+            self._stopping = False
+            self._event_queue = self._mp.Queue()
+            self._log_queue = self._mp.Queue()
+            for worker_id in range(self.num_workers):
+                self._spawn_worker(worker_id)
+
+        for target, name in ((self._event_loop, "SupervisorEvents"), (self._log_loop, "SupervisorLogs")):
+            thread = threading.Thread(target=target, name=name, daemon=True)
+            thread.start()
+            self._threads.append(thread)
+        self.logger.info(f"多进程监督器已启动: {self.num_workers} 个工作进程")
+
+    def _spawn_worker(self, worker_id: int, previous: Optional[_WorkerHandle] = None):
+        """启动（或重启）一个工作进程"""
+        command_queue = self._mp.Queue()
+        process = self._mp.Process(
+            target=_worker_main,
+            args=(worker_id, command_queue, self._event_queue, self._log_queue,
+                  self.loops_per_worker, self.metrics_interval),
+            name=f"ChannelWorker-{worker_id}",
+            daemon=True
+        )
+        process.start()
+        handle = _WorkerHandle(worker_id, process, command_queue)
+        if previous is not None:
+            handle.restart_count = previous.restart_count + 1
+        self._workers[worker_id] = handle
+
+    def shutdown(self, timeout: float = 5.0):
+        """停止所有账号和工作进程"""
+        with self._lock:
+            if not self._started:
+                return
+            self._stopping = True
+            workers = list(self._workers.values())
+
+        futures = [self._send(handle.worker_id, 'shutdown', timeout) for handle in workers]
+        concurrent.futures.wait(futures, timeout=timeout + 2)
+        for handle in workers:
+            handle.process.join(timeout=2)
+            if handle.process.is_alive():
+                handle.process.terminate()
+
+        with self._lock:
+            self._workers.clear()
+            self._accounts.clear()
+            self._started = False
+        self.logger.info("多进程监督器已停止")
+
+    # ---- 进程间通信 ----
+
+    def _send(self, worker_id: int, name: str, *args) -> concurrent.futures.Future:
+        """向工作进程发送命令，返回应答Future"""
+        future: concurrent.futures.Future = concurrent.futures.Future()
+        with self._lock:
+            request_id = next(self._request_ids)
+            self._pending[request_id] = future
+            handle = self._workers[worker_id]
+        handle.command_queue.put((name, request_id, args))
+        return future
+
+    def _event_loop(self):
+        """处理工作进程事件，并定期检查工作进程存活"""
+        last_health_check = time.time()
+        while True:
+            try:
+                event = self._event_queue.get(timeout=self.health_interval)
+                self._handle_event(event)
+            except queue.Empty:
+                pass
+            except (EOFError, OSError):
+                return
+            except Exception as e:
+                self.logger.error(f"处理工作进程事件失败: {e}")
+
+            now = time.time()
+            if now - last_health_check >= self.health_interval:
+                last_health_check = now
+                self._check_workers()
+
+    def _handle_event(self, event: tuple):
+        """分发单个事件"""
+        kind, worker_id = event[0], event[1]
+
+        if kind == 'reply':
+            _, _, request_id, result = event
+            with self._lock:
+                future = self._pending.pop(request_id, None)
+            if future is not None and not future.done():
+                future.set_result(result)
+            return
+
+        if kind == 'metrics':
+            with self._lock:
+                self._metrics[worker_id] = event[2]
+            return
+
+        account_key = event[2]
+        with self._lock:
+            account = self._accounts.get(account_key)
+            # 忽略已迁移或已重启的旧进程发来的事件
+            if account is None or account.worker_id != worker_id:
+                return
+            if kind == 'finished' and not self._workers[worker_id].process.is_alive():
+                return
+            if kind == 'finished':
+                del self._accounts[account_key]
+
+        if kind == 'connected':
+            account.on_success()
+        elif kind == 'failed':
+            account.on_failure(event[3])
+        elif kind == 'finished':
+            account.on_finished()
+
+    def _check_workers(self):
+        """重启异常退出的工作进程，并重新启动其上的账号"""
+        with self._lock:
+            if self._stopping:
+                return
+            dead = [handle for handle in self._workers.values() if not handle.process.is_alive()]
+            for handle in dead:
+                self.logger.error(f"工作进程 {handle.worker_id} 异常退出(exitcode={handle.process.exitcode})，正在重启")
+                self._spawn_worker(handle.worker_id, previous=handle)
+                self._metrics.pop(handle.worker_id, None)
+            restarts = [
+                (account_key, account) for account_key, account in self._accounts.items()
+                if any(account.worker_id == handle.worker_id for handle in dead)
+            ]
+
+        for account_key, account in restarts:
+            self.logger.info(f"在重启后的工作进程 {account.worker_id} 上重新启动账号 {account_key}")
+            self._send(account.worker_id, 'start', account_key, account.account_data)
+
+    def _log_loop(self):
+        """把工作进程的日志记录交给主进程的logger处理"""
+        while True:
+            try:
+                record = self._log_queue.get()
+            except (EOFError, OSError):
+                return
+            try:
+                record.msg = f"[{record.processName}] {record.msg}"
+                logging.getLogger(record.name).handle(record)
+            except Exception:
+                pass
+
+    # ---- 与ChannelEngine一致的接口 ----
+
+    def start_account(self, account_key: str, account_data: dict,
+                      on_success: Callable[[], None], on_failure: Callable[[str], None],
+                      on_finished: Callable[[], None]) -> bool:
+        """
+        启动账号连接
+
+        Args:
+            account_key: 账号键
+            account_data: 账号数据，需包含shop_id和user_id
+            on_success: 连接成功回调
+            on_failure: 连接失败回调
+            on_finished: 连接结束回调
+
+        Returns:
+            是否已提交启动（账号已在运行时返回False）
+        """
+        self.start()
+        worker_id = self._ring.get_node(account_data['shop_id'])
+
+        with self._lock:
+            if account_key in self._accounts:
+                return False
+            self._accounts[account_key] = _SupervisedAccount(
+                worker_id, account_data, on_success, on_failure, on_finished
+            )
+
+        try:
+            return bool(self._send(worker_id, 'start', account_key, account_data).result(timeout=10))
+        except Exception as e:
+            self.logger.error(f"启动账号 {account_key} 失败: {e}")
+            with self._lock:
+                self._accounts.pop(account_key, None)
+            return False
+
+    def stop_account(self, account_key: str, timeout: float = 5.0) -> bool:
+        """停止账号连接并等待结束"""
+        with self._lock:
+            account = self._accounts.get(account_key)
+        if account is None:
+            return False
+
+        try:
+            return bool(self._send(account.worker_id, 'stop', account_key, timeout).result(timeout=timeout + 2))
+        except Exception as e:
+            self.logger.error(f"停止账号 {account_key} 失败: {e}")
+            return False
+
+    def stop_all(self, timeout: float = 5.0):
+        """停止所有工作进程上的账号（并行）"""
+        with self._lock:
+            if not self._started:
+                return
+            worker_ids = list(self._workers)
+        futures = [self._send(worker_id, 'stop_all', timeout) for worker_id in worker_ids]
+        concurrent.futures.wait(futures, timeout=timeout + 2)
+
+    def is_running(self, account_key: str) -> bool:
+        """检查账号是否在运行"""
+        with self._lock:
+            return account_key in self._accounts
+
+    def get_running_count(self) -> int:
+        """获取运行中的账号数量"""
+        with self._lock:
+            return len(self._accounts)
+
+    def get_stats(self) -> Dict[str, Any]:
+        """获取监督器和各工作进程的统计信息"""
+        with self._lock:
+            per_worker = {worker_id: 0 for worker_id in self._workers}
+            for account in self._accounts.values():
+                per_worker[account.worker_id] = per_worker.get(account.worker_id, 0) + 1
+            return {
+                'num_workers': self.num_workers,
+                'running_accounts': len(self._accounts),
+                'workers': {
+                    worker_id: {
+                        'pid': handle.process.pid,
+                        'alive': handle.process.is_alive(),
+                        'restart_count': handle.restart_count,
+                        'accounts': per_worker.get(worker_id, 0),
+                        'metrics': self._metrics.get(worker_id)
+                    }
+                    for worker_id, handle in self._workers.items()
+                }
+            }
@@ -3,7 +3,7 @@ Message模块初始化文件
 提供消息队列和消费者系统的便捷接口
 """
 
-from Message.message_queue import MessageQueue, MessageQueueManager, message_queue_manager
+from Message.message_queue import MessageQueue, MessageQueueManager, MessageEnvelope, QueueFullError, message_queue_manager
 from Message.message_consumer import (
     MessageHandler, 
     MessageConsumer, 
@@ -102,7 +102,7 @@ async def stop_consumer(queue_name: str):
     await message_consumer_manager.stop_consumer(queue_name)
 
 
-async def put_message(queue_name: str, context: Context) -> str:
+async def put_message(queue_name: str, context: Context) -> int:
     """
     向队列放入消息
     
@@ -117,6 +117,21 @@ async def put_message(queue_name: str, context: Context) -> str:
     return await queue.put(context)
 
 
+async def put_messages(queue_name: str, contexts: list) -> list:
+    """
+    向队列批量放入消息
+    
+    Args:
+        queue_name: 队列名称
+        contexts: Context格式的消息列表
+        
+    Returns:
+        消息ID列表，被溢出策略拒绝的消息为None
+    """
+    queue = message_queue_manager.get_or_create_queue(queue_name)
+    return await queue.put_many(contexts)
+
+
 async def get_message(queue_name: str, timeout: float = None):
     """
     从队列获取消息
@@ -138,6 +153,8 @@ async def get_message(queue_name: str, timeout: float = None):
 __all__ = [
     'MessageQueue',
     'MessageQueueManager', 
+    'MessageEnvelope',
+    'QueueFullError',
     'MessageHandler',
     'MessageConsumer',
     'MessageConsumerManager',
@@ -159,5 +176,6 @@ __all__ = [
     'start_consumer',
     'stop_consumer',
     'put_message',
+    'put_messages',
     'get_message'
 ] 
\ No newline at end of file
@@ -0,0 +1,325 @@
+"""
+AI调用并发控制
+进程内所有消费者共用的AI调用并发闸门：全局和店铺两级并发上限，
+等待中的请求按店铺轮询分配（一个繁忙店铺不会饿死其他店铺），
+全局上限按观测到的调用延迟和错误做AIMD（加性增、乘性减）调整
+"""
+
+import asyncio
+import concurrent.futures
+import threading
+import time
+from collections import OrderedDict, deque
+from contextlib import asynccontextmanager
+from typing import Any, Deque, Dict, List, Optional, Tuple
+
+from config import config
+from utils.logger import get_logger
+from utils.performance_monitor import record_metric
+
+
+# AI并发控制默认配置，可通过config中的ai_concurrency覆盖，
+# ai_concurrency.shops.<shop_id> 可单独设置该店铺的shop_limit
+DEFAULT_AI_CONCURRENCY_CONFIG = {
+    "enabled": True,
+    # 全局并发上限（AIMD调整的上界），不应超过ai_executor_workers
+    "global_limit": 16,
+    # AIMD调整的下界
+    "min_global_limit": 2,
+    # 单个店铺的并发上限
+    "shop_limit": 4,
+    # 单次调用延迟超过该值（秒）视为拥塞
+    "target_latency": 8.0,
+    # 每个成功窗口（约等于当前上限次成功调用）增加的并发数
+    "increase_step": 1.0,
+    # 拥塞或出错时上限乘以该系数
+    "decrease_factor": 0.7,
+    # 两次乘性减之间的最小间隔（秒），避免同一波拥塞连续减小
+    "decrease_interval": 5.0,
+    "shops": {}
+}
+
+# 延迟和错误率的指数移动平均系数
+EWMA_ALPHA = 0.2
+
+
+class _Permit:
+    """一次AI调用占用的并发名额
+
+    调用方可通过fail()标记未抛异常的失败（如Bot返回的兜底话术），
+    通过hold()绑定在线程池中执行的调用：超时退出时该调用仍在请求AI服务，名额等它结束后才归还
+    """
+
+    __slots__ = ('shop_id', 'failed', 'future')
+
+    def __init__(self, shop_id: str):
+        self.shop_id = shop_id
+        self.failed = False
+        self.future: Optional[concurrent.futures.Future] = None
+
+    def fail(self):
+        self.failed = True
+
+    def hold(self, future: concurrent.futures.Future):
+        self.future = future
+
+
+class AIConcurrencyGovernor:
+    """AI调用并发控制器
+
+    功能特性：
+    - 全局并发上限按AIMD调整：调用成功且延迟正常时缓慢增加，超时、出错或延迟过高时按比例减小
+    - 店铺并发上限：单个店铺最多同时占用shop_limit个名额
+    - 公平排队：名额释放时在有等待请求的店铺之间轮询分配，同一店铺内先到先得
+    - 线程安全：多个引擎事件循环可共用，名额通过call_soon_threadsafe交给等待方所在的循环
+    """
+
+    def __init__(self, settings: Optional[Dict[str, Any]] = None):
+        """
+        初始化并发控制器
+
+        Args:
+            settings: 配置项（见DEFAULT_AI_CONCURRENCY_CONFIG），为None时使用默认配置
+        """
+        settings = {**DEFAULT_AI_CONCURRENCY_CONFIG, **(settings or {})}
+        self.enabled = bool(settings["enabled"])
+        self.max_limit = max(1, int(settings["global_limit"]))
+        self.min_limit = max(1, min(int(settings["min_global_limit"]), self.max_limit))
+        self.shop_limit = max(1, int(settings["shop_limit"]))
+        self.shop_limits = {str(shop_id): max(1, int(shop_settings.get("shop_limit", self.shop_limit)))
+                            for shop_id, shop_settings in (settings.get("shops") or {}).items()}
+        self.target_latency = float(settings["target_latency"])
+        self.increase_step = float(settings["increase_step"])
+        self.decrease_factor = float(settings["decrease_factor"])
+        self.decrease_interval = float(settings["decrease_interval"])
+        self.logger = get_logger("AIConcurrencyGovernor")
+
+        self._lock = threading.Lock()
+        self._limit = float(self.max_limit)
+        self._in_flight = 0
+        self._shop_in_flight: Dict[str, int] = {}
+        # 等待中的请求 {shop_id: deque[(loop, future)]}，按轮询顺序排列
+        self._waiters: "OrderedDict[str, Deque[Tuple[asyncio.AbstractEventLoop, asyncio.Future]]]" = OrderedDict()
+        self._last_decrease = 0.0
+        self._latency_ewma: Optional[float] = None
+        self._error_rate = 0.0
+        # detached: 调用方已超时退出、名额等线程池中的调用结束后才归还的次数
+        self._stats = {'acquired': 0, 'queued': 0, 'errors': 0, 'slow_calls': 0,
+                       'increases': 0, 'decreases': 0, 'detached': 0}
+
+    @property
+    def limit(self) -> int:
+        """当前生效的全局并发上限"""
+        return max(self.min_limit, int(self._limit))
+
+    def _shop_limit(self, shop_id: str) -> int:
+        return self.shop_limits.get(shop_id, self.shop_limit)
+
+    def _can_start(self, shop_id: str) -> bool:
+        return (self._in_flight < self.limit
+                and self._shop_in_flight.get(shop_id, 0) < self._shop_limit(shop_id))
+
+    def _start(self, shop_id: str):
+        self._in_flight += 1
+        self._shop_in_flight[shop_id] = self._shop_in_flight.get(shop_id, 0) + 1
+        self._stats['acquired'] += 1
+
+    def _finish(self, shop_id: str):
+        self._in_flight -= 1
+        remaining = self._shop_in_flight.get(shop_id, 0) - 1
+        if remaining > 0:
+            self._shop_in_flight[shop_id] = remaining
+        else:
+            self._shop_in_flight.pop(shop_id, None)
+
+    def _dispatch_locked(self) -> List[Tuple[asyncio.AbstractEventLoop, asyncio.Future, str]]:
+        """在有等待请求的店铺之间轮询分配空闲名额（需持有锁）"""
+        grants = []
+        while self._waiters and self._in_flight < self.limit:
+            for shop_id in self._waiters:
+                if self._shop_in_flight.get(shop_id, 0) < self._shop_limit(shop_id):
+                    break
+            else:
+                break
+
+            waiters = self._waiters[shop_id]
+            loop, future = waiters.popleft()
+            if waiters:
+                self._waiters.move_to_end(shop_id)
+            else:
+                del self._waiters[shop_id]
+            self._start(shop_id)
+            grants.append((loop, future, shop_id))
+        return grants
+
+    def _deliver(self, grants: List[Tuple[asyncio.AbstractEventLoop, asyncio.Future, str]]):
+        """把名额交给等待方（在等待方所在的事件循环中完成future）"""
+        for loop, future, shop_id in grants:
+            try:
+                loop.call_soon_threadsafe(self._grant, future, shop_id)
+            except RuntimeError:
+                # 等待方的事件循环已关闭，归还名额
+                self._release(shop_id)
+
+    def _grant(self, future: asyncio.Future, shop_id: str):
+        if future.done():
+            # 等待方已取消，归还名额
+            self._release(shop_id)
+        else:
+            future.set_result(None)
+
+    def _release(self, shop_id: str):
+        """归还名额但不计入AIMD统计"""
+        with self._lock:
+            self._finish(shop_id)
+            grants = self._dispatch_locked()
+        self._deliver(grants)
+
+    async def acquire(self, shop_id: str):
+        """
+        获取一个AI调用名额，没有空闲名额时排队等待
+
+        Args:
+            shop_id: 店铺ID
+        """
+        shop_id = str(shop_id)
+        loop = asyncio.get_running_loop()
+        with self._lock:
+            # 该店铺没有排队的请求且有空闲名额时直接开始（其他店铺的排队请求都受店铺上限限制）
+            if shop_id not in self._waiters and self._can_start(shop_id):
+                self._start(shop_id)
+                return
+            future = loop.create_future()
+            self._waiters.setdefault(shop_id, deque()).append((loop, future))
+            self._stats['queued'] += 1
+
+        try:
+            await future
+        except asyncio.CancelledError:
+            with self._lock:
+                waiters = self._waiters.get(shop_id)
+                if waiters is not None and (loop, future) in waiters:
+                    waiters.remove((loop, future))
+                    if not waiters:
+                        del self._waiters[shop_id]
+                    granted = False
+                else:
+                    # 已分配名额：future已完成时由这里归还，否则由_grant归还
+                    granted = future.done() and not future.cancelled()
+            if granted:
+                self._release(shop_id)
+            raise
+
+    def release(self, shop_id: str, latency: Optional[float] = None, error: bool = False):
+        """
+        归还名额并根据本次调用结果调整全局上限
+
+        Args:
+            shop_id: 店铺ID
+            latency: 调用耗时（秒）
+            error: 调用是否失败（超时、异常、限流等）
+        """
+        shop_id = str(shop_id)
+        adjusted = None
+        with self._lock:
+            self._finish(shop_id)
+            slow = latency is not None and latency > self.target_latency
+            if latency is not None:
+                self._latency_ewma = latency if self._latency_ewma is None else (
+                    EWMA_ALPHA * latency + (1 - EWMA_ALPHA) * self._latency_ewma)
+            self._error_rate = EWMA_ALPHA * (1.0 if error else 0.0) + (1 - EWMA_ALPHA) * self._error_rate
+            if error:
+                self._stats['errors'] += 1
+            if slow:
+                self._stats['slow_calls'] += 1
+
+            now = time.monotonic()
+            if error or slow:
+                if self._limit > self.min_limit and now - self._last_decrease >= self.decrease_interval:
+                    self._limit = max(float(self.min_limit), self._limit * self.decrease_factor)
+                    self._last_decrease = now
+                    self._stats['decreases'] += 1
+                    adjusted = self.limit
+            elif self._limit < self.max_limit:
+                previous = self.limit
+                self._limit = min(float(self.max_limit), self._limit + self.increase_step / self._limit)
+                if self.limit != previous:
+                    self._stats['increases'] += 1
+                    adjusted = self.limit
+
+            grants = self._dispatch_locked()
+        self._deliver(grants)
+
+        if adjusted is not None:
+            self.logger.debug(f"AI并发上限调整为 {adjusted}（错误: {error}，耗时: {latency}）")
+            record_metric("ai_concurrency_limit", adjusted, "count")
+
+    @asynccontextmanager
+    async def slot(self, shop_id: str):
+        """
+        在名额内执行一次AI调用，自动记录耗时，抛出异常或调用permit.fail()视为失败
+
+        用法：
+            async with governor.slot(shop_id) as permit:
+                reply = await call_ai()
+                if is_fallback(reply):
+                    permit.fail()
+        """
+        permit = _Permit(str(shop_id))
+        if not self.enabled:
+            yield permit
+            return
+
+        wait_start = time.monotonic()
+        await self.acquire(permit.shop_id)
+        waited = time.monotonic() - wait_start
+        if waited > 0.05:
+            record_metric("ai_concurrency_wait", waited, "s", {"shop_id": permit.shop_id})
+
+        start = time.monotonic()
+        try:
+            yield permit
+        except BaseException:
+            self._release_permit(permit, start, error=True)
+            raise
+        self._release_permit(permit, start, error=permit.failed)
+
+    def _release_permit(self, permit: _Permit, start: float, error: bool):
+        """归还名额；绑定的线程池调用还未结束时（如等待超时），等它结束后再归还"""
+        future = permit.future
+        if future is None or future.done():
+            self.release(permit.shop_id, time.monotonic() - start, error=error)
+            return
+        with self._lock:
+            self._stats['detached'] += 1
+        future.add_done_callback(
+            lambda _: self.release(permit.shop_id, time.monotonic() - start, error=True))
+
+    def get_stats(self) -> Dict[str, Any]:
+        """获取并发控制统计信息"""
+        with self._lock:
+            return {
+                **self._stats,
+                'enabled': self.enabled,
+                'limit': self.limit,
+                'max_limit': self.max_limit,
+                'in_flight': self._in_flight,
+                'waiting': sum(len(waiters) for waiters in self._waiters.values()),
+                'waiting_shops': len(self._waiters),
+                'shop_in_flight': dict(self._shop_in_flight),
+                'latency_ewma': self._latency_ewma,
+                'error_rate': self._error_rate
+            }
+
+
+_ai_governor: Optional[AIConcurrencyGovernor] = None
+_ai_governor_lock = threading.Lock()
+
+
+def get_ai_governor() -> AIConcurrencyGovernor:
+    """获取进程内共享的AI并发控制器（首次使用时按配置创建）"""
+    global _ai_governor
+    with _ai_governor_lock:
+        if _ai_governor is None:
+            _ai_governor = AIConcurrencyGovernor(config.get("ai_concurrency"))
+        return _ai_governor
@@ -0,0 +1,242 @@
+"""
+消息队列持久化存储
+把入队的消息写入WAL模式的SQLite表，处理成功（ack）、过期或被丢弃后删除，
+程序重启后未过期的消息按原始时间戳重新入队
+"""
+
+import atexit
+import json
+import sqlite3
+import threading
+import time
+from pathlib import Path
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+from config import config
+from utils.logger import get_logger
+
+
+class DurableMessageStore:
+    """WAL模式SQLite消息日志
+
+    功能特性：
+    - 写入（入队/删除）由后台线程批量提交，一个刷盘窗口内的所有写入合并为一个事务，
+      WAL + synchronous=NORMAL 下每批只在提交时写一次日志
+    - 同一批次内先入队后删除的消息直接抵消，不落盘
+    - 消息按 (queue_name, id) 唯一，多个队列（或多个工作进程）的消息ID重复时互不覆盖
+    - 读取（重放）使用独立连接，先等待已提交的写入全部落盘
+    """
+
+    def __init__(self, db_path: str = "./database/message_queue.db",
+                 flush_interval: float = 0.2, batch_size: int = 200):
+        """
+        初始化持久化存储
+
+        Args:
+            db_path: SQLite数据库文件路径
+            flush_interval: 批量提交的等待窗口（秒）
+            batch_size: 达到该数量时立即提交
+        """
+        self.db_path = Path(db_path)
+        self.flush_interval = flush_interval
+        self.batch_size = batch_size
+        self.logger = get_logger("DurableMessageStore")
+
+        self._pending: List[Tuple[str, Any]] = []
+        self._cond = threading.Condition()
+        self._in_flight = 0
+        self._closed = False
+        self._stats = {'inserted': 0, 'deleted': 0, 'cancelled': 0, 'batches': 0, 'failed_batches': 0}
+
+        self._init_db()
+        self._thread = threading.Thread(target=self._writer_loop, name="DurableMessageStore", daemon=True)
+        self._thread.start()
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = sqlite3.connect(self.db_path, timeout=30)
+        conn.execute('''PRAGMA journal_mode = WAL''')
+        conn.execute('''PRAGMA synchronous = NORMAL''')
+        return conn
+
+    def _init_db(self):
+        """初始化数据库和表结构"""
+        self.db_path.parent.mkdir(parents=True, exist_ok=True)
+        conn = self._connect()
+        try:
+            conn.execute('''CREATE TABLE IF NOT EXISTS queued_messages (
+                            id TEXT NOT NULL,
+                            queue_name TEXT NOT NULL,
+                            timestamp REAL NOT NULL,
+                            record TEXT NOT NULL,
+                            PRIMARY KEY (queue_name, id)
+                        )''')
+            conn.execute('''CREATE INDEX IF NOT EXISTS idx_queued_messages_queue
+                            ON queued_messages (queue_name, timestamp)''')
+            conn.commit()
+        finally:
+            conn.close()
+
+    # ---- 写入（任意线程调用，后台线程批量提交） ----
+
+    def _submit(self, ops: List[Tuple[str, Any]]):
+        with self._cond:
+            if self._closed:
+                return
+            self._pending.extend(ops)
+            self._cond.notify()
+
+    def append(self, queue_name: str, record: Dict[str, Any]):
+        """
+        写入一条入队消息
+
+        Args:
+            queue_name: 队列名称
+            record: 消息记录，需包含id和timestamp
+        """
+        self._submit([('insert', (str(record['id']), queue_name, record['timestamp'],
+                                  json.dumps(record, ensure_ascii=False, default=str)))])
+
+    def delete(self, queue_name: str, message_ids: Iterable[str]):
+        """
+        删除已处理、过期或被丢弃的消息
+
+        Args:
+            queue_name: 队列名称
+            message_ids: 消息ID
+        """
+        ops = [('delete', (str(message_id), queue_name)) for message_id in message_ids]
+        if ops:
+            self._submit(ops)
+
+    def delete_queue(self, queue_name: str):
+        """删除队列的所有消息"""
+        self._submit([('delete_queue', queue_name)])
+
+    def _writer_loop(self):
+        """后台写入线程：攒批后在一个事务中提交"""
+        conn = self._connect()
+        try:
+            while True:
+                with self._cond:
+                    while not self._pending and not self._closed:
+                        self._cond.wait()
+                    if not self._pending and self._closed:
+                        return
+                    # 等待一个刷盘窗口，让更多写入合并到同一批次
+                    if len(self._pending) < self.batch_size and not self._closed:
+                        self._cond.wait(self.flush_interval)
+                    batch, self._pending = self._pending, []
+                    self._in_flight = len(batch)
+
+                self._write_batch(conn, batch)
+
+                with self._cond:
+                    self._in_flight = 0
+                    self._cond.notify_all()
+        finally:
+            conn.close()
+
+    def _write_batch(self, conn: sqlite3.Connection, batch: List[Tuple[str, Any]]):
+        """在一个事务中执行一批写入"""
+        # 同一批次内入队后又删除的消息不必落盘
+        inserted = {args[:2] for op, args in batch if op == 'insert'}
+        cancelled = {args for op, args in batch if op == 'delete' and args in inserted}
+
+        try:
+            with conn:
+                for op, args in batch:
+                    if op == 'insert':
+                        if args[:2] in cancelled:
+                            continue
+                        conn.execute('''INSERT OR REPLACE INTO queued_messages
+                                        (id, queue_name, timestamp, record) VALUES (?, ?, ?, ?)''', args)
+                        self._stats['inserted'] += 1
+                    elif op == 'delete':
+                        if args in cancelled:
+                            continue
+                        conn.execute('''DELETE FROM queued_messages WHERE id = ? AND queue_name = ?''', args)
+                        self._stats['deleted'] += 1
+                    elif op == 'delete_queue':
+                        conn.execute('''DELETE FROM queued_messages WHERE queue_name = ?''', (args,))
+            self._stats['cancelled'] += len(cancelled)
+            self._stats['batches'] += 1
+        except sqlite3.Error as e:
+            self._stats['failed_batches'] += 1
+            self.logger.error(f"持久化消息批次写入失败（{len(batch)}条）: {e}")
+
+    def flush(self, timeout: Optional[float] = 5.0) -> bool:
+        """等待已提交的写入全部落盘"""
+        deadline = None if timeout is None else time.time() + timeout
+        with self._cond:
+            self._cond.notify()
+            while self._pending or self._in_flight:
+                remaining = None if deadline is None else deadline - time.time()
+                if remaining is not None and remaining <= 0:
+                    return False
+                self._cond.wait(remaining)
+        return True
+
+    # ---- 读取 ----
+
+    def load(self, queue_name: str, min_timestamp: float) -> List[Dict[str, Any]]:
+        """
+        读取队列中未过期的消息，并删除已过期的消息
+
+        Args:
+            queue_name: 队列名称
+            min_timestamp: 早于该时间戳的消息视为已过期
+
+        Returns:
+            按时间戳排序的消息记录
+        """
+        self.flush()
+        conn = self._connect()
+        try:
+            with conn:
+                conn.execute('''DELETE FROM queued_messages WHERE queue_name = ? AND timestamp <= ?''',
+                             (queue_name, min_timestamp))
+            rows = conn.execute('''SELECT record FROM queued_messages
+                                   WHERE queue_name = ? ORDER BY timestamp''', (queue_name,)).fetchall()
+        finally:
+            conn.close()
+
+        records = []
+        for (record,) in rows:
+            try:
+                records.append(json.loads(record))
+            except json.JSONDecodeError as e:
+                self.logger.error(f"解析持久化消息失败: {e}")
+        return records
+
+    def close(self, timeout: float = 5.0):
+        """写入剩余数据并停止后台线程"""
+        with self._cond:
+            if self._closed:
+                return
+            self._closed = True
+            self._cond.notify_all()
+        self._thread.join(timeout=timeout)
+
+    def get_stats(self) -> Dict[str, Any]:
+        """获取存储统计信息"""
+        with self._cond:
+            return {**self._stats, 'pending': len(self._pending) + self._in_flight}
+
+
+_durable_store: Optional[DurableMessageStore] = None
+_durable_store_lock = threading.Lock()
+
+
+def get_durable_store() -> DurableMessageStore:
+    """获取全局持久化存储（首次使用时创建，程序退出时写入剩余数据）"""
+    global _durable_store
+    with _durable_store_lock:
+        if _durable_store is None:
+            queue_config = config.get("message_queue") or {}
+            _durable_store = DurableMessageStore(
+                db_path=queue_config.get("durable_path", "./database/message_queue.db"),
+                flush_interval=queue_config.get("durable_flush_interval", 0.2),
+                batch_size=queue_config.get("durable_batch_size", 200)
+            )
+            atexit.register(_durable_store.close)
+        return _durable_store
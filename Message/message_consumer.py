@@ -4,15 +4,42 @@
 """
 
 import asyncio
-from typing import Callable, Optional, Dict, Any, List, Awaitable
+import time
+from collections import OrderedDict, deque
+from typing import Callable, Optional, Dict, Any, List, Awaitable, Deque
 from abc import ABC, abstractmethod
 from venv import logger
 from bridge.context import Context
-from Message.message_queue import message_queue_manager
+from config import config
+from Message.message_queue import MessageEnvelope, message_queue_manager
 from utils.logger import get_logger
 
 logger = get_logger()
 
+
+# 同一用户连续消息合并处理的默认配置，可通过config中的message_coalesce覆盖
+DEFAULT_COALESCE_CONFIG = {
+    "enabled": True,
+    # 静默窗口（秒）：窗口内收到同一用户的新消息则继续等待
+    "window": 1.5,
+    # 从第一条消息起最长等待时间（秒）
+    "max_wait": 4.0,
+    # 一次最多合并的消息数
+    "max_messages": 5
+}
+
+# 用户处理器表的默认配置，可通过config中的message_consumer覆盖
+DEFAULT_CONSUMER_CONFIG = {
+    # 每个消费者保留的用户处理器上限，超过时淘汰最久未使用的空闲处理器
+    "max_user_processors": 2000,
+    # 空闲超过该时间（秒）的处理器在下次创建处理器时被淘汰
+    "processor_idle_ttl": 300.0
+}
+
+# 每次淘汰时最多检查的处理器数量（从最久未使用的一端开始）
+EVICT_SCAN_LIMIT = 64
+
+
 class MessageHandler(ABC):
     """消息处理器抽象基类"""
     
@@ -43,6 +70,34 @@ class MessageHandler(ABC):
         """
         pass
 
+    def can_coalesce(self, context: Context) -> bool:
+        """
+        判断该消息能否与同一用户紧接着的后续消息合并处理
+
+        Args:
+            context: Context格式的消息
+
+        Returns:
+            bool: 是否可以合并（默认不合并）
+        """
+        return False
+
+    async def handle_batch(self, contexts: List[Context], metadata_list: List[Dict[str, Any]]) -> bool:
+        """
+        合并处理同一用户连续发送的多条消息，默认逐条调用handle
+
+        Args:
+            contexts: 按接收顺序排列的消息
+            metadata_list: 与contexts一一对应的消息元数据
+
+        Returns:
+            bool: 是否全部处理成功
+        """
+        for context, metadata in zip(contexts, metadata_list):
+            if not await self.handle(context, metadata):
+                return False
+        return True
+
 
 class TypeBasedHandler(MessageHandler):
     """基于消息类型的处理器"""
@@ -99,106 +154,198 @@ class ChannelBasedHandler(MessageHandler):
 
 
 class UserSequentialProcessor:
-    """用户消息顺序处理器"""
-    
-    def __init__(self, user_id: str, handlers: List[MessageHandler]):
+    """用户消息顺序处理器
+
+    只保存用户的待处理消息和调度状态，本身不运行任务：有消息可处理时由消费者放入就绪队列，
+    消费者的工作协程取出后处理一批消息。同一用户同一时刻最多被一个工作协程处理；
+    待处理消息按消息ID（入队顺序）排列，即使队列出队顺序与入队顺序不同也按入队顺序处理。
+    空闲用户只保留这个轻量对象（可被消费者随时淘汰）。
+    """
+
+    __slots__ = ('user_id', 'handlers', 'on_processed', 'coalesce_enabled', 'coalesce_window',
+                 'coalesce_max_wait', 'coalesce_max_messages', 'pending', 'queued', 'running',
+                 'timer', 'last_active', 'logger')
+
+    def __init__(self, user_id: str, handlers: List[MessageHandler],
+                 on_processed: Optional[Callable[[MessageEnvelope], None]] = None,
+                 coalesce: Optional[Dict[str, Any]] = None):
+        """
+        Args:
+            user_id: 用户ID
+            handlers: 消息处理器列表
+            on_processed: 消息处理成功或没有处理器时的回调（用于确认持久化消息）
+            coalesce: 消息合并配置（见DEFAULT_COALESCE_CONFIG），为None或未启用时逐条处理
+        """
         self.user_id = user_id
         self.handlers = handlers
-        self.message_queue = asyncio.Queue()
-        self.is_processing = False
-        self.processor_task = None
-        self.logger = get_logger()
-    
-    async def add_message(self, message_wrapper: Dict[str, Any]):
-        """添加消息到用户队列"""
-        await self.message_queue.put(message_wrapper)
-        
-        # 启动处理器（如果未运行）
-        if not self.is_processing:
-            self.processor_task = asyncio.create_task(self._process_user_messages())
-    
-    async def _process_user_messages(self):
-        """处理用户消息队列（串行处理）"""
-        self.is_processing = True
-        try:
-            while True:
-                try:
-                    # 获取消息，超时后退出
-                    message_wrapper = await asyncio.wait_for(
-                        self.message_queue.get(), 
-                        timeout=30.0  # 30秒无消息则关闭处理器
-                    )
-                    
-                    await self._process_single_message(message_wrapper)
-                    
-                except asyncio.TimeoutError:
-                    # 超时无消息，退出处理器
-                    self.logger.debug(f"用户 {self.user_id} 消息处理器超时退出")
-                    break
-                    
-        except Exception as e:
-            self.logger.error(f"用户 {self.user_id} 消息处理器异常: {e}")
-        finally:
-            self.is_processing = False
-    
-    async def _process_single_message(self, message_wrapper: Dict[str, Any]):
-        """处理单条消息"""
-        message_id = message_wrapper['id']
-        context = message_wrapper['context']
-        
+        self.on_processed = on_processed
+        coalesce = coalesce or {}
+        self.coalesce_enabled = bool(coalesce.get("enabled")) and coalesce.get("max_messages", 1) > 1
+        self.coalesce_window = float(coalesce.get("window", 0))
+        self.coalesce_max_wait = float(coalesce.get("max_wait", 0))
+        self.coalesce_max_messages = int(coalesce.get("max_messages", 1))
+        self.pending: Deque[MessageEnvelope] = deque()
+        # 是否在消费者的就绪队列中 / 是否正被工作协程处理
+        self.queued = False
+        self.running = False
+        # 等待合并窗口结束的定时器
+        self.timer: Optional[asyncio.TimerHandle] = None
+        self.last_active = time.monotonic()
+        self.logger = logger
+
+    @property
+    def is_processing(self) -> bool:
+        """是否正被工作协程处理"""
+        return self.running
+
+    @property
+    def is_idle(self) -> bool:
+        """没有待处理消息也没有在排队或处理，可以直接丢弃"""
+        return not self.pending and not self.queued and not self.running
+
+    def add_message(self, message_wrapper: MessageEnvelope):
+        """添加消息到用户队列（按消息ID保持入队顺序，由消费者负责调度）"""
+        pending = self.pending
+        if pending and pending[-1].id > message_wrapper.id:
+            # 比已有消息更早入队的消息插入到对应位置
+            index = len(pending) - 1
+            while index > 0 and pending[index - 1].id > message_wrapper.id:
+                index -= 1
+            pending.insert(index, message_wrapper)
+        else:
+            pending.append(message_wrapper)
+        self.last_active = time.monotonic()
+
+    def _can_coalesce_with(self, handler: Optional[MessageHandler], context: Context) -> bool:
+        return handler is not None and self._find_handler(context) is handler and handler.can_coalesce(context)
+
+    def ready_delay(self) -> float:
+        """
+        距离可以处理还需等待的时间（秒），0表示现在就可以处理
+
+        队头消息可合并时，等到最后一条消息之后的静默窗口结束（从队头消息起最长max_wait秒）；
+        消息数达到合并上限或最后一条消息不能与队头合并时立即处理。
+        """
+        if not self.pending or not self.coalesce_enabled:
+            return 0.0
+
+        head = self.pending[0]
+        handler = self._find_handler(head.context)
+        if handler is None or not handler.can_coalesce(head.context):
+            return 0.0
+        if len(self.pending) >= self.coalesce_max_messages:
+            return 0.0
+        last = self.pending[-1]
+        if last is not head and not self._can_coalesce_with(handler, last.context):
+            return 0.0
+
+        ready_at = min(last.timestamp + self.coalesce_window, head.timestamp + self.coalesce_max_wait)
+        return max(0.0, ready_at - time.time())
+
+    def _find_handler(self, context: Context) -> Optional[MessageHandler]:
+        """查找第一个能处理该消息的处理器"""
+        for handler in self.handlers:
+            if handler.can_handle(context):
+                return handler
+        return None
+
+    def take_batch(self):
+        """
+        取出下一批要处理的消息
+
+        队头消息和紧接着的、同一处理器可合并的消息放入同一批次；遇到不能合并的消息时结束本批次，
+        该消息留在队列头部由下一批处理，保证用户消息顺序不变。
+
+        Returns:
+            (消息批次, 处理器)
+        """
+        first = self.pending.popleft()
+        handler = self._find_handler(first.context)
+        batch = [first]
+        if self.coalesce_enabled and handler is not None and handler.can_coalesce(first.context):
+            while (self.pending and len(batch) < self.coalesce_max_messages
+                   and self._can_coalesce_with(handler, self.pending[0].context)):
+                batch.append(self.pending.popleft())
+        return batch, handler
+
+    async def _process_messages(self, batch: List[MessageEnvelope], handler: Optional[MessageHandler]):
+        """处理一批消息（单条或合并后的多条）"""
+        message_ids = ",".join(str(message_wrapper.id) for message_wrapper in batch)
+
         try:
-            # 查找能处理该消息的处理器
-            handled = False
-            for handler in self.handlers:
-                if handler.can_handle(context):
-                    self.logger.debug(f"用户 {self.user_id} 使用处理器 {handler.__class__.__name__} 处理消息 {message_id}")
-                    
-                    success = await handler.handle(context, message_wrapper)
-                    if success:
-                        handled = True
-                        self.logger.debug(f"用户 {self.user_id} 消息 {message_id} 处理成功")
-                    else:
-                        self.logger.warning(f"用户 {self.user_id} 消息 {message_id} 处理失败")
-                    break
-            
-            if not handled:
-                self.logger.warning(f"用户 {self.user_id} 消息 {message_id} 没有合适的处理器")
-                
+            if handler is None:
+                # 没有处理器是最终结果，重放也不会被处理，同样确认删除
+                self.logger.warning(f"用户 {self.user_id} 消息 {message_ids} 没有合适的处理器")
+                self._ack_batch(batch)
+                return
+
+            self.logger.debug(f"用户 {self.user_id} 使用处理器 {handler.__class__.__name__} 处理消息 {message_ids}")
+            if len(batch) == 1:
+                success = await handler.handle(batch[0].context, batch[0])
+            else:
+                success = await handler.handle_batch([message_wrapper.context for message_wrapper in batch], batch)
+
+            if not success:
+                self.logger.warning(f"用户 {self.user_id} 消息 {message_ids} 处理失败")
+                return
+
+            self.logger.debug(f"用户 {self.user_id} 消息 {message_ids} 处理成功")
+            self._ack_batch(batch)
+
         except Exception as e:
-            self.logger.error(f"用户 {self.user_id} 处理消息 {message_id} 时发生异常: {e}")
-    
-    async def stop(self):
-        """停止用户消息处理器"""
-        if self.processor_task and not self.processor_task.done():
-            self.processor_task.cancel()
-            try:
-                await self.processor_task
-            except asyncio.CancelledError:
-                pass
-        self.is_processing = False
+            self.logger.error(f"用户 {self.user_id} 处理消息 {message_ids} 时发生异常: {e}")
+
+    def _ack_batch(self, batch: List[MessageEnvelope]):
+        """确认一批已有最终结果的消息（处理失败的消息不确认，重启后重放）"""
+        if self.on_processed:
+            for message_wrapper in batch:
+                self.on_processed(message_wrapper)
+
+    def stop(self):
+        """停止用户消息处理器，丢弃未处理的消息"""
+        self.pending.clear()
+        if self.timer is not None:
+            self.timer.cancel()
+            self.timer = None
 
 
 class MessageConsumer:
-    """消息消费者 - 支持按用户分组的串行处理"""
+    """消息消费者 - 支持按用户分组的串行处理
+
+    调度完全由事件驱动：分发协程阻塞等待队列中的消息，按用户放入各自的处理器；
+    有待处理消息的用户进入就绪队列，由固定数量的工作协程取出处理。
+    空闲时所有协程都在等待，不轮询、不创建定时器。
+    """
     
-    def __init__(self, queue_name: str, max_concurrent: int = 10):
+    def __init__(self, queue_name: str, max_concurrent: int = 10, batch_size: int = 32):
         """
         初始化消息消费者
         
         Args:
             queue_name: 要消费的队列名称
-            max_concurrent: 最大并发处理数（不同用户的并发数）
+            max_concurrent: 最大并发处理数（工作协程数量，即同时处理的用户数）
+            batch_size: 每次从队列批量取出的最大消息数
         """
         self.queue_name = queue_name
-        self.max_concurrent = max_concurrent
+        self.max_concurrent = max(1, max_concurrent)
+        self.batch_size = batch_size
         self.handlers: list[MessageHandler] = []
         self.is_running = False
         self.logger = get_logger()
-        self.semaphore = asyncio.Semaphore(max_concurrent)
+        # 有待处理消息的用户处理器，每个处理器最多在其中出现一次
+        self._ready: Optional[asyncio.Queue] = None
+        self._workers: List[asyncio.Task] = []
+        self._main_task: Optional[asyncio.Task] = None
         
-        # 用户消息处理器字典 {user_id: UserSequentialProcessor}
-        self.user_processors: Dict[str, UserSequentialProcessor] = {}
-        self.cleanup_task = None
+        # 用户消息处理器表 {user_id: UserSequentialProcessor}，按最近使用排序（LRU）
+        self.user_processors: "OrderedDict[str, UserSequentialProcessor]" = OrderedDict()
+        self.queue = None
+        self.coalesce = {**DEFAULT_COALESCE_CONFIG, **(config.get("message_coalesce") or {})}
+        consumer_config = {**DEFAULT_CONSUMER_CONFIG, **(config.get("message_consumer") or {})}
+        self.max_user_processors = max(1, int(consumer_config["max_user_processors"]))
+        self.processor_idle_ttl = float(consumer_config["processor_idle_ttl"])
+        self.evicted_count = 0
+        self.over_capacity_count = 0
         
     def add_handler(self, handler: MessageHandler):
         """
@@ -241,31 +388,110 @@ class MessageConsumer:
     
     def _get_or_create_user_processor(self, user_id: str) -> UserSequentialProcessor:
         """获取或创建用户消息处理器"""
-        if user_id not in self.user_processors:
-            processor = UserSequentialProcessor(user_id, self.handlers)
-            self.user_processors[user_id] = processor
-            self.logger.debug(f"为用户 {user_id} 创建消息处理器")
-        
-        return self.user_processors[user_id]
-    
-    async def _process_message(self, message_wrapper: Dict[str, Any]):
+        processor = self.user_processors.get(user_id)
+        if processor is not None:
+            self.user_processors.move_to_end(user_id)
+            return processor
+
+        self._evict_idle_processors()
+        processor = UserSequentialProcessor(user_id, self.handlers, on_processed=self._ack,
+                                            coalesce=self.coalesce)
+        self.user_processors[user_id] = processor
+        self.logger.debug(f"为用户 {user_id} 创建消息处理器")
+        return processor
+
+    def _evict_idle_processors(self):
+        """
+        淘汰空闲的用户处理器（创建新处理器前调用）
+
+        从最久未使用的一端检查：空闲超过processor_idle_ttl的处理器被移除；
+        处理器数量达到上限时，即使未超时也移除最久未使用的空闲处理器。
+        空闲处理器没有任务和待处理消息，直接丢弃即可。有待处理消息的处理器不会被淘汰，
+        全部忙碌时允许暂时超过上限。
+        """
+        now = time.monotonic()
+        excess = len(self.user_processors) + 1 - self.max_user_processors
+        victims = []
+        for scanned, (user_id, processor) in enumerate(self.user_processors.items()):
+            if scanned >= EVICT_SCAN_LIMIT:
+                break
+            if not processor.is_idle:
+                continue
+            if len(victims) < excess or now - processor.last_active >= self.processor_idle_ttl:
+                victims.append(user_id)
+            else:
+                break
+
+        for user_id in victims:
+            del self.user_processors[user_id]
+        self.evicted_count += len(victims)
+
+        if len(self.user_processors) >= self.max_user_processors:
+            self.over_capacity_count += 1
+            self.logger.debug(f"消费者 {self.queue_name} 用户处理器已达上限 {self.max_user_processors}，"
+                              f"且没有可淘汰的空闲处理器")
+
+    def _ack(self, message_wrapper: MessageEnvelope):
+        """消息处理成功后确认，持久化队列据此删除消息"""
+        if self.queue is not None:
+            self.queue.ack(message_wrapper)
+
+    def _schedule(self, processor: UserSequentialProcessor):
+        """有待处理消息且未在排队或处理中的用户，可处理时放入就绪队列，需等待合并窗口时设置定时器"""
+        if processor.running or processor.queued or not processor.pending:
+            return
+
+        delay = processor.ready_delay()
+        if delay > 0:
+            if processor.timer is None:
+                processor.timer = asyncio.get_running_loop().call_later(delay, self._on_coalesce_timer, processor)
+            return
+
+        if processor.timer is not None:
+            processor.timer.cancel()
+            processor.timer = None
+        processor.queued = True
+        self._ready.put_nowait(processor)
+
+    def _on_coalesce_timer(self, processor: UserSequentialProcessor):
+        """合并窗口到期（期间有新消息时重新计算等待时间）"""
+        processor.timer = None
+        self._schedule(processor)
+
+    def _dispatch(self, message_wrapper: MessageEnvelope):
         """
-        处理单条消息 - 分配给对应用户的处理器
+        分发单条消息 - 放入对应用户的处理器并调度
         
         Args:
-            message_wrapper: 消息包装器
+            message_wrapper: 消息信封
         """
-        async with self.semaphore:
-            context = message_wrapper['context']
-            user_id = self._get_user_id(context)
-            
-            # 获取或创建用户处理器
-            user_processor = self._get_or_create_user_processor(user_id)
-            
-            # 将消息添加到用户处理器的队列中
-            await user_processor.add_message(message_wrapper)
-            
-            self.logger.debug(f"消息已分配给用户 {user_id} 的处理器")
+        context = message_wrapper.context
+        user_id = self._get_user_id(context)
+
+        user_processor = self._get_or_create_user_processor(user_id)
+        user_processor.add_message(message_wrapper)
+        self._schedule(user_processor)
+
+        self.logger.debug(f"消息已分配给用户 {user_id} 的处理器")
+
+    async def _worker(self):
+        """工作协程：从就绪队列取出用户，处理一批消息后重新调度该用户"""
+        while True:
+            processor = await self._ready.get()
+            processor.queued = False
+            if not processor.pending:
+                continue
+
+            processor.running = True
+            try:
+                batch, handler = processor.take_batch()
+                await processor._process_messages(batch, handler)
+            finally:
+                processor.running = False
+                processor.last_active = time.monotonic()
+                # 处理期间到达的消息排到就绪队列末尾，用户之间轮流处理
+                if self.is_running:
+                    self._schedule(processor)
 
     async def start(self):
         """启动消息消费者"""
@@ -274,74 +500,52 @@ class MessageConsumer:
             return
             
         self.is_running = True
+        self._main_task = asyncio.current_task()
         self.logger.debug(f"启动消息消费者: {self.queue_name}")
         
         # 获取或创建队列
         queue = message_queue_manager.get_or_create_queue(self.queue_name)
-        
-        # 启动清理任务
-        self.cleanup_task = asyncio.create_task(self._cleanup_inactive_processors())
+        self.queue = queue
+
+        self._ready = asyncio.Queue()
+        self._workers = [asyncio.create_task(self._worker(), name=f"{self.queue_name}:worker{index}")
+                         for index in range(self.max_concurrent)]
         
         try:
             while self.is_running:
-                # 从队列获取消息
-                message_wrapper = await queue.get(timeout=1.0)
-                
-                if message_wrapper is None:
-                    continue
+                # 阻塞等待，取出当前积压的消息；队列关闭时返回空列表
+                batch = await queue.get_many(self.batch_size)
+                if not batch and queue.closed:
+                    break
                 
-                # 异步处理消息（分配给用户处理器）
-                asyncio.create_task(self._process_message(message_wrapper))
+                # 分配给各用户的处理器（只是入用户队列并调度，不为每条消息创建任务）
+                for message_wrapper in batch:
+                    self._dispatch(message_wrapper)
                 
+        except asyncio.CancelledError:
+            if self.is_running:
+                raise
         except Exception as e:
             self.logger.error(f"消费者 {self.queue_name} 运行时发生错误: {e}")
         finally:
             self.is_running = False
-            
-            # 停止清理任务
-            if self.cleanup_task:
-                self.cleanup_task.cancel()
-                try:
-                    await self.cleanup_task
-                except asyncio.CancelledError:
-                    pass
+            self._main_task = None
+
+            # 停止工作协程
+            for worker in self._workers:
+                worker.cancel()
+            await asyncio.gather(*self._workers, return_exceptions=True)
+            self._workers = []
             
             # 停止所有用户处理器
             await self._stop_all_user_processors()
             
             self.logger.debug(f"消息消费者 {self.queue_name} 已停止")
     
-    async def _cleanup_inactive_processors(self):
-        """定期清理不活跃的用户处理器"""
-        try:
-            while self.is_running:
-                await asyncio.sleep(60)  # 每分钟检查一次
-                
-                inactive_users = []
-                for user_id, processor in self.user_processors.items():
-                    if not processor.is_processing:
-                        inactive_users.append(user_id)
-                
-                # 清理不活跃的处理器
-                for user_id in inactive_users:
-                    processor = self.user_processors.pop(user_id, None)
-                    if processor:
-                        await processor.stop()
-                        self.logger.debug(f"清理用户 {user_id} 的不活跃处理器")
-                        
-        except asyncio.CancelledError:
-            pass
-        except Exception as e:
-            self.logger.error(f"清理任务异常: {e}")
-    
     async def _stop_all_user_processors(self):
         """停止所有用户处理器"""
-        tasks = []
         for processor in self.user_processors.values():
-            tasks.append(processor.stop())
-        
-        if tasks:
-            await asyncio.gather(*tasks, return_exceptions=True)
+            processor.stop()
         
         self.user_processors.clear()
         self.logger.debug("所有用户处理器已停止")
@@ -351,6 +555,26 @@ class MessageConsumer:
         self.is_running = False
         self.logger.debug(f"正在停止消息消费者: {self.queue_name}")
 
+        # 分发协程阻塞在队列上，取消它以立即退出
+        task = self._main_task
+        if task is not None and task is not asyncio.current_task() and not task.done():
+            task.cancel()
+
+    def get_stats(self) -> Dict[str, Any]:
+        """获取消费者统计信息"""
+        active = sum(1 for processor in self.user_processors.values() if not processor.is_idle)
+        return {
+            'queue_name': self.queue_name,
+            'is_running': self.is_running,
+            'user_processors': len(self.user_processors),
+            'active_processors': active,
+            'ready_processors': self._ready.qsize() if self._ready is not None else 0,
+            'workers': len(self._workers),
+            'max_user_processors': self.max_user_processors,
+            'evicted_processors': self.evicted_count,
+            'over_capacity_count': self.over_capacity_count
+        }
+
 
 class MessageConsumerManager:
     """消息消费者管理器"""
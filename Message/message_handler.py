@@ -2,23 +2,85 @@
 消息处理器集合
 提供各种常用的消息处理器实现
 """
-from typing import Dict, Any, List, Set, Callable, Awaitable
+from typing import Dict, Any, List, Set, Callable, Awaitable, Optional
 from datetime import datetime
 import asyncio
+import threading
 from concurrent.futures import ThreadPoolExecutor
 
+from Message.ai_governor import get_ai_governor
+from Message.reply_cache import get_reply_cache
 from Message.message_consumer import MessageHandler
+from Message.priority import DEFAULT_TRANSFER_KEYWORDS
 from bridge.context import Context, ContextType, ChannelType
 from utils.logger import get_logger
 from utils.resource_manager import ThreadResourceManager
 from utils.performance_monitor import monitor_async_function
-from Channel.pinduoduo.utils.API.send_message import SendMessage
+from Channel.pinduoduo.utils.API.send_message import AsyncSendMessage
+from Channel.pinduoduo.utils.API.sender_cache import sender_cache
+
+
+# AI回复默认配置，可通过config中的ai_reply覆盖
+DEFAULT_AI_REPLY_CONFIG = {
+    # 支持原生异步的Bot（OpenAI/Azure/Coze）使用流式接口，不占用线程
+    "streaming": True,
+    # 流式回复时先把第一句话发给客户，其余内容生成完后再发
+    "flush_first_sentence": True,
+    # 第一句话至少包含的字符数，避免只发出"您好！"这样的短句
+    "first_sentence_min_chars": 8
+}
+
+# Bot和本处理器在失败时返回的兜底话术，不写入回复缓存
+FALLBACK_REPLIES = frozenset({
+    "AI服务暂时不可用，请稍后再试", "AI回复超时，请稍后再试",
+    "抱歉，我没有理解您的问题。", "抱歉，我暂时无法回答您的问题。", "抱歉，服务暂时不可用，请稍后再试。",
+    "会话创建失败", "消息处理失败", "未能获取到回复", "请求处理超时"
+})
+
+# 断句的标点
+SENTENCE_ENDINGS = "。！？!?；;\n"
+
+
+def find_first_sentence_end(text: str, min_chars: int) -> int:
+    """
+    查找第一句话的结束位置
+
+    Args:
+        text: 已生成的回复文本
+        min_chars: 第一句话至少包含的字符数
+
+    Returns:
+        第一句话（含标点）的长度，还没有完整的句子时返回0
+    """
+    for index in range(min_chars - 1, len(text)):
+        if text[index] in SENTENCE_ENDINGS:
+            return index + 1
+    return 0
+
+
+# 所有AI处理器共享的线程池，线程数不随账号/店铺数量增长
+_shared_ai_executor: Optional[ThreadPoolExecutor] = None
+_shared_ai_executor_lock = threading.Lock()
+
+
+def get_shared_ai_executor() -> ThreadPoolExecutor:
+    """获取全局共享的AI调用线程池（大小由配置项ai_executor_workers决定）"""
+    global _shared_ai_executor
+    with _shared_ai_executor_lock:
+        if _shared_ai_executor is None:
+            from config import config
+            max_workers = config.get("ai_executor_workers", 16)
+            _shared_ai_executor = ThreadPoolExecutor(
+                max_workers=max_workers,
+                thread_name_prefix="ai_handler"
+            )
+        return _shared_ai_executor
 
 
 class AIAutoReplyHandler(MessageHandler):
     """AI自动回复处理器 - 集成CozeBot智能回复"""
     
-    def __init__(self, bot=None, auto_reply_types: Set[ContextType] = None, enable_fallback: bool = True, max_workers: int = 5):
+    def __init__(self, bot=None, auto_reply_types: Set[ContextType] = None, enable_fallback: bool = True, max_workers: Optional[int] = None):
         """
         初始化AI自动回复处理器
 
@@ -26,7 +88,7 @@ class AIAutoReplyHandler(MessageHandler):
             bot: AI Bot实例 (如CozeBot)
             auto_reply_types: 支持自动回复的消息类型
             enable_fallback: 是否启用规则回复作为后备
-            max_workers: 线程池最大工作线程数
+            max_workers: 专用线程池最大工作线程数，为None时使用全局共享线程池
         """
         self.bot = bot
         self.auto_reply_types = auto_reply_types or {
@@ -42,16 +104,25 @@ class AIAutoReplyHandler(MessageHandler):
         self.max_workers = max_workers
         self.logger = get_logger("AIAutoReplyHandler")
 
-        # 创建专用的线程池资源管理器
+        from config import config
+        reply_config = {**DEFAULT_AI_REPLY_CONFIG, **(config.get("ai_reply") or {})}
+        self.streaming = bool(reply_config["streaming"])
+        self.flush_first_sentence = bool(reply_config["flush_first_sentence"])
+        self.first_sentence_min_chars = max(1, int(reply_config["first_sentence_min_chars"]))
+
+        # 默认使用共享线程池；指定max_workers时创建专用线程池并由资源管理器清理
         self.resource_manager = ThreadResourceManager()
-        self.executor = ThreadPoolExecutor(
-            max_workers=max_workers,
-            thread_name_prefix="ai_handler"
-        )
-        self.resource_manager.register_thread_pool(
-            self.executor,
-            f"AI处理器线程池(max_workers={max_workers})"
-        )
+        if max_workers is None:
+            self.executor = get_shared_ai_executor()
+        else:
+            self.executor = ThreadPoolExecutor(
+                max_workers=max_workers,
+                thread_name_prefix="ai_handler"
+            )
+            self.resource_manager.register_thread_pool(
+                self.executor,
+                f"AI处理器线程池(max_workers={max_workers})"
+            )
 
         # 如果没有提供bot实例，尝试创建默认的CozeBot
         if not self.bot:
@@ -138,10 +209,42 @@ class AIAutoReplyHandler(MessageHandler):
             self.logger.error(f"消息预处理失败: {e}")
             return json.dumps([{"type": "text", "text": "消息处理失败"}], ensure_ascii=False)
 
+    def can_coalesce(self, context: Context) -> bool:
+        """同一用户连续发送的可自动回复消息合并为一次AI请求"""
+        return self.can_handle(context)
+
+    def _merge_preprocessed(self, contexts: List[Context]) -> str:
+        """
+        把多条消息的预处理结果按顺序合并为一个多段消息
+
+        Returns:
+            与_preprocess_message格式相同的JSON字符串
+        """
+        import json
+
+        parts = []
+        for context in contexts:
+            try:
+                parts.extend(json.loads(self._preprocess_message(context)))
+            except (TypeError, ValueError) as e:
+                self.logger.error(f"合并消息预处理结果失败: {e}")
+        return json.dumps(parts, ensure_ascii=False)
+
     @monitor_async_function("ai_message_handler", {"handler": "AIAutoReplyHandler"})
     async def handle(self, context: Context, metadata: Dict[str, Any]) -> bool:
         """处理消息并发送AI回复 - 集成性能监控"""
+        return await self._reply_to([context])
+
+    @monitor_async_function("ai_message_handler", {"handler": "AIAutoReplyHandler", "coalesced": "true"})
+    async def handle_batch(self, contexts: List[Context], metadata_list: List[Dict[str, Any]]) -> bool:
+        """把同一用户连续发送的多条消息合并为一次AI请求，只发送一次回复"""
+        return await self._reply_to(contexts)
+
+    async def _reply_to(self, contexts: List[Context]) -> bool:
+        """为一条或合并后的多条消息获取AI回复并发送"""
         try:
+            # 用户和店铺信息以最后一条消息为准
+            context = contexts[-1]
             shop_id = context.kwargs.get('shop_id')
             user_id = context.kwargs.get('user_id')
             from_uid = context.kwargs.get('from_uid')
@@ -152,10 +255,50 @@ class AIAutoReplyHandler(MessageHandler):
                 return False
 
             try:
-                self.logger.info(f"'{username}'收到用户'{nickname}'消息: 消息类型：{context.type},消息内容：{context.content}")
-                reply = await self._get_ai_reply(context)
-                await self._send_reply(reply, shop_id, user_id, from_uid)
-                self.logger.info(f"'{username}'回复用户'{nickname}'消息: 消息类型：{reply.type},消息内容：{reply.content}")
+                if len(contexts) == 1:
+                    self.logger.info(f"'{username}'收到用户'{nickname}'消息: 消息类型：{context.type},消息内容：{context.content}")
+                    processed_content = self._preprocess_message(context)
+                else:
+                    self.logger.info(f"'{username}'收到用户'{nickname}'连续 {len(contexts)} 条消息，合并为一次请求: "
+                                     f"{[c.content for c in contexts]}")
+                    processed_content = self._merge_preprocessed(contexts)
+
+                # 常见问题直接使用缓存的回复，不调用AI（有会话历史的Bot只缓存FAQ白名单中的问题）
+                reply_cache = get_reply_cache()
+                use_cache = reply_cache.accepts(contexts, processed_content,
+                                                stateful=getattr(self.bot, 'stateful', False))
+                cached = reply_cache.get(shop_id, processed_content) if use_cache else None
+                if cached is not None:
+                    from bridge.reply import Reply, ReplyType
+                    await self._send_reply(Reply(ReplyType.TEXT, cached), shop_id, user_id, from_uid)
+                    self.logger.info(f"'{username}'回复用户'{nickname}'消息（缓存）: 消息内容：{cached}")
+                    return True
+
+                flushed = []
+                first_send = []
+
+                def send_first_sentence(text: str):
+                    # 在AI调用之外发送：发送耗时不占用并发名额，也不计入AI的耗时和超时
+                    flushed.append(text)
+                    first_send.append(asyncio.create_task(self._send_reply(text, shop_id, user_id, from_uid)))
+
+                reply = await self._get_ai_reply(context, processed_content, on_first_sentence=send_first_sentence)
+                if first_send:
+                    # 等第一句发出后再发送剩余内容，保证顺序
+                    await first_send[0]
+                failed = isinstance(reply.content, str) and reply.content in FALLBACK_REPLIES
+                if flushed and failed:
+                    # 第一句已经发给客户，后续生成失败或超时时不再追加兜底话术
+                    self.logger.warning(f"'{username}'回复用户'{nickname}'时AI生成中断（{reply.content}），"
+                                        f"只发送了第一句: {''.join(flushed)}")
+                    return True
+                if reply.content or not flushed:
+                    await self._send_reply(reply, shop_id, user_id, from_uid)
+                full_reply = f"{''.join(flushed)}{reply.content}"
+                self.logger.info(f"'{username}'回复用户'{nickname}'消息: 消息类型：{reply.type},"
+                                 f"消息内容：{full_reply}")
+                if use_cache and isinstance(reply.content, str) and not failed:
+                    reply_cache.put(shop_id, processed_content, full_reply)
             except Exception as e:
                 self.logger.error(f"AI回复生成失败: {e}")
                 return False
@@ -164,8 +307,17 @@ class AIAutoReplyHandler(MessageHandler):
             self.logger.error(f"AI自动回复处理失败: {e}")
             return False
 
-    async def _get_ai_reply(self, context: Context):
-        """获取AI Bot回复 - 优化版本使用专用线程池"""
+    async def _get_ai_reply(self, context: Context, processed_content: Optional[str] = None,
+                            on_first_sentence: Optional[Callable[[str], None]] = None):
+        """
+        获取AI Bot回复 - 原生异步的Bot走流式接口，其他Bot使用线程池
+
+        Args:
+            context: 消息上下文
+            processed_content: 已预处理的消息内容（合并多条消息时传入），为None时预处理context
+            on_first_sentence: 流式生成出第一句话时的回调（用于提前发送），应立即返回（如创建发送任务），
+                调用后返回的Reply只包含剩余内容
+        """
         if not self.bot:
             self.logger.warning("AI Bot实例不可用，无法获取回复")
             from bridge.reply import Reply, ReplyType
@@ -173,7 +325,8 @@ class AIAutoReplyHandler(MessageHandler):
 
         try:
             # 预处理消息内容
-            processed_content = self._preprocess_message(context)
+            if processed_content is None:
+                processed_content = self._preprocess_message(context)
 
             # 创建新的context对象，将预处理后的内容传递给bot
             processed_context = Context(
@@ -183,18 +336,19 @@ class AIAutoReplyHandler(MessageHandler):
                 kwargs=context.kwargs
             )
 
-            # 使用专用线程池运行同步的bot.reply方法
-            loop = asyncio.get_running_loop()
-
-            # 添加超时控制，防止长时间阻塞
-            reply = await asyncio.wait_for(
-                loop.run_in_executor(
-                    self.executor,  # 使用专用的线程池
-                    self.bot.reply,
-                    processed_context
-                ),
-                timeout=30.0  # 30秒超时
-            )
+            # 在全局/店铺并发名额内调用（排队时间不计入超时），添加超时控制，防止长时间阻塞
+            async with get_ai_governor().slot(context.kwargs.get('shop_id')) as permit:
+                if self.streaming and getattr(self.bot, 'supports_async', False):
+                    call = self._stream_ai_reply(processed_context, on_first_sentence)
+                else:
+                    # 使用线程池运行同步的bot.reply方法；超时后线程仍在请求AI服务，名额等它结束后再归还
+                    future = self.executor.submit(self.bot.reply, processed_context)
+                    permit.hold(future)
+                    call = asyncio.wrap_future(future)
+                reply = await asyncio.wait_for(call, timeout=30.0)  # 30秒超时
+                # Bot把服务端错误（包括限流）转换成了兜底话术，计为失败以便并发上限回退
+                if isinstance(reply.content, str) and reply.content in FALLBACK_REPLIES:
+                    permit.fail()
 
             return reply
 
@@ -208,10 +362,39 @@ class AIAutoReplyHandler(MessageHandler):
             from bridge.reply import Reply, ReplyType
             return Reply(ReplyType.TEXT, "AI服务暂时不可用，请稍后再试")
         
+    async def _stream_ai_reply(self, processed_context: Context,
+                               on_first_sentence: Optional[Callable[[str], None]] = None):
+        """
+        通过Bot的流式接口获取回复，第一句话生成完后立即交给on_first_sentence
+
+        Returns:
+            Reply对象（已提前发送第一句话时只包含剩余内容）
+        """
+        from bridge.reply import Reply, ReplyType
+
+        if on_first_sentence is None or not self.flush_first_sentence:
+            return await self.bot.areply(processed_context)
+
+        text = ""
+        flushed = False
+        async for chunk in self.bot.astream(processed_context):
+            text += chunk
+            if not flushed:
+                end = find_first_sentence_end(text, self.first_sentence_min_chars)
+                if end:
+                    on_first_sentence(text[:end])
+                    flushed = True
+                    text = text[end:]
+
+        text = text.strip()
+        if not text and not flushed:
+            text = "抱歉，我暂时无法回答您的问题。"
+        return Reply(ReplyType.TEXT, text)
+
     async def _send_reply(self, reply, shop_id: str, user_id: str, from_uid: str) -> bool:
         """发送回复消息"""
         try:
-            sender = SendMessage(shop_id, user_id)
+            sender = sender_cache.get(AsyncSendMessage, shop_id, user_id)
             
             # 处理不同类型的回复
             if hasattr(reply, '__iter__') and not isinstance(reply, str):
@@ -237,14 +420,14 @@ class AIAutoReplyHandler(MessageHandler):
             if hasattr(reply, 'type') and hasattr(reply, 'content'):
                 # 处理Reply对象，只处理TEXT类型
                 if reply.type == ReplyType.TEXT:
-                    result = sender.send_text(from_uid, reply.content)
+                    result = await sender.send_text(from_uid, reply.content)
                 else:
                     # 非TEXT类型转为文本发送
-                    result = sender.send_text(from_uid, str(reply.content))
+                    result = await sender.send_text(from_uid, str(reply.content))
                     
             else:
                 # 处理字符串类型的回复
-                result = sender.send_text(from_uid, str(reply))
+                result = await sender.send_text(from_uid, str(reply))
             
             if result:
                 return True
@@ -312,10 +495,7 @@ class CustomerServiceTransferHandler(MessageHandler):
         Args:
             transfer_keywords: 触发转接的关键词列表
         """
-        self.transfer_keywords = transfer_keywords or [
-            '人工客服', '转人工', '人工', '客服', '投诉', '举报', 
-            '不满意', '解决不了', '要求赔偿'
-        ]
+        self.transfer_keywords = transfer_keywords or list(DEFAULT_TRANSFER_KEYWORDS)
         self.logger = get_logger("CustomerServiceTransferHandler")
     
     def can_handle(self, context: Context) -> bool:
@@ -341,8 +521,8 @@ class CustomerServiceTransferHandler(MessageHandler):
                 return False
             
             # 获取可用的客服列表
-            sender = SendMessage(shop_id, user_id)
-            cs_list = sender.getAssignCsList()
+            sender = sender_cache.get(AsyncSendMessage, shop_id, user_id)
+            cs_list = await sender.getAssignCsList()
             my_cs_uid = f"cs_{shop_id}_{user_id}"
             
             if cs_list and isinstance(cs_list, dict):
@@ -356,7 +536,7 @@ class CustomerServiceTransferHandler(MessageHandler):
                     cs_name = target_cs.get('username', '客服')
                     
                     # 转移会话
-                    transfer_result = sender.move_conversation(from_uid, cs_uid)
+                    transfer_result = await sender.move_conversation(from_uid, cs_uid)
                     
                     if transfer_result and transfer_result.get('success'):
 
@@ -366,7 +546,7 @@ class CustomerServiceTransferHandler(MessageHandler):
                         self.logger.error("会话转接失败")
                 else:
                     self.logger.warning("没有其他可用的客服进行转接")
-                    sender.send_text(from_uid, "抱歉，当前没有其他客服在线，请您稍后再试。")
+                    await sender.send_text(from_uid, "抱歉，当前没有其他客服在线，请您稍后再试。")
             
             return False
             
@@ -409,8 +589,8 @@ class BusinessHoursHandler(MessageHandler):
             reply = (f"您好！当前时间是 {current_time}，我们的营业时间是 {start_time}-{end_time}。"
                     f"现在是非营业时间，您可以先留言，我们会在营业时间内尽快回复您。")
             
-            sender = SendMessage(shop_id, user_id)
-            sender.send_text(from_uid, reply)
+            sender = sender_cache.get(AsyncSendMessage, shop_id, user_id)
+            await sender.send_text(from_uid, reply)
             self.logger.info(f"非营业时间自动回复:回复 {reply} 给 {from_uid}")
             return True
             
@@ -429,19 +609,19 @@ class BusinessHoursHandler(MessageHandler):
 
 
 # 便捷函数：创建预配置的处理器
-def create_ai_handler(bot=None, enable_fallback: bool = True, max_workers: int = 5) -> AIAutoReplyHandler:
+def create_ai_handler(bot=None, enable_fallback: bool = True, max_workers: Optional[int] = None) -> AIAutoReplyHandler:
     """
     创建AI自动回复处理器
 
     Args:
         bot: AI Bot实例，如果为None会自动创建CozeBot
         enable_fallback: 是否启用规则回复作为后备
-        max_workers: 线程池最大工作线程数
+        max_workers: 专用线程池最大工作线程数，为None时使用共享线程池
     """
     return AIAutoReplyHandler(bot=bot, enable_fallback=enable_fallback, max_workers=max_workers)
 
 
-def create_coze_ai_handler(max_workers: int = 5) -> AIAutoReplyHandler:
+def create_coze_ai_handler(max_workers: Optional[int] = None) -> AIAutoReplyHandler:
     """创建基于CozeBot的AI回复处理器"""
     try:
         from Agent.bot_factory import create_bot
@@ -4,22 +4,414 @@
 """
 
 import asyncio
+import itertools
+import os
 import threading
 import time
 from collections import deque
 from typing import Optional, List, Callable, Dict, Any
 from datetime import datetime
-import uuid
 import json
 from bridge.context import Context, ContextType, ChannelType
+from config import config
+from Message.durable_store import DurableMessageStore, get_durable_store
+from Message.priority import PriorityPolicy, get_queue_priority_policy
 from utils.logger import get_logger
+from utils.performance_monitor import record_metric
 from utils.resource_manager import ResourceManager
 
 
+# 每次持锁从队头清理的最大消息数，清理大量过期消息时分批让出锁，避免阻塞生产者
+EXPIRE_BATCH_SIZE = 256
+
+# 重放持久化消息时每批放入队列的数量，批次之间让出事件循环
+REPLAY_BATCH_SIZE = 500
+
+# 队列满时的溢出策略
+OVERFLOW_BLOCK = "block"                # 阻塞生产者直到有空位，超时后拒绝
+OVERFLOW_REJECT_NEWEST = "reject_newest"  # 拒绝新消息
+OVERFLOW_DROP_OLDEST = "drop_oldest"    # 丢弃最低优先级通道中最旧的消息
+OVERFLOW_SPILL = "spill"                # 溢出的消息写入磁盘，队列消化后按顺序读回
+OVERFLOW_POLICIES = (OVERFLOW_BLOCK, OVERFLOW_REJECT_NEWEST, OVERFLOW_DROP_OLDEST, OVERFLOW_SPILL)
+
+# 消息队列默认配置，可通过config中的message_queue覆盖
+DEFAULT_QUEUE_CONFIG = {
+    "overflow_policy": OVERFLOW_DROP_OLDEST,
+    "block_timeout": 5.0,
+    "high_watermark": 0.8,
+    "low_watermark": 0.5,
+    "spill_dir": "./database/queue_spill",
+    "backpressure_max_wait": 5.0,
+    "durable": False
+}
+
+
+# 消息ID：以进程启动时的微秒时间戳为起点单调递增，重启后不会与持久化的旧消息ID重复
+_message_ids = itertools.count(time.time_ns() // 1000)
+
+
+class MessageEnvelope:
+    """队列中的消息信封
+
+    使用__slots__减少每条消息的内存占用：ID为单调递增的整数，
+    ISO格式的创建时间只在访问时才由时间戳格式化。
+    为兼容原来的字典包装器，支持 envelope['id'] / envelope.get('context') 形式的访问。
+    """
+
+    __slots__ = ('id', 'timestamp', 'context', 'lane', 'processed')
+
+    _KEYS = ('id', 'timestamp', 'created_at', 'context', 'processed')
+
+    def __init__(self, context: Context, timestamp: Optional[float] = None, message_id: Any = None):
+        self.id = next(_message_ids) if message_id is None else message_id
+        self.timestamp = time.time() if timestamp is None else timestamp
+        self.context = context
+        self.lane = 0
+        self.processed = False
+
+    @property
+    def created_at(self) -> str:
+        """ISO格式的创建时间（用于日志）"""
+        return datetime.fromtimestamp(self.timestamp).isoformat()
+
+    def __getitem__(self, key: str) -> Any:
+        if key not in self._KEYS:
+            raise KeyError(key)
+        return getattr(self, key)
+
+    def get(self, key: str, default: Any = None) -> Any:
+        return getattr(self, key) if key in self._KEYS else default
+
+    def keys(self):
+        return self._KEYS
+
+    def as_dict(self) -> Dict[str, Any]:
+        """转换为字典副本"""
+        return {key: getattr(self, key) for key in self._KEYS}
+
+    def __repr__(self) -> str:
+        return f"MessageEnvelope(id={self.id}, timestamp={self.timestamp}, context={self.context})"
+
+
+def _to_record(envelope: MessageEnvelope) -> Dict[str, Any]:
+    """把消息信封转换为可落盘的记录"""
+    return {
+        'id': envelope.id,
+        'timestamp': envelope.timestamp,
+        'context': envelope.context.to_dict()
+    }
+
+
+def _from_record(record: Dict[str, Any]) -> MessageEnvelope:
+    """从落盘记录还原消息信封（保留原始ID和时间戳）"""
+    return MessageEnvelope(Context.from_dict(record['context']), record['timestamp'], record['id'])
+
+
+class QueueFullError(RuntimeError):
+    """队列已满，新消息被溢出策略拒绝"""
+
+
+class _SpillFile:
+    """溢出到磁盘的消息（JSON Lines追加写入，按写入顺序读回）"""
+
+    def __init__(self, path: str):
+        self.path = path
+        self.pending = 0
+        self._file = None
+        self._read_offset = 0
+
+    def append(self, record: Dict[str, Any]):
+        """追加一条消息记录"""
+        if self._file is None:
+            os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+            # 溢出文件只在本次运行内有效，打开时清空上次残留的内容
+            self._file = open(self.path, "w+", encoding="utf-8")
+            self._read_offset = 0
+        self._file.seek(0, os.SEEK_END)
+        self._file.write(json.dumps(record, ensure_ascii=False, default=str) + "\n")
+        self._file.flush()
+        self.pending += 1
+
+    def read(self, max_items: int) -> List[Dict[str, Any]]:
+        """按写入顺序读回最多max_items条记录，全部读完后截断文件"""
+        if self._file is None or self.pending <= 0:
+            return []
+        self._file.seek(self._read_offset)
+        records = []
+        while len(records) < max_items:
+            line = self._file.readline()
+            if not line:
+                break
+            records.append(json.loads(line))
+        self._read_offset = self._file.tell()
+        self.pending -= len(records)
+        if self.pending <= 0:
+            self.pending = 0
+            self._file.seek(0)
+            self._file.truncate()
+            self._read_offset = 0
+        return records
+
+    def close(self):
+        """关闭并删除溢出文件"""
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+            try:
+                os.remove(self.path)
+            except OSError:
+                pass
+        self.pending = 0
+
+
+class _UserMessages:
+    """队列中一个用户的待处理消息（按入队顺序）及其所在的通道"""
+
+    __slots__ = ('key', 'messages', 'lane', 'token')
+
+    def __init__(self, key: Any):
+        self.key = key
+        # (消息信封, 入队记录)
+        self.messages: deque = deque()
+        self.lane = -1
+        # 每次进入或离开通道时递增，通道中令牌不一致的条目已失效
+        self.token = 0
+
+
+class _Arrival:
+    """一条消息的入队记录，消息出队后user置为None"""
+
+    __slots__ = ('timestamp', 'user', 'expired')
+
+    def __init__(self, timestamp: float, user: _UserMessages):
+        self.timestamp = timestamp
+        self.user = user
+        # 是否已计入过期消息数
+        self.expired = False
+
+
+class _PriorityLanes:
+    """按用户分优先级通道存放的消息集合
+
+    同一用户的消息按入队顺序保存在该用户自己的队列中，通道中排队的是用户而不是单条消息：
+    用户按其最早一条待处理消息的分类进入通道，每次出队取出该用户最早的一条消息，
+    用户还有消息时按新的最早消息重新进入对应通道的末尾。优先级只决定不同用户之间的先后，
+    同一用户的消息始终按入队顺序出队（例如先问问题再要求转人工，两条消息不会颠倒）。
+
+    通道之间按平滑加权轮询出队：每次出队时所有非空通道累加各自权重，选择累计值最大的通道
+    并扣除非空通道的总权重，长期来看各通道的出队比例等于权重比例，低优先级通道不会饿死。
+    所有消息另按入队顺序（时间有序）记录：已知过期的在_expired中，其余在_arrivals中。
+    过期截止时间只会后移，统计过期数量时把_arrivals队头新过期的记录移到_expired并累加计数，
+    出队时扣减，每条记录最多移动一次，因此过期数量的统计均摊为O(1)。
+    """
+
+    def __init__(self, policy: PriorityPolicy):
+        self.policy = policy
+        lane_count = policy.lane_count
+        # 各通道中排队的用户 (用户, 令牌)，令牌不一致的条目已失效，到达队头时丢弃
+        self._lanes: List[deque] = [deque() for _ in range(lane_count)]
+        self._lane_users: List[int] = [0] * lane_count
+        self._lane_messages: List[int] = [0] * lane_count
+        self._current: List[int] = [0] * lane_count
+        self._users: Dict[Any, _UserMessages] = {}
+        self._arrivals: deque = deque()
+        self._expired: deque = deque()
+        # _expired中尚未出队的消息数
+        self._expired_count = 0
+        self._size = 0
+
+    def __len__(self) -> int:
+        return self._size
+
+    def __bool__(self) -> bool:
+        return self._size > 0
+
+    @staticmethod
+    def _user_key(message_wrapper: MessageEnvelope) -> Any:
+        """消息所属的用户（与消费者的用户划分一致），没有用户ID的消息各自独立"""
+        context = message_wrapper.context
+        from_uid = (context.kwargs or {}).get('from_uid')
+        if from_uid is None:
+            return ('message', message_wrapper.id)
+        return (context.channel_type, str(from_uid))
+
+    def _enter_lane(self, user: _UserMessages):
+        """用户按最早一条待处理消息的分类进入对应通道末尾"""
+        lane = self.policy.classify(user.messages[0][0].context)
+        user.lane = lane
+        user.token += 1
+        self._lanes[lane].append((user, user.token))
+        self._lane_users[lane] += 1
+        self._lane_messages[lane] += len(user.messages)
+
+    def _leave_lane(self, user: _UserMessages):
+        """用户离开所在通道（通道中的条目随令牌变化失效）"""
+        self._lane_users[user.lane] -= 1
+        self._lane_messages[user.lane] -= len(user.messages)
+        user.lane = -1
+        user.token += 1
+
+    def _head_user(self, lane: int) -> _UserMessages:
+        """通道中第一个有效的用户（调用方需确认通道非空），丢弃队头已失效的条目"""
+        entries = self._lanes[lane]
+        while True:
+            user, token = entries[0]
+            if token == user.token:
+                return user
+            entries.popleft()
+
+    def _take(self, user: _UserMessages) -> MessageEnvelope:
+        """取出用户最早的一条消息，用户还有消息时重新进入通道末尾"""
+        lane = user.lane
+        self._leave_lane(user)
+        message_wrapper, arrival = user.messages.popleft()
+        arrival.user = None
+        if arrival.expired:
+            self._expired_count -= 1
+        message_wrapper.lane = lane
+        self._size -= 1
+        if user.messages:
+            self._enter_lane(user)
+        else:
+            del self._users[user.key]
+        return message_wrapper
+
+    def append(self, message_wrapper: MessageEnvelope):
+        """放入所属用户的队列，用户尚未排队时按该消息分类进入通道"""
+        key = self._user_key(message_wrapper)
+        user = self._users.get(key)
+        if user is None:
+            user = self._users[key] = _UserMessages(key)
+        arrival = _Arrival(message_wrapper.timestamp, user)
+        user.messages.append((message_wrapper, arrival))
+        self._arrivals.append(arrival)
+        self._size += 1
+        if user.lane < 0:
+            self._enter_lane(user)
+        else:
+            self._lane_messages[user.lane] += 1
+
+    def _next_lane(self) -> int:
+        """平滑加权轮询选择下一个出队的通道"""
+        weights = self.policy.lane_weights
+        best = -1
+        total = 0
+        for index, users in enumerate(self._lane_users):
+            if not users:
+                continue
+            self._current[index] += weights[index]
+            total += weights[index]
+            if best < 0 or self._current[index] > self._current[best]:
+                best = index
+        self._current[best] -= total
+        return best
+
+    def popleft(self) -> MessageEnvelope:
+        """按权重公平选择通道，取出该通道队头用户最早的一条消息"""
+        if not self._size:
+            raise IndexError("pop from an empty queue")
+        lane = self._next_lane()
+        user = self._head_user(lane)
+        self._lanes[lane].popleft()
+        return self._take(user)
+
+    def drop_one(self) -> MessageEnvelope:
+        """丢弃优先级最低的非空通道中队头用户最早的一条消息"""
+        for lane in range(len(self._lanes) - 1, -1, -1):
+            if self._lane_users[lane]:
+                return self._take(self._head_user(lane))
+        raise IndexError("pop from an empty queue")
+
+    def peek(self) -> Optional[MessageEnvelope]:
+        """查看优先级最高的非空通道中队头用户最早的一条消息"""
+        for lane, users in enumerate(self._lane_users):
+            if users:
+                return self._head_user(lane).messages[0][0]
+        return None
+
+    def _advance_expired(self, deadline: float):
+        """把_arrivals队头时间戳不晚于deadline的记录移到_expired并计数（已出队的记录直接丢弃）"""
+        arrivals = self._arrivals
+        while arrivals and (arrivals[0].user is None or arrivals[0].timestamp <= deadline):
+            arrival = arrivals.popleft()
+            if arrival.user is not None:
+                arrival.expired = True
+                self._expired.append(arrival)
+                self._expired_count += 1
+
+    def _prune_expired(self):
+        """丢弃_expired队头已出队的记录"""
+        while self._expired and self._expired[0].user is None:
+            self._expired.popleft()
+
+    def pop_expired(self, deadline: float, limit: Optional[int] = None) -> List[MessageEnvelope]:
+        """按入队顺序弹出时间戳不晚于deadline的消息"""
+        self._advance_expired(deadline)
+        expired = []
+        while limit is None or len(expired) < limit:
+            self._prune_expired()
+            if not self._expired:
+                break
+            # 最早入队的未出队消息必然是其所属用户队列的第一条
+            expired.append(self._take(self._expired.popleft().user))
+        return expired
+
+    def count_expired(self, deadline: float) -> int:
+        """时间戳不晚于deadline的消息数量（均摊O(1)）"""
+        self._advance_expired(deadline)
+        return self._expired_count
+
+    def oldest_timestamp(self) -> Optional[float]:
+        """最早入队的消息时间戳"""
+        self._prune_expired()
+        if self._expired:
+            return self._expired[0].timestamp
+        while self._arrivals and self._arrivals[0].user is None:
+            self._arrivals.popleft()
+        return self._arrivals[0].timestamp if self._arrivals else None
+
+    def lane_sizes(self) -> Dict[str, int]:
+        """各通道中排队用户的消息数量"""
+        return dict(zip(self.policy.lane_names, self._lane_messages))
+
+    def clear(self):
+        for user in self._users.values():
+            user.token += 1
+            for _, arrival in user.messages:
+                arrival.user = None
+        for lane in self._lanes:
+            lane.clear()
+        self._users.clear()
+        self._arrivals.clear()
+        self._expired.clear()
+        self._expired_count = 0
+        lane_count = len(self._lanes)
+        self._lane_users = [0] * lane_count
+        self._lane_messages = [0] * lane_count
+        self._current = [0] * lane_count
+        self._size = 0
+
+
 class MessageQueue:
-    """消息队列类，支持异步操作和消息过期机制"""
+    """消息队列类，支持异步操作和消息过期机制
+
+    消息按用户分组存放在优先级通道中（见Message.priority和_PriorityLanes）：优先级决定不同用户之间的先后，
+    同一用户的消息始终按入队顺序出队。所有消息另按入队时间顺序记录，过期消息总是位于最前面，
+    因此过期清理只需从最早的消息开始增量弹出，无需重建整个队列。
+
+    队列满时按overflow_policy处理（阻塞/拒绝新消息/丢弃最旧/溢出到磁盘），
+    丢弃和拒绝都会计数并上报指标。队列长度达到高水位时进入背压状态，
+    回落到低水位后解除，生产者可据此放慢接收速度。
+
+    开启message_queue.durable后，入队的消息同时写入持久化存储，消费者处理成功后调用ack删除，
+    过期或被丢弃的消息也会删除；同名队列重新创建时在后台任务中读取并按原始时间戳重放未过期的消息，
+    重放完成前put/get等待（不阻塞事件循环）。
+    """
 
-    def __init__(self, max_size: int = 1000, ttl: int = 300, cleanup_interval: int = 60):
+    def __init__(self, max_size: int = 1000, ttl: int = 300, cleanup_interval: int = 60,
+                 name: str = "", overflow_policy: Optional[str] = None,
+                 priority_policy: Optional[PriorityPolicy] = None,
+                 durable_store: Optional[DurableMessageStore] = None):
         """
         初始化消息队列 - 优化版本支持TTL和自动清理
 
@@ -27,16 +419,57 @@ class MessageQueue:
             max_size: 队列最大容量，防止内存溢出
             ttl: 消息生存时间（秒），默认5分钟
             cleanup_interval: 清理间隔（秒），默认1分钟
+            name: 队列名称，用于日志、指标和溢出文件名
+            overflow_policy: 队列满时的溢出策略，默认使用配置中的message_queue.overflow_policy
+            priority_policy: 优先级通道配置，默认按队列名称对应的店铺读取配置中的message_priority
+            durable_store: 持久化存储，默认在配置开启message_queue.durable时使用全局存储
         """
+        queue_config = {**DEFAULT_QUEUE_CONFIG, **(config.get("message_queue") or {})}
+        self.name = name
         self.max_size = max_size
         self.ttl = ttl  # 消息生存时间
         self.cleanup_interval = cleanup_interval
-        self._queue = deque(maxlen=max_size)
+        self.overflow_policy = overflow_policy or queue_config["overflow_policy"]
+        if self.overflow_policy not in OVERFLOW_POLICIES:
+            raise ValueError(f"未知的溢出策略: {self.overflow_policy}")
+        self.block_timeout = queue_config["block_timeout"]
+        self._queue = _PriorityLanes(priority_policy or get_queue_priority_policy(name))
         self._lock = asyncio.Lock()
         self._condition = asyncio.Condition(self._lock)
+        self._not_full = asyncio.Condition(self._lock)
         self._closed = False
+        self._expired_total = 0  # 累计清理的过期消息数
         self.logger = get_logger()
 
+        # 溢出统计
+        self._dropped_count = 0
+        self._rejected_count = 0
+        self._spilled_count = 0
+        self._spill: Optional[_SpillFile] = None
+        if self.overflow_policy == OVERFLOW_SPILL:
+            file_name = f"{name or id(self)}.jsonl".replace(os.sep, "_")
+            self._spill = _SpillFile(os.path.join(queue_config["spill_dir"], file_name))
+
+        # 高低水位背压
+        self.high_watermark = max(1, int(max_size * queue_config["high_watermark"]))
+        self.low_watermark = min(self.high_watermark - 1, int(max_size * queue_config["low_watermark"]))
+        self._backpressure = False
+        self._below_low_watermark = asyncio.Event()
+        self._below_low_watermark.set()
+
+        # 持久化
+        self._store = durable_store
+        if self._store is None and queue_config["durable"]:
+            self._store = get_durable_store()
+        self._replayed_count = 0
+        # 重放完成前生产者和消费者都等待，重放的旧消息排在新消息之前
+        self._replay_done = asyncio.Event()
+        self._replay_task = None
+        if self._store is not None and name:
+            self._replay_task = asyncio.create_task(self._replay())
+        else:
+            self._replay_done.set()
+
         # 资源管理
         self.resource_manager = ResourceManager()
 
@@ -44,38 +477,138 @@ class MessageQueue:
         self.cleanup_task = None
         self._start_cleanup_task()
 
+    def _load_durable(self):
+        """
+        读取并还原持久化的消息（在线程中执行）
+
+        Returns:
+            (按时间戳排序的消息信封, 无法还原的消息ID)
+        """
+        message_wrappers = []
+        broken = []
+        for record in self._store.load(self.name, time.time() - self.ttl):
+            try:
+                message_wrappers.append(_from_record(record))
+            except (KeyError, ValueError) as e:
+                self.logger.error(f"还原持久化消息失败: {e}")
+                broken.append(record.get('id'))
+        return message_wrappers, broken
+
+    async def _replay(self):
+        """重放持久化存储中未过期的消息（按原始时间戳，TTL照常生效），读取和还原在线程中执行"""
+        try:
+            try:
+                message_wrappers, discarded = await asyncio.to_thread(self._load_durable)
+            except Exception as e:
+                self.logger.error(f"重放持久化消息失败: {self.name}, {e}")
+                return
+
+            async with self._condition:
+                for index, message_wrapper in enumerate(message_wrappers, 1):
+                    if len(self._queue) < self.max_size:
+                        self._queue.append(message_wrapper)
+                    elif self._spill is not None:
+                        self._spill_message(message_wrapper)
+                    else:
+                        discarded.append(message_wrapper.id)
+                        self._record_overflow("dropped", message_wrapper.id)
+                    self._replayed_count += 1
+                    if index % REPLAY_BATCH_SIZE == 0:
+                        # 大量积压分批放入，批次之间让出事件循环（put/get在重放完成前等待，不会插队）
+                        await asyncio.sleep(0)
+
+                self._store.delete(self.name, (message_id for message_id in discarded if message_id))
+                self._update_watermark()
+                if self._queue:
+                    self._condition.notify(len(self._queue))
+            if message_wrappers:
+                self.logger.info(f"消息队列 {self.name} 重放了 {len(message_wrappers)} 条未处理的消息")
+        finally:
+            # 失败或被取消（队列关闭）时也放行等待中的put/get
+            self._replay_done.set()
+
+    async def wait_replayed(self):
+        """等待持久化消息重放完成（未开启持久化时立即返回）"""
+        if not self._replay_done.is_set():
+            await self._replay_done.wait()
+
+    def _discard_durable(self, message_wrappers: List[MessageEnvelope]):
+        """从持久化存储中删除过期或被丢弃的消息"""
+        if self._store is not None and message_wrappers:
+            self._store.delete(self.name, (msg.id for msg in message_wrappers))
+
+    def ack(self, message_wrapper: MessageEnvelope):
+        """
+        确认消息已处理成功，从持久化存储中删除（未开启持久化时无操作）
+
+        Args:
+            message_wrapper: get返回的消息信封
+        """
+        if self._store is not None:
+            self._store.delete(self.name, [message_wrapper.id])
+
     def _start_cleanup_task(self):
         """启动消息清理任务"""
         if not self._closed:
             self.cleanup_task = asyncio.create_task(self._cleanup_expired_messages())
             self.logger.debug(f"消息清理任务已启动，TTL={self.ttl}秒，间隔={self.cleanup_interval}秒")
 
-    async def _cleanup_expired_messages(self):
-        """定期清理过期消息"""
-        while not self._closed:
-            try:
-                current_time = time.time()
-                cleaned_count = 0
+    def _pop_expired_head(self, current_time: float, limit: Optional[int] = None) -> int:
+        """
+        从队头弹出已过期的消息（调用方需持有锁）
 
-                async with self._lock:
-                    original_size = len(self._queue)
+        Args:
+            current_time: 当前时间戳
+            limit: 最多弹出的数量，None表示不限
 
-                    # 移除过期消息
-                    filtered_queue = deque(
-                        (msg for msg in self._queue
-                         if current_time - msg['timestamp'] < self.ttl),
-                        maxlen=self.max_size
-                    )
+        Returns:
+            弹出的消息数量
+        """
+        expired = self._queue.pop_expired(current_time - self.ttl, limit)
+        for expired_msg in expired:
+            self.logger.debug(f"丢弃过期消息: {expired_msg.id}")
+        self._discard_durable(expired)
+        count = len(expired)
+        if count:
+            self._expired_total += count
+            self._not_full.notify(count)
+            self._update_watermark()
+        return count
 
-                    cleaned_count = original_size - len(filtered_queue)
-                    self._queue = filtered_queue
+    def _count_expired_head(self, current_time: float) -> int:
+        """统计尚未清理的过期消息数量（调用方需持有锁），使用累计计数，不扫描队列"""
+        return self._queue.count_expired(current_time - self.ttl)
 
+    async def _purge_expired(self) -> int:
+        """分批清理队头的过期消息，批次之间释放锁"""
+        total = 0
+        while True:
+            async with self._lock:
+                count = self._pop_expired_head(time.time(), EXPIRE_BATCH_SIZE)
+            total += count
+            if count < EXPIRE_BATCH_SIZE:
+                return total
+            await asyncio.sleep(0)
+
+    def _next_cleanup_delay(self) -> float:
+        """距离队头消息过期的时间，队列为空时使用清理间隔"""
+        oldest = self._queue.oldest_timestamp()
+        if oldest is None:
+            return self.cleanup_interval
+        head_expires_in = oldest + self.ttl - time.time()
+        return min(self.cleanup_interval, max(0.0, head_expires_in))
+
+    async def _cleanup_expired_messages(self):
+        """在队头消息到期时增量清理过期消息"""
+        while not self._closed:
+            try:
+                # 等到队头消息过期（最长等待一个清理间隔）
+                await asyncio.sleep(self._next_cleanup_delay())
+
+                cleaned_count = await self._purge_expired()
                 if cleaned_count > 0:
                     self.logger.debug(f"清理了 {cleaned_count} 条过期消息，当前队列大小: {len(self._queue)}")
 
-                # 等待下次清理
-                await asyncio.sleep(self.cleanup_interval)
-
             except asyncio.CancelledError:
                 self.logger.debug("消息清理任务被取消")
                 break
@@ -91,7 +624,107 @@ class MessageQueue:
         except Exception:
             pass
         
-    async def put(self, context: Context) -> str:
+    def _backlog(self) -> int:
+        """内存和磁盘中待处理的消息总数"""
+        return len(self._queue) + (self._spill.pending if self._spill else 0)
+
+    def _update_watermark(self):
+        """根据积压量更新背压状态（调用方需持有锁）"""
+        backlog = self._backlog()
+        if not self._backpressure and backlog >= self.high_watermark:
+            self._backpressure = True
+            self._below_low_watermark.clear()
+            self.logger.warning(f"消息队列 {self.name} 积压达到高水位: {backlog}/{self.max_size}")
+            record_metric("message_queue_backpressure", 1, "count", {"queue": self.name})
+        elif self._backpressure and backlog <= self.low_watermark:
+            self._backpressure = False
+            self._below_low_watermark.set()
+            self.logger.info(f"消息队列 {self.name} 积压回落到低水位: {backlog}/{self.max_size}")
+
+    def _record_overflow(self, kind: str, message_id: str):
+        """记录溢出丢弃/拒绝的消息"""
+        if kind == "dropped":
+            self._dropped_count += 1
+        else:
+            self._rejected_count += 1
+        self.logger.warning(f"消息队列 {self.name} 已满（策略: {self.overflow_policy}），{kind}: {message_id}")
+        record_metric("message_queue_overflow", 1, "count",
+                      {"queue": self.name, "policy": self.overflow_policy, "action": kind})
+
+    def _spill_message(self, message_wrapper: MessageEnvelope):
+        """把消息写入磁盘溢出文件（调用方需持有锁）"""
+        self._spill.append(_to_record(message_wrapper))
+        self._spilled_count += 1
+
+    def _refill_from_spill(self):
+        """队列回落到低水位以下时，按顺序从磁盘读回溢出的消息（调用方需持有锁）"""
+        if not self._spill or not self._spill.pending or len(self._queue) > self.low_watermark:
+            return
+        try:
+            records = self._spill.read(max(1, self.high_watermark - len(self._queue)))
+        except (OSError, ValueError) as e:
+            self.logger.error(f"读取溢出消息失败: {e}")
+            return
+        for record in records:
+            self._queue.append(_from_record(record))
+
+    async def _make_room(self, message_wrapper: MessageEnvelope) -> bool:
+        """
+        队列已满时按溢出策略腾出空间（调用方需持有锁）
+
+        Returns:
+            新消息是否应放入内存队列（溢出到磁盘时返回False）
+
+        Raises:
+            QueueFullError: 策略拒绝了新消息
+        """
+        self._pop_expired_head(time.time())
+        if len(self._queue) < self.max_size:
+            return True
+
+        if self.overflow_policy == OVERFLOW_DROP_OLDEST:
+            dropped = self._queue.drop_one()
+            self._discard_durable([dropped])
+            self._record_overflow("dropped", dropped.id)
+            return True
+
+        if self.overflow_policy == OVERFLOW_SPILL:
+            self._spill_message(message_wrapper)
+            return False
+
+        if self.overflow_policy == OVERFLOW_BLOCK:
+            try:
+                await asyncio.wait_for(
+                    self._not_full.wait_for(lambda: len(self._queue) < self.max_size or self._closed),
+                    timeout=self.block_timeout
+                )
+            except asyncio.TimeoutError:
+                pass
+            if self._closed:
+                raise RuntimeError("消息队列已关闭")
+            if len(self._queue) < self.max_size:
+                return True
+
+        self._record_overflow("rejected", message_wrapper.id)
+        raise QueueFullError(f"消息队列 {self.name} 已满")
+
+    async def _put_locked(self, context: Context) -> int:
+        """创建消息信封并按溢出策略入队（调用方需持有锁）"""
+        # 创建消息信封（单调递增ID + Unix时间戳，时间戳便于过期检查）
+        message_wrapper = MessageEnvelope(context)
+        message_id = message_wrapper.id
+
+        if self._spill is not None and self._spill.pending:
+            # 磁盘中还有更早溢出的消息，新消息也写入磁盘以保持先进先出
+            self._spill_message(message_wrapper)
+        elif len(self._queue) < self.max_size or await self._make_room(message_wrapper):
+            self._queue.append(message_wrapper)
+        if self._store is not None:
+            self._store.append(self.name, _to_record(message_wrapper))
+        self.logger.debug(f"消息已入队: {message_id}, 队列长度: {len(self._queue)}")
+        return message_id
+
+    async def put(self, context: Context) -> int:
         """
         将消息放入队列
         
@@ -99,37 +732,95 @@ class MessageQueue:
             context: Context格式的消息对象
             
         Returns:
-            str: 消息ID
+            int: 消息ID
+
+        Raises:
+            QueueFullError: 队列已满且溢出策略拒绝了该消息
         """
         if not isinstance(context, Context):
             raise ValueError("消息必须是Context类型")
-            
+
+        await self.wait_replayed()
         async with self._condition:
             if self._closed:
                 raise RuntimeError("消息队列已关闭")
-                
-            # 为消息添加唯一ID和时间戳（使用时间戳便于过期检查）
-            message_id = str(uuid.uuid4())
-            timestamp = time.time()  # 使用Unix时间戳
-
-            # 创建消息包装器
-            message_wrapper = {
-                'id': message_id,
-                'timestamp': timestamp,  # Unix时间戳
-                'created_at': datetime.now().isoformat(),  # ISO格式用于日志
-                'context': context,
-                'processed': False
-            }
-            
-            self._queue.append(message_wrapper)
-            self.logger.debug(f"消息已入队: {message_id}, 队列长度: {len(self._queue)}")
-            
-            # 通知等待的消费者
-            self._condition.notify_all()
+
+            try:
+                message_id = await self._put_locked(context)
+            finally:
+                self._update_watermark()
+
+            # 只唤醒一个等待的消费者
+            self._condition.notify()
             
             return message_id
-    
-    async def get(self, timeout: Optional[float] = None) -> Optional[Dict[str, Any]]:
+
+    async def put_many(self, contexts: List[Context]) -> List[Optional[int]]:
+        """
+        批量放入消息，整批只获取一次锁
+
+        Args:
+            contexts: Context格式的消息列表
+
+        Returns:
+            与输入顺序对应的消息ID列表，被溢出策略拒绝的消息为None
+        """
+        if not all(isinstance(context, Context) for context in contexts):
+            raise ValueError("消息必须是Context类型")
+        if not contexts:
+            return []
+
+        await self.wait_replayed()
+        message_ids: List[Optional[int]] = []
+        async with self._condition:
+            if self._closed:
+                raise RuntimeError("消息队列已关闭")
+
+            for context in contexts:
+                try:
+                    message_ids.append(await self._put_locked(context))
+                except QueueFullError:
+                    message_ids.append(None)
+            self._update_watermark()
+
+            # 按入队数量唤醒消费者
+            accepted = sum(1 for message_id in message_ids if message_id is not None)
+            if accepted:
+                self._condition.notify(accepted)
+
+        return message_ids
+
+    def _pop_locked(self) -> MessageEnvelope:
+        """取出下一条消息（调用方需持有锁且队列非空）"""
+        message_wrapper = self._queue.popleft()
+        self._refill_from_spill()
+        self.logger.debug(f"消息已出队: {message_wrapper.id}, 队列长度: {len(self._queue)}")
+        return message_wrapper
+
+    async def _wait_not_empty(self, timeout: Optional[float]) -> bool:
+        """等待队列中有未过期的消息（调用方需持有锁）"""
+        self._refill_from_spill()
+        if self._closed and not self._queue:
+            return False
+
+        # 等待消息可用（已有消息或无限等待时不创建超时定时器）
+        if not self._queue:
+            if timeout is None:
+                await self._condition.wait_for(lambda: self._queue or self._closed)
+            else:
+                try:
+                    await asyncio.wait_for(
+                        self._condition.wait_for(lambda: self._queue or self._closed),
+                        timeout=timeout
+                    )
+                except asyncio.TimeoutError:
+                    return False
+
+        # 检查并移除过期消息
+        self._pop_expired_head(time.time())
+        return bool(self._queue)
+
+    async def get(self, timeout: Optional[float] = None) -> Optional[MessageEnvelope]:
         """
         从队列获取消息 - 优化版本自动检查过期
 
@@ -137,55 +828,77 @@ class MessageQueue:
             timeout: 超时时间(秒)，None表示无限等待
 
         Returns:
-            消息包装器字典或None
+            消息信封或None
         """
+        await self.wait_replayed()
         async with self._condition:
-            if self._closed and not self._queue:
+            if not await self._wait_not_empty(timeout):
                 return None
 
-            # 等待消息可用
-            try:
-                await asyncio.wait_for(
-                    self._condition.wait_for(lambda: self._queue or self._closed),
-                    timeout=timeout
-                )
-            except asyncio.TimeoutError:
-                return None
+            message_wrapper = self._pop_locked()
+            self._not_full.notify()
+            self._update_watermark()
 
-            if not self._queue:
-                return None
+            return message_wrapper
 
-            # 检查并移除过期消息
-            current_time = time.time()
-            while self._queue and current_time - self._queue[0]['timestamp'] >= self.ttl:
-                expired_msg = self._queue.popleft()
-                self.logger.debug(f"丢弃过期消息: {expired_msg['id']}")
+    async def get_many(self, max_items: int, max_wait: Optional[float] = None) -> List[MessageEnvelope]:
+        """
+        批量获取消息：最多等待max_wait秒直到有消息，然后取出当前可用的最多max_items条
 
-            if not self._queue:
-                return None
+        Args:
+            max_items: 最多取出的消息数
+            max_wait: 等待第一条消息的超时时间(秒)，None表示无限等待
 
-            message_wrapper = self._queue.popleft()
-            self.logger.debug(f"消息已出队: {message_wrapper['id']}, 队列长度: {len(self._queue)}")
+        Returns:
+            消息信封列表，超时或队列关闭时为空列表
+        """
+        await self.wait_replayed()
+        async with self._condition:
+            if not await self._wait_not_empty(max_wait):
+                return []
 
-            return message_wrapper
+            batch = []
+            while self._queue and len(batch) < max_items:
+                batch.append(self._pop_locked())
+            self._not_full.notify(len(batch))
+            self._update_watermark()
+
+            return batch
+
+    @property
+    def closed(self) -> bool:
+        """队列是否已关闭"""
+        return self._closed
+
+    @property
+    def backpressure(self) -> bool:
+        """积压是否超过高水位且尚未回落到低水位"""
+        return self._backpressure
+
+    async def wait_for_capacity(self, timeout: Optional[float] = None) -> bool:
+        """
+        等待积压回落到低水位
+
+        Args:
+            timeout: 最长等待时间（秒），None表示无限等待
+
+        Returns:
+            是否已回落到低水位
+        """
+        try:
+            await asyncio.wait_for(self._below_low_watermark.wait(), timeout=timeout)
+            return True
+        except asyncio.TimeoutError:
+            return False
 
     async def get_expired_count(self) -> int:
-        """获取过期消息数量"""
-        current_time = time.time()
+        """获取队列中尚未清理的过期消息数量"""
         async with self._lock:
-            return sum(1 for msg in self._queue if current_time - msg['timestamp'] >= self.ttl)
+            return self._count_expired_head(time.time())
 
     async def force_cleanup_expired(self) -> int:
         """强制清理所有过期消息"""
-        current_time = time.time()
-        async with self._lock:
-            original_size = len(self._queue)
-            filtered_queue = deque(
-                (msg for msg in self._queue if current_time - msg['timestamp'] < self.ttl),
-                maxlen=self.max_size
-            )
-            cleaned_count = original_size - len(filtered_queue)
-            self._queue = filtered_queue
+        cleaned_count = await self._purge_expired()
 
         if cleaned_count > 0:
             self.logger.info(f"强制清理了 {cleaned_count} 条过期消息")
@@ -197,12 +910,11 @@ class MessageQueue:
         查看队列头部消息但不移除
         
         Returns:
-            消息包装器字典或None
+            消息字典副本或None
         """
         async with self._lock:
-            if not self._queue:
-                return None
-            return dict(self._queue[0])  # 返回副本
+            head = self._queue.peek()
+            return head.as_dict() if head is not None else None  # 返回副本
     
     async def size(self) -> int:
         """获取队列当前大小"""
@@ -229,6 +941,13 @@ class MessageQueue:
         async with self._lock:
             count = len(self._queue)
             self._queue.clear()
+            if self._spill is not None:
+                count += self._spill.pending
+                self._spill.close()
+            if self._store is not None:
+                self._store.delete_queue(self.name)
+            self._not_full.notify_all()
+            self._update_watermark()
             self.logger.info(f"已清空消息队列，清除了 {count} 条消息")
             return count
     
@@ -237,7 +956,9 @@ class MessageQueue:
         async with self._condition:
             self._closed = True
 
-            # 停止清理任务
+            # 停止重放和清理任务
+            if self._replay_task is not None and not self._replay_task.done():
+                self._replay_task.cancel()
             if self.cleanup_task and not self.cleanup_task.done():
                 self.cleanup_task.cancel()
                 try:
@@ -247,8 +968,11 @@ class MessageQueue:
 
             # 清理资源
             await self.resource_manager.cleanup_all()
+            if self._spill is not None:
+                self._spill.close()
 
             self._condition.notify_all()
+            self._not_full.notify_all()
             self.logger.info("消息队列已关闭，清理任务已停止")
     
     async def get_stats(self) -> Dict[str, Any]:
@@ -258,13 +982,23 @@ class MessageQueue:
         Returns:
             统计信息字典
         """
-        current_time = time.time()
         async with self._lock:
-            expired_count = sum(1 for msg in self._queue if current_time - msg['timestamp'] >= self.ttl)
             return {
                 'size': len(self._queue),
+                'lane_sizes': self._queue.lane_sizes(),
                 'max_size': self.max_size,
-                'expired_count': expired_count,
+                'expired_count': self._count_expired_head(time.time()),
+                'expired_total': self._expired_total,
+                'overflow_policy': self.overflow_policy,
+                'dropped_count': self._dropped_count,
+                'rejected_count': self._rejected_count,
+                'spilled_count': self._spilled_count,
+                'spill_pending': self._spill.pending if self._spill else 0,
+                'backpressure': self._backpressure,
+                'high_watermark': self.high_watermark,
+                'low_watermark': self.low_watermark,
+                'durable': self._store is not None,
+                'replayed_count': self._replayed_count,
                 'ttl': self.ttl,
                 'cleanup_interval': self.cleanup_interval,
                 'is_closed': self._closed,
@@ -299,7 +1033,7 @@ class MessageQueueManager:
             if name in self.queues:
                 raise ValueError(f"队列 '{name}' 已存在")
 
-            queue = MessageQueue(max_size, ttl, cleanup_interval)
+            queue = MessageQueue(max_size, ttl, cleanup_interval, name=name)
             self.queues[name] = queue
             self.logger.info(f"创建消息队列: {name}, 最大容量: {max_size}, TTL: {ttl}秒")
 
@@ -333,7 +1067,7 @@ class MessageQueueManager:
         """
         with self._lock:
             if name not in self.queues:
-                queue = MessageQueue(max_size, ttl, cleanup_interval)
+                queue = MessageQueue(max_size, ttl, cleanup_interval, name=name)
                 self.queues[name] = queue
                 self.logger.debug(f"创建消息队列: {name}, 最大容量: {max_size}, TTL: {ttl}秒")
             return self.queues[name]
@@ -0,0 +1,131 @@
+"""
+消息优先级通道
+按消息类型和客户状态把队列中的用户分到不同优先级通道（以用户最早一条待处理消息为准），
+通道之间按权重公平出队（平滑加权轮询），高优先级优先处理但低优先级不会饿死
+"""
+
+import threading
+from typing import Any, Dict, List, Optional
+
+from bridge.context import Context, ContextType
+from config import config
+
+
+# 触发转人工的关键词（客服转接处理器使用）
+DEFAULT_TRANSFER_KEYWORDS = [
+    '人工客服', '转人工', '人工', '客服', '投诉', '举报',
+    '不满意', '解决不了', '要求赔偿'
+]
+
+# 把文本消息提到transfer_lane的关键词：不含单独的"人工"、"客服"，
+# 否则"客服你好"之类的普通消息也会进入高优先级通道
+PRIORITY_TRANSFER_KEYWORDS = [
+    '人工客服', '转人工', '投诉', '举报',
+    '不满意', '解决不了', '要求赔偿'
+]
+
+# 优先级默认配置，可通过config中的message_priority覆盖，
+# message_priority.shops.<shop_id> 中的配置项只对该店铺生效
+DEFAULT_PRIORITY_CONFIG = {
+    "enabled": True,
+    # 通道权重，权重越大出队机会越多，也越晚被溢出策略丢弃
+    "lane_weights": {"high": 6, "normal": 3, "low": 1},
+    # 消息类型（ContextType的值）对应的通道
+    "type_lanes": {
+        "order_info": "high",
+        "goods_inquiry": "normal",
+        "goods_spec": "normal",
+        "text": "normal",
+        "image": "normal",
+        "video": "normal",
+        "goods_card": "low",
+        "emotion": "low"
+    },
+    "default_lane": "normal",
+    # 包含转人工关键词的文本消息进入的通道
+    "transfer_lane": "high",
+    "transfer_keywords": PRIORITY_TRANSFER_KEYWORDS,
+    "shops": {}
+}
+
+
+class PriorityPolicy:
+    """一个店铺的优先级通道配置
+
+    通道按权重从高到低编号，classify返回通道编号（0为最高优先级）。
+    """
+
+    def __init__(self, settings: Dict[str, Any]):
+        weights = settings.get("lane_weights") or {"normal": 1}
+        if not settings.get("enabled", True):
+            weights = {"normal": 1}
+        ordered = sorted(weights.items(), key=lambda item: item[1], reverse=True)
+        self.lane_names: List[str] = [name for name, _ in ordered]
+        self.lane_weights: List[int] = [max(1, int(weight)) for _, weight in ordered]
+
+        lane_index = {name: index for index, name in enumerate(self.lane_names)}
+        self._default_lane = lane_index.get(settings.get("default_lane"), len(self.lane_names) // 2)
+        self._type_lanes: Dict[ContextType, int] = {}
+        for type_value, lane_name in (settings.get("type_lanes") or {}).items():
+            try:
+                self._type_lanes[ContextType(type_value)] = lane_index.get(lane_name, self._default_lane)
+            except ValueError:
+                continue
+        self._transfer_lane = lane_index.get(settings.get("transfer_lane"))
+        self._transfer_keywords = list(settings.get("transfer_keywords") or [])
+
+    @property
+    def lane_count(self) -> int:
+        return len(self.lane_names)
+
+    def classify(self, context: Context) -> int:
+        """计算消息所属的通道编号"""
+        if (self._transfer_lane is not None and context.type == ContextType.TEXT
+                and isinstance(context.content, str)):
+            message = context.content.lower()
+            if any(keyword in message for keyword in self._transfer_keywords):
+                return self._transfer_lane
+        return self._type_lanes.get(context.type, self._default_lane)
+
+
+_policies: Dict[str, PriorityPolicy] = {}
+_policies_lock = threading.Lock()
+
+
+def get_priority_policy(shop_id: Optional[str] = None) -> PriorityPolicy:
+    """
+    获取店铺的优先级配置（按店铺缓存）
+
+    Args:
+        shop_id: 店铺ID，为None时返回全局配置
+
+    Returns:
+        PriorityPolicy实例
+    """
+    key = str(shop_id) if shop_id is not None else ""
+    with _policies_lock:
+        policy = _policies.get(key)
+        if policy is None:
+            user_config = config.get("message_priority") or {}
+            settings = {**DEFAULT_PRIORITY_CONFIG, **user_config}
+            settings.update((user_config.get("shops") or {}).get(key, {}))
+            policy = PriorityPolicy(settings)
+            _policies[key] = policy
+        return policy
+
+
+def get_queue_priority_policy(queue_name: str) -> PriorityPolicy:
+    """
+    根据队列名称获取优先级配置
+
+    渠道的店铺队列按 "<渠道前缀>_<shop_id>" 命名（如 pdd_12345），
+    其他名称的队列使用全局配置
+    """
+    _, sep, shop_id = (queue_name or "").partition("_")
+    return get_priority_policy(shop_id if sep and shop_id else None)
+
+
+def reset_priority_policies():
+    """配置变更后清空缓存，新建的队列使用新配置"""
+    with _policies_lock:
+        _policies.clear()
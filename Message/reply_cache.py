@@ -0,0 +1,305 @@
+"""
+AI回复缓存
+按店铺缓存常见问题的AI回复：先按规范化后的消息内容精确匹配，
+未命中时可按字符n-gram相似度匹配近似问题，命中时不再调用AI。
+有会话历史的Bot（如Coze）的回复依赖上文，只缓存faq_questions中列出的问题
+"""
+
+import json
+import re
+import threading
+import time
+import unicodedata
+from collections import Counter, OrderedDict
+from typing import Any, Dict, FrozenSet, List, Optional, Set
+
+from bridge.context import Context, ContextType
+from config import config
+from utils.performance_monitor import record_metric
+
+
+# 回复缓存默认配置，可通过config中的reply_cache覆盖
+DEFAULT_REPLY_CACHE_CONFIG = {
+    "enabled": True,
+    # 缓存有效期（秒）
+    "ttl": 3600,
+    # 每个店铺最多缓存的问题数，超过时淘汰最久未使用的
+    "max_entries_per_shop": 500,
+    # 超过该长度的问题不缓存（长消息几乎不会重复）
+    "max_query_chars": 120,
+    # 相似度匹配（字符n-gram的Jaccard相似度），关闭时只做精确匹配
+    "similarity": False,
+    "similarity_threshold": 0.8,
+    "ngram": 2,
+    # 规范化后短于该长度的问题只做精确匹配
+    "similarity_min_chars": 4,
+    # 依赖具体上下文的消息类型（ContextType的值），不读也不写缓存
+    "bypass_types": ["order_info", "image", "video"],
+    # 与上下文无关的常见问题，任何Bot都可以缓存；有会话历史的Bot只缓存这些问题
+    "faq_questions": [],
+    # 包含这些说法的消息依赖上文或具体商品（"这个多少钱"、"还有货吗"），
+    # 除非同一批消息带有商品卡片，否则不使用缓存
+    "context_keywords": ["这个", "那个", "这款", "那款", "这件", "那件", "它", "刚才", "刚刚",
+                         "上面", "之前", "还有", "多少钱", "有货", "便宜"]
+}
+
+# 消息内容中带有商品信息的消息类型，缓存键已包含商品上下文
+_GOODS_TYPES = (ContextType.GOODS_INQUIRY, ContextType.GOODS_SPEC)
+
+# 规范化时去掉的字符：空白和中英文标点
+_STRIP_PATTERN = re.compile(r"[\s\W_]+", re.UNICODE)
+
+
+class _CacheEntry:
+    """一条缓存的回复"""
+
+    __slots__ = ('reply', 'expires_at', 'grams')
+
+    def __init__(self, reply: str, expires_at: float, grams: FrozenSet[str]):
+        self.reply = reply
+        self.expires_at = expires_at
+        self.grams = grams
+
+
+class _ShopCache:
+    """单个店铺的缓存：LRU顺序的条目表和n-gram倒排索引"""
+
+    __slots__ = ('entries', 'index')
+
+    def __init__(self):
+        self.entries: "OrderedDict[str, _CacheEntry]" = OrderedDict()
+        self.index: Dict[str, Set[str]] = {}
+
+    def remove(self, key: str):
+        entry = self.entries.pop(key, None)
+        if entry is None:
+            return
+        for gram in entry.grams:
+            keys = self.index.get(gram)
+            if keys is not None:
+                keys.discard(key)
+                if not keys:
+                    del self.index[gram]
+
+    def add(self, key: str, entry: _CacheEntry):
+        self.remove(key)
+        self.entries[key] = entry
+        for gram in entry.grams:
+            self.index.setdefault(gram, set()).add(key)
+
+
+class ReplyCache:
+    """AI回复缓存
+
+    功能特性：
+    - 键为店铺ID + 规范化后的预处理消息（全半角统一、小写、去空白和标点）
+    - 两级查找：精确匹配；未命中时按n-gram倒排索引找相似度最高的问题（默认关闭）
+    - 只缓存与上下文无关的问题：有会话历史的Bot只使用FAQ白名单，依赖上文的说法不缓存
+    - 条目按TTL过期，每个店铺按LRU淘汰，分级统计命中率并上报性能指标
+    - 线程安全，多个引擎事件循环可共用
+    """
+
+    def __init__(self, settings: Optional[Dict[str, Any]] = None):
+        """
+        初始化回复缓存
+
+        Args:
+            settings: 配置项（见DEFAULT_REPLY_CACHE_CONFIG），为None时使用默认配置
+        """
+        settings = {**DEFAULT_REPLY_CACHE_CONFIG, **(settings or {})}
+        self.enabled = bool(settings["enabled"])
+        self.ttl = float(settings["ttl"])
+        self.max_entries_per_shop = max(1, int(settings["max_entries_per_shop"]))
+        self.max_query_chars = int(settings["max_query_chars"])
+        self.similarity = bool(settings["similarity"])
+        self.similarity_threshold = float(settings["similarity_threshold"])
+        self.ngram = max(1, int(settings["ngram"]))
+        self.similarity_min_chars = int(settings["similarity_min_chars"])
+        self.bypass_types: Set[ContextType] = set()
+        for type_value in settings.get("bypass_types") or []:
+            try:
+                self.bypass_types.add(ContextType(type_value))
+            except ValueError:
+                continue
+        self.faq_questions: Set[str] = {key for key in map(self.normalize, settings.get("faq_questions") or []) if key}
+        self.context_keywords = tuple(key for key in map(self.normalize, settings.get("context_keywords") or []) if key)
+
+        self._lock = threading.Lock()
+        self._shops: Dict[str, _ShopCache] = {}
+        self._stats = {'exact_hits': 0, 'similar_hits': 0, 'misses': 0, 'bypassed': 0,
+                       'stored': 0, 'evicted': 0, 'expired': 0}
+
+    def accepts(self, contexts: List[Context], processed_content: str, stateful: bool = False) -> bool:
+        """
+        消息（合并处理时为整批消息）是否可以读写缓存
+
+        Args:
+            contexts: 原始消息
+            processed_content: 预处理后的消息内容
+            stateful: Bot是否保存会话历史（回复依赖该用户的上文，且命中缓存的轮次不会进入历史）
+
+        Returns:
+            是否使用缓存
+        """
+        if not self.enabled:
+            return False
+        key = self.normalize(processed_content)
+        if not key:
+            return False
+        if key in self.faq_questions:
+            return True
+
+        has_goods = any(context.type in _GOODS_TYPES for context in contexts)
+        if (stateful
+                or any(context.type in self.bypass_types for context in contexts)
+                or (not has_goods and any(keyword in key for keyword in self.context_keywords))):
+            with self._lock:
+                self._stats['bypassed'] += 1
+            return False
+        return True
+
+    def normalize(self, processed_content: str) -> str:
+        """
+        把_preprocess_message格式的内容规范化为缓存键
+
+        Returns:
+            规范化后的文本，内容不适合缓存时返回空字符串
+        """
+        try:
+            parts = json.loads(processed_content)
+            text = " ".join(str(part.get("text", "")) for part in parts if isinstance(part, dict))
+        except (TypeError, ValueError, AttributeError):
+            text = str(processed_content)
+
+        text = _STRIP_PATTERN.sub("", unicodedata.normalize("NFKC", text).lower())
+        if len(text) > self.max_query_chars:
+            return ""
+        return text
+
+    def _grams(self, key: str) -> FrozenSet[str]:
+        if len(key) <= self.ngram:
+            return frozenset((key,))
+        return frozenset(key[i:i + self.ngram] for i in range(len(key) - self.ngram + 1))
+
+    def get(self, shop_id: str, processed_content: str) -> Optional[str]:
+        """
+        查找缓存的回复
+
+        Args:
+            shop_id: 店铺ID
+            processed_content: 预处理后的消息内容
+
+        Returns:
+            缓存的回复文本，未命中时返回None
+        """
+        key = self.normalize(processed_content)
+        if not key:
+            return None
+
+        shop_id = str(shop_id)
+        now = time.time()
+        tier = None
+        reply = None
+        with self._lock:
+            shop = self._shops.get(shop_id)
+            if shop is not None:
+                entry = shop.entries.get(key)
+                if entry is not None and entry.expires_at <= now:
+                    shop.remove(key)
+                    self._stats['expired'] += 1
+                    entry = None
+                if entry is not None:
+                    shop.entries.move_to_end(key)
+                    tier, reply = "exact", entry.reply
+                elif self.similarity and len(key) >= self.similarity_min_chars:
+                    similar_key = self._find_similar(shop, key, now)
+                    if similar_key is not None:
+                        shop.entries.move_to_end(similar_key)
+                        tier, reply = "similar", shop.entries[similar_key].reply
+
+            if tier is None:
+                self._stats['misses'] += 1
+            else:
+                self._stats[f'{tier}_hits'] += 1
+
+        record_metric("reply_cache_hit" if tier else "reply_cache_miss", 1, "count",
+                      {"shop_id": shop_id, "tier": tier or "none"})
+        return reply
+
+    def _find_similar(self, shop: _ShopCache, key: str, now: float) -> Optional[str]:
+        """通过倒排索引找相似度最高且达到阈值的问题（需持有锁）"""
+        grams = self._grams(key)
+        overlaps = Counter()
+        for gram in grams:
+            overlaps.update(shop.index.get(gram, ()))
+
+        best_key, best_score = None, 0.0
+        for candidate, overlap in overlaps.items():
+            entry = shop.entries[candidate]
+            score = overlap / (len(grams) + len(entry.grams) - overlap)
+            if score > best_score and entry.expires_at > now:
+                best_key, best_score = candidate, score
+
+        return best_key if best_score >= self.similarity_threshold else None
+
+    def put(self, shop_id: str, processed_content: str, reply: str):
+        """
+        缓存AI回复
+
+        Args:
+            shop_id: 店铺ID
+            processed_content: 预处理后的消息内容
+            reply: 回复文本
+        """
+        key = self.normalize(processed_content)
+        if not key or not reply:
+            return
+
+        shop_id = str(shop_id)
+        now = time.time()
+        with self._lock:
+            shop = self._shops.setdefault(shop_id, _ShopCache())
+            shop.add(key, _CacheEntry(reply, now + self.ttl, self._grams(key)))
+            self._stats['stored'] += 1
+
+            while len(shop.entries) > self.max_entries_per_shop:
+                oldest_key = next(iter(shop.entries))
+                if shop.entries[oldest_key].expires_at <= now:
+                    self._stats['expired'] += 1
+                else:
+                    self._stats['evicted'] += 1
+                shop.remove(oldest_key)
+
+    def invalidate(self, shop_id: Optional[str] = None):
+        """清空店铺（为None时为全部店铺）的缓存，例如商品或话术变更后"""
+        with self._lock:
+            if shop_id is None:
+                self._shops.clear()
+            else:
+                self._shops.pop(str(shop_id), None)
+
+    def get_stats(self) -> Dict[str, Any]:
+        """获取缓存统计信息"""
+        with self._lock:
+            hits = self._stats['exact_hits'] + self._stats['similar_hits']
+            lookups = hits + self._stats['misses']
+            return {
+                **self._stats,
+                'enabled': self.enabled,
+                'shops': len(self._shops),
+                'entries': sum(len(shop.entries) for shop in self._shops.values()),
+                'hit_rate': hits / lookups if lookups else 0.0
+            }
+
+
+_reply_cache: Optional[ReplyCache] = None
+_reply_cache_lock = threading.Lock()
+
+
+def get_reply_cache() -> ReplyCache:
+    """获取进程内共享的回复缓存（首次使用时按配置创建）"""
+    global _reply_cache
+    with _reply_cache_lock:
+        if _reply_cache is None:
+            _reply_cache = ReplyCache(config.get("reply_cache"))
+        return _reply_cache
@@ -1,5 +1,6 @@
 import sys
 import ctypes
+import multiprocessing
 from PyQt6.QtCore import Qt
 from PyQt6.QtWidgets import QApplication
 
@@ -38,4 +39,6 @@ def main():
     sys.exit(app.exec())
 
 if __name__ == '__main__':
+    # 多进程模式（engine_mode=process）下打包为可执行文件时需要
+    multiprocessing.freeze_support()
     main()
@@ -0,0 +1,136 @@
+"""
+消息队列内存基准测试
+
+对比原来的字典包装器（uuid字符串ID + ISO时间字符串 + 解析后的raw_data字典）
+与MessageEnvelope在不同raw_data保存方式下，积压N条消息时每条消息占用的内存。
+
+用法（在项目根目录运行）：
+    python benchmarks/queue_memory_benchmark.py --count 10000
+"""
+
+import argparse
+import asyncio
+import gc
+import json
+import os
+import sys
+import time
+import tracemalloc
+import uuid
+from collections import deque
+from datetime import datetime
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from bridge.context import ChannelType, Context, ContextType, RawFrame  # noqa: E402
+from Message.message_queue import MessageEnvelope, MessageQueue  # noqa: E402
+
+
+def sample_frame(index: int) -> str:
+    """构造一条接近真实的拼多多文本消息帧"""
+    return json.dumps({
+        "response": "push",
+        "message": {
+            "msg_id": f"{1700000000000 + index}",
+            "type": 0,
+            "content": f"你好，请问这个商品什么时候发货？订单号 {index:08d}",
+            "nickname": f"买家{index % 997}",
+            "time": 1700000000 + index,
+            "from": {"role": "user", "uid": f"{8000000000 + index % 5000}"},
+            "to": {"role": "mall_cs", "uid": "123456789"},
+            "info": {
+                "goods_id": f"{400000000 + index % 300}",
+                "goods_name": "夏季新款纯棉短袖T恤男宽松半袖上衣",
+                "goods_thumb_url": "https://img.pddpic.com/mms-material-img/2024-06-01/abcdef0123456789.jpeg",
+                "extra": {"source": "goods_detail", "biz": "chat", "tags": ["new", "promo", "hot"]}
+            },
+            "mall_context": {"client_version": "5.8.0", "platform": "android", "session": uuid.uuid4().hex}
+        }
+    }, ensure_ascii=False)
+
+
+def build_context(frame: str, raw_data_mode: str) -> Context:
+    """按PDDChannel._convert_to_context的方式构造Context"""
+    data = json.loads(frame)
+    message = data["message"]
+    kwargs = {
+        'msg_id': message["msg_id"],
+        'from_user': message["nickname"],
+        'from_uid': message["from"]["uid"],
+        'to_user': None,
+        'to_uid': message["to"]["uid"],
+        'nickname': message["nickname"],
+        'timestamp': message["time"],
+        'user_msg_type': ContextType.TEXT,
+        'shop_id': "123456",
+        'user_id': "cs_001",
+        'username': "客服1"
+    }
+    if raw_data_mode == "keep":
+        kwargs['raw_data'] = data
+    elif raw_data_mode == "lazy":
+        kwargs['raw_data'] = RawFrame(frame)
+    return Context(ContextType.TEXT, message["content"], kwargs, ChannelType.PINDUODUO)
+
+
+def legacy_wrapper(context: Context) -> dict:
+    """原来MessageQueue.put创建的字典包装器"""
+    return {
+        'id': str(uuid.uuid4()),
+        'timestamp': time.time(),
+        'created_at': datetime.now().isoformat(),
+        'context': context,
+        'processed': False
+    }
+
+
+def measure(frames, make_item) -> float:
+    """积压全部消息后每条消息占用的字节数"""
+    gc.collect()
+    tracemalloc.start()
+    backlog = deque(make_item(frame) for frame in frames)
+    current, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del backlog
+    return current / len(frames)
+
+
+async def measure_queue(frames) -> float:
+    """MessageQueue.put_many积压全部消息时队列自身（信封和通道）每条消息占用的字节数"""
+    contexts = [build_context(frame, "drop") for frame in frames]
+    queue = MessageQueue(max_size=len(frames) + 1, ttl=3600, name="benchmark", overflow_policy="drop_oldest")
+    gc.collect()
+    tracemalloc.start()
+    await queue.put_many(contexts)
+    current, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    await queue.close()
+    return current / len(frames)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="消息队列内存基准测试")
+    parser.add_argument("--count", type=int, default=10000, help="积压的消息数量")
+    args = parser.parse_args()
+
+    frames = [sample_frame(i) for i in range(args.count)]
+
+    results = [
+        ("dict包装器 + raw_data字典（原实现）", measure(frames, lambda f: legacy_wrapper(build_context(f, "keep")))),
+        ("MessageEnvelope + raw_data字典", measure(frames, lambda f: MessageEnvelope(build_context(f, "keep")))),
+        ("MessageEnvelope + RawFrame（lazy）", measure(frames, lambda f: MessageEnvelope(build_context(f, "lazy")))),
+        ("MessageEnvelope + 不保存raw_data（drop）", measure(frames, lambda f: MessageEnvelope(build_context(f, "drop")))),
+    ]
+    baseline = results[0][1]
+
+    print(f"积压消息数: {args.count}")
+    print(f"{'方案':<40}{'字节/条':>12}{'相对原实现':>12}")
+    for name, per_message in results:
+        print(f"{name:<40}{per_message:>12.0f}{per_message / baseline:>12.1%}")
+
+    print()
+    print(f"MessageQueue入队开销（不含Context本身）: {asyncio.run(measure_queue(frames)):.0f} 字节/条")
+
+
+if __name__ == "__main__":
+    main()
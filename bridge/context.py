@@ -1,6 +1,7 @@
 """
 上下文类型枚举
 """
+import json
 from enum import Enum
 
 class ChannelType(Enum):
@@ -41,4 +42,64 @@ class Context:
 
     def __str__(self):
         return "Context(type={}, content={}, kwargs={}, channel_type={})".format(self.type, self.content, self.kwargs, self.channel_type)
-    
\ No newline at end of file
+    
+    def to_dict(self) -> dict:
+        """转换为可JSON序列化的字典（用于消息落盘），kwargs中的枚举值会被标记以便还原"""
+        return {
+            "type": self.type.value if self.type is not None else None,
+            "content": self.content,
+            "kwargs": {key: _encode_value(value) for key, value in self.kwargs.items()},
+            "channel_type": self.channel_type.value if self.channel_type is not None else None
+        }
+
+    @classmethod
+    def from_dict(cls, data: dict) -> "Context":
+        """从to_dict的结果还原Context"""
+        return cls(
+            type=ContextType(data["type"]) if data.get("type") is not None else None,
+            content=data.get("content"),
+            kwargs={key: _decode_value(value) for key, value in (data.get("kwargs") or {}).items()},
+            channel_type=ChannelType(data["channel_type"]) if data.get("channel_type") is not None else None
+        )
+
+
+class RawFrame:
+    """延迟解析的原始消息
+
+    只保存收到的原始JSON文本（比解析后的嵌套字典占用少得多），访问data时才解析。
+    用于在排队的Context中保留raw_data而不长期持有整个字典。
+    """
+
+    __slots__ = ('text',)
+
+    def __init__(self, text: str):
+        self.text = text
+
+    @property
+    def data(self) -> dict:
+        return json.loads(self.text)
+
+    def __repr__(self) -> str:
+        return f"RawFrame({len(self.text)} chars)"
+
+
+_ENUM_TYPES = {"ContextType": ContextType, "ChannelType": ChannelType}
+
+
+def _encode_value(value):
+    """把kwargs中的ContextType/ChannelType/RawFrame编码为带类型标记的字典"""
+    if isinstance(value, (ContextType, ChannelType)):
+        return {"__enum__": type(value).__name__, "value": value.value}
+    if isinstance(value, RawFrame):
+        return {"__raw_frame__": value.text}
+    return value
+
+
+def _decode_value(value):
+    """还原_encode_value编码的值"""
+    if isinstance(value, dict):
+        if set(value) == {"__enum__", "value"} and value["__enum__"] in _ENUM_TYPES:
+            return _ENUM_TYPES[value["__enum__"]](value["value"])
+        if set(value) == {"__raw_frame__"}:
+            return RawFrame(value["__raw_frame__"])
+    return value
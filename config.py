@@ -15,6 +15,18 @@ config_base={
     "coze_api_base": "https://api.coze.cn",
     "coze_token": "",
     "coze_bot_id": "",
+    # Coze用户会话（时间单位：秒）：会话超过max_age或达到max_turns轮后轮换为新会话，
+    # 超过idle_ttl未使用的记录由后台每prune_interval秒清理一次，记录总数不超过max_sessions，
+    # 对话轮数由后台每flush_interval秒批量写入
+    "coze_session": {
+        "cache_size": 10000,
+        "max_age": 86400,
+        "max_turns": 30,
+        "idle_ttl": 604800,
+        "max_sessions": 100000,
+        "prune_interval": 3600,
+        "flush_interval": 5
+    },
     
     # OpenAI配置
     "openai_api_key": "",
@@ -37,6 +49,128 @@ config_base={
     "businessHours": {
         "start": "08:00",
         "end": "23:00"
+    },
+
+    # 渠道引擎运行方式: thread（当前进程内的共享事件循环）, process（多进程，按店铺一致性哈希分配）
+    "engine_mode": "thread",
+    # 多进程模式下的工作进程数量
+    "engine_workers": 2,
+    # 渠道引擎事件循环数量（账号按店铺分片到各循环；多进程模式下为每个进程的数量）
+    "engine_loops": 1,
+
+    # 所有账号共享的AI调用线程数
+    "ai_executor_workers": 16,
+
+    # AI回复方式：原生异步的Bot使用流式接口，生成出第一句话后先发送给客户
+    "ai_reply": {
+        "streaming": True,
+        "flush_first_sentence": True,
+        "first_sentence_min_chars": 8
+    },
+
+    # AI回复缓存：按店铺缓存常见问题的回复，精确匹配或n-gram相似度匹配（similarity）命中时不调用AI
+    # bypass_types中的消息类型（依赖具体订单/图片等上下文）和包含context_keywords的消息不使用缓存；
+    # 有会话历史的Bot（coze）只缓存faq_questions中列出的问题
+    "reply_cache": {
+        "enabled": True,
+        "ttl": 3600,
+        "max_entries_per_shop": 500,
+        "max_query_chars": 120,
+        "similarity": False,
+        "similarity_threshold": 0.8,
+        "ngram": 2,
+        "similarity_min_chars": 4,
+        "bypass_types": ["order_info", "image", "video"],
+        "faq_questions": [],
+        "context_keywords": ["这个", "那个", "这款", "那款", "这件", "那件", "它", "刚才", "刚刚",
+                             "上面", "之前", "还有", "多少钱", "有货", "便宜"]
+    },
+
+    # AI调用并发控制：全局上限按延迟和错误做AIMD调整，店铺之间公平排队（时间单位：秒）
+    # shops中可按店铺ID单独设置shop_limit
+    "ai_concurrency": {
+        "enabled": True,
+        "global_limit": 16,
+        "min_global_limit": 2,
+        "shop_limit": 4,
+        "target_latency": 8.0,
+        "increase_step": 1.0,
+        "decrease_factor": 0.7,
+        "decrease_interval": 5.0,
+        "shops": {}
+    },
+
+    # 账号凭据主动刷新配置（时间单位：秒）
+    "credential_refresh": {
+        "enabled": True,
+        "cookie_refresh_interval": 21600,
+        "token_refresh_interval": 1800,
+        "jitter_ratio": 0.2,
+        "quiet_period": 120,
+        "max_defer": 1800,
+        "check_interval": 30,
+        "max_concurrent_refreshes": 1
+    },
+
+    # WebSocket断线重连配置（时间单位：秒）
+    "ws_reconnect": {
+        "initial_delay": 1.0,
+        "max_delay": 60.0,
+        "multiplier": 2.0,
+        "jitter_ratio": 0.3,
+        "initial_max_attempts": 3,
+        "open_timeout": 15.0
+    },
+
+    # 消息队列溢出与背压配置
+    # overflow_policy: block（阻塞等待，超时拒绝）/ reject_newest / drop_oldest / spill（溢出到磁盘）
+    "message_queue": {
+        "overflow_policy": "drop_oldest",
+        "block_timeout": 5.0,
+        "high_watermark": 0.8,
+        "low_watermark": 0.5,
+        "spill_dir": "./database/queue_spill",
+        "backpressure_max_wait": 5.0,
+        # 排队消息中raw_data的保存方式：keep（解析后的字典）/ lazy（原始文本，访问时解析）/ drop（不保存）
+        "raw_data": "lazy",
+        # 持久化队列：消息写入WAL模式SQLite，处理成功后删除，重启后重放未过期的消息
+        "durable": False,
+        "durable_path": "./database/message_queue.db",
+        "durable_flush_interval": 0.2,
+        "durable_batch_size": 200
+    },
+
+    # 消息优先级通道配置，shops中可按店铺ID覆盖任意配置项
+    "message_priority": {
+        "enabled": True,
+        "lane_weights": {"high": 6, "normal": 3, "low": 1},
+        "type_lanes": {
+            "order_info": "high",
+            "goods_inquiry": "normal",
+            "goods_spec": "normal",
+            "text": "normal",
+            "image": "normal",
+            "video": "normal",
+            "goods_card": "low",
+            "emotion": "low"
+        },
+        "default_lane": "normal",
+        "transfer_lane": "high",
+        "shops": {}
+    },
+
+    # 同一用户连续消息合并：静默窗口内的后续消息与首条消息合并为一次AI请求，只回复一次（时间单位：秒）
+    "message_coalesce": {
+        "enabled": True,
+        "window": 1.5,
+        "max_wait": 4.0,
+        "max_messages": 5
+    },
+
+    # 消费者的用户处理器表：超过上限时淘汰最久未使用的空闲处理器，空闲超过processor_idle_ttl秒的处理器被淘汰
+    "message_consumer": {
+        "max_user_processors": 2000,
+        "processor_idle_ttl": 300.0
     }
 }
 
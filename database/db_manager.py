@@ -5,7 +5,7 @@ from sqlalchemy import create_engine
 from sqlalchemy.orm import sessionmaker, scoped_session
 from sqlalchemy.pool import QueuePool
 from sqlalchemy.exc import SQLAlchemyError
-from typing import List, Dict, Any, Optional, Union
+from typing import List, Dict, Any, Optional, Union, Callable
 from utils.logger import get_logger
 from utils.resource_manager import ThreadResourceManager
 from database.models import Base, Channel, Shop, Account, Keyword
@@ -49,6 +49,9 @@ class DatabaseManager:
         # 使用scoped_session确保线程安全
         self.Session = scoped_session(sessionmaker(bind=self.engine))
 
+        # 账号变更监听器（如发送器缓存），在账号cookies/信息更新后回调
+        self._account_listeners: List[Callable[[str, str, str], None]] = []
+
         # 创建表结构
         Base.metadata.create_all(self.engine)
 
@@ -89,6 +92,28 @@ class DatabaseManager:
         """获取数据库会话 - 线程安全版本"""
         return self.Session()
 
+    def add_account_listener(self, listener: Callable[[str, str, str], None]):
+        """注册账号变更监听器
+
+        Args:
+            listener: 回调函数，参数为 (channel_name, shop_id, user_id)
+        """
+        if listener not in self._account_listeners:
+            self._account_listeners.append(listener)
+
+    def remove_account_listener(self, listener: Callable[[str, str, str], None]):
+        """移除账号变更监听器"""
+        if listener in self._account_listeners:
+            self._account_listeners.remove(listener)
+
+    def _notify_account_changed(self, channel_name: str, shop_id: str, user_id: str):
+        """通知监听器账号已变更，单个监听器异常不影响其他监听器"""
+        for listener in list(self._account_listeners):
+            try:
+                listener(channel_name, shop_id, user_id)
+            except Exception as e:
+                self.logger.error(f"账号变更监听器执行失败: {e}")
+
     def get_connection_pool_stats(self) -> Dict[str, Any]:
         """获取连接池统计信息"""
         if hasattr(self.engine.pool, 'status'):
@@ -583,6 +608,7 @@ class DatabaseManager:
 
             session.commit()
             self.logger.info(f"成功更新账号信息: {username} (用户ID: {user_id})")
+            self._notify_account_changed(channel_name, shop_id, user_id)
             return True
         except SQLAlchemyError as e:
             session.rollback()
@@ -715,6 +741,7 @@ class DatabaseManager:
                 
             account.cookies = cookies
             session.commit()
+            self._notify_account_changed(channel_name, shop_id, user_id)
             return True
         except SQLAlchemyError as e:
             session.rollback()
@@ -758,6 +785,7 @@ class DatabaseManager:
                 
             session.delete(account)
             session.commit()
+            self._notify_account_changed(channel_name, shop_id, user_id)
             return True
         except SQLAlchemyError as e:
             session.rollback()
@@ -1,7 +1,6 @@
 #自动回复界面
 
-import asyncio
-from PyQt6.QtCore import Qt, pyqtSignal, QThread, pyqtSignal as Signal, QTimer
+from PyQt6.QtCore import Qt, pyqtSignal, QThread, QObject, pyqtSignal as Signal, QTimer
 from PyQt6.QtWidgets import (QFrame, QHBoxLayout, QVBoxLayout, QWidget, QSizePolicy, QLabel,
                             QInputDialog, QMessageBox, QComboBox, QDialog, QFormLayout)
 from PyQt6.QtGui import QFont, QIcon, QPixmap, QPainter, QPainterPath
@@ -11,6 +10,9 @@ from qfluentwidgets import (CardWidget, SubtitleLabel, CaptionLabel, BodyLabel,
 from database.db_manager import db_manager
 from utils.logger import get_logger
 from Channel.pinduoduo.utils.API.Set_up_online import AccountMonitor
+from Channel.engine import get_channel_engine, shutdown_channel_engine
+from Channel.pinduoduo.credential_scheduler import credential_scheduler
+from Channel.pinduoduo.browser_pool import browser_pool
 import threading
 from typing import Dict, Optional
 import requests
@@ -60,10 +62,14 @@ class LogoLoaderThread(QThread):
 
 
 class AutoReplyManager:
-    """自动回复管理器 - 管理所有账号的自动回复连接"""
+    """自动回复管理器 - 管理所有账号的自动回复连接
+
+    账号连接运行在共享的渠道引擎（Channel.engine，或多进程模式下的Channel.supervisor）中，
+    每个账号只对应一个AutoReplySession信号对象，不再为每个账号创建线程和事件循环。
+    """
     
     def __init__(self):
-        self.running_accounts: Dict[str, 'AutoReplyThread'] = {}  # 正在运行的账号线程
+        self.running_accounts: Dict[str, 'AutoReplySession'] = {}  # 正在运行的账号会话
         self.logger = get_logger()
     
     def start_auto_reply(self, account_data: dict) -> bool:
@@ -76,17 +82,20 @@ class AutoReplyManager:
                 self.logger.warning(f"账号 {account_data['username']} 自动回复已在运行")
                 return False
             
-            # 创建并启动自动回复线程
-            thread = AutoReplyThread(account_data)
-            self.running_accounts[account_key] = thread
+            # 创建账号会话
+            session = AutoReplySession(account_key, account_data)
+            self.running_accounts[account_key] = session
             
             # 连接信号
-            thread.connection_success.connect(lambda: self._on_connection_success(account_key))
-            thread.connection_failed.connect(lambda error: self._on_connection_failed(account_key, error))
-            thread.finished.connect(lambda: self._on_thread_finished(account_key))
+            session.connection_success.connect(lambda: self._on_connection_success(account_key))
+            session.connection_failed.connect(lambda error: self._on_connection_failed(account_key, error))
+            session.finished.connect(lambda: self._on_thread_finished(account_key))
             
-            # 启动线程
-            thread.start()
+            # 提交到渠道引擎
+            if not session.start():
+                if account_key in self.running_accounts:
+                    del self.running_accounts[account_key]
+                return False
             return True
             
         except Exception as e:
@@ -102,13 +111,9 @@ class AutoReplyManager:
                 self.logger.warning(f"账号 {account_data['username']} 自动回复未在运行")
                 return False
             
-            # 停止线程
-            thread = self.running_accounts[account_key]
-            thread.stop()
-            
-            # 等待线程结束后再从列表中移除
-            if thread.isRunning():
-                thread.wait(5000)  # 最多等待5秒
+            # 停止会话，最多等待5秒
+            session = self.running_accounts[account_key]
+            session.stop()
             
             # 从运行列表中移除
             if account_key in self.running_accounts:
@@ -131,14 +136,14 @@ class AutoReplyManager:
     def _on_connection_failed(self, account_key: str, error: str):
         """连接失败回调"""
         self.logger.error(f"账号 {account_key} 自动回复连接失败: {error}")
-        # 清理失败的线程
+        # 清理失败的会话
         if account_key in self.running_accounts:
             del self.running_accounts[account_key]
     
     def _on_thread_finished(self, account_key: str):
-        """线程结束回调"""
-        self.logger.debug(f"账号 {account_key} 自动回复线程已结束")
-        # 清理线程引用
+        """账号连接结束回调"""
+        self.logger.debug(f"账号 {account_key} 自动回复连接已结束")
+        # 清理会话引用
         if account_key in self.running_accounts:
             del self.running_accounts[account_key]
     
@@ -146,90 +151,77 @@ class AutoReplyManager:
         """获取正在运行的账号数量"""
         return len(self.running_accounts)
     
+    def get_engine_stats(self) -> dict:
+        """获取渠道引擎（或多进程监督器及各工作进程）的统计信息"""
+        return get_channel_engine().get_stats()
+    
     def stop_all(self):
         """停止所有自动回复"""
         try:
-            # 停止所有正在运行的线程
-            for account_key, thread in self.running_accounts.items():
-                if thread.is_running():
-                    thread.stop()
-            
-            # 等待所有线程结束
-            for thread in self.running_accounts.values():
-                thread.wait(5000) # 等待5秒
+            # 各引擎分片并行停止，每个最多等待5秒
+            get_channel_engine().stop_all(timeout=5.0)
             
             self.running_accounts.clear()
             self.logger.info("所有自动回复任务已停止")
             
         except Exception as e:
             self.logger.error(f"停止所有自动回复失败: {e}")
+    
+    def shutdown(self):
+        """程序退出时停止所有自动回复，关闭渠道引擎（包括多进程模式的工作进程）、凭据刷新调度器和浏览器池"""
+        try:
+            shutdown_channel_engine(timeout=5.0)
+            self.running_accounts.clear()
+        except Exception as e:
+            self.logger.error(f"关闭渠道引擎失败: {e}")
+
+        # 先停止凭据刷新（可能正在使用浏览器池），再关闭浏览器池中的上下文
+        try:
+            credential_scheduler.stop()
+        except Exception as e:
+            self.logger.error(f"停止凭据刷新调度器失败: {e}")
+        try:
+            browser_pool.shutdown()
+        except Exception as e:
+            self.logger.error(f"关闭浏览器池失败: {e}")
 
 
-class AutoReplyThread(QThread):
-    """自动回复线程 - 每个账号独立的WebSocket连接线程"""
+class AutoReplySession(QObject):
+    """自动回复会话 - 账号在渠道引擎中的连接及其Qt信号
+
+    引擎回调在引擎线程中触发，通过信号转交给UI线程处理。
+    """
     
     connection_success = pyqtSignal()  # 连接成功信号
     connection_failed = pyqtSignal(str)  # 连接失败信号
+    finished = pyqtSignal()  # 连接结束信号
     
-    def __init__(self, account_data: dict):
+    def __init__(self, account_key: str, account_data: dict):
         super().__init__()
+        self.account_key = account_key
         self.account_data = account_data
-        self.channel = None
-        self.logger = get_logger("AutoReplyThread")
-        
-    def run(self):
-        """启动后端 PDDChannel 引擎"""
-        from Channel.pinduoduo.pdd_chnnel import PDDChannel
+        self.logger = get_logger("AutoReplySession")
         
-        try:
-            # 为当前线程创建并设置新的事件循环
-            self.loop = asyncio.new_event_loop()
-            asyncio.set_event_loop(self.loop)
-            
-            # 创建 PDDChannel 实例
-            self.channel = PDDChannel()
-            
-            # 定义成功和失败的回调函数
-            def on_success():
-                self.connection_success.emit()
-
-            def on_failure(error_msg):
-                self.connection_failed.emit(error_msg)
-
-            # 启动引擎，并传递回调
-            task = self.loop.create_task(
-                self.channel.start_account(
-                    shop_id=self.account_data['shop_id'],
-                    user_id=self.account_data['user_id'],
-                    on_success=on_success,
-                    on_failure=on_failure
-                )
-            )
-            
-            # 运行事件循环直到任务完成
-            self.loop.run_until_complete(task)
-
-        except Exception as e:
-            self.logger.error(f"自动回复线程启动失败: {e}")
-            self.connection_failed.emit(str(e))
-        finally:
-            if self.loop.is_running():
-                self.loop.stop()
-            self.loop.close()
+    def start(self) -> bool:
+        """提交到渠道引擎启动"""
+        return get_channel_engine().start_account(
+            self.account_key,
+            self.account_data,
+            on_success=self.connection_success.emit,
+            on_failure=self.connection_failed.emit,
+            on_finished=self.finished.emit
+        )
 
     def stop(self):
-        """停止后端引擎"""
+        """停止账号连接"""
         try:
-            if self.channel:
-                self.channel.request_stop()
-
+            get_channel_engine().stop_account(self.account_key, timeout=5.0)
         except Exception as e:
-            self.logger.error(f"停止自动回复线程失败: {e}")
+            self.logger.error(f"停止自动回复会话失败: {e}")
         
     def is_running(self) -> bool:
-        """检查线程是否在运行"""
-        # 实际的运行状态由 PDDChannel 内部管理，这里仅表示线程是否已启动
-        return self.isRunning()
+        """检查账号连接是否在引擎中运行"""
+        return get_channel_engine().is_running(self.account_key)
 
 
 # 全局自动回复管理器实例
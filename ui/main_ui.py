@@ -111,7 +111,7 @@ class MainWindow(FluentWindow):
     def closeEvent(self, event):
         """ 重写窗口关闭事件，确保后台线程安全退出 """
        
-        # 停止所有自动回复线程
-        auto_reply_manager.stop_all()
+        # 停止所有自动回复并关闭渠道引擎
+        auto_reply_manager.shutdown()
         
         super().closeEvent(event) 
\ No newline at end of file